@@ -6,10 +6,11 @@ from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
-import psycopg2
 from dotenv import load_dotenv
 from fastapi import Request
 
+from backend.db import get_pool
+
 # Load environment variables
 load_dotenv()
 
@@ -21,11 +22,6 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Database Connection
-DATABASE_URL = os.getenv("DATABASE_URL")
-conn = psycopg2.connect(DATABASE_URL)
-cursor = conn.cursor()
-
 # Pydantic Models
 class Token(BaseModel):
     access_token: str
@@ -77,10 +73,9 @@ def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
 # Authentication Route: Login
-def login_user(form_data: OAuth2PasswordRequestForm) -> dict:
+async def login_user(form_data: OAuth2PasswordRequestForm) -> dict:
     """Authenticate user and return JWT token."""
-    cursor.execute("SELECT email, password, is_verified FROM users WHERE email = %s", (form_data.username,))
-    db_user = cursor.fetchone()
+    db_user = await get_pool().fetchrow("SELECT email, password, is_verified FROM users WHERE email = $1", form_data.username)
 
     if not db_user:
         raise HTTPException(status_code=401, detail="Invalid credentials")  # Email not found
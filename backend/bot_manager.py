@@ -1,17 +1,96 @@
-from exchanges import binance, bybit, KuCoin, oanda, meta
+# Importing the venue modules registers their adapters
+from exchanges import binance, bybit, KuCoin, bitget, oanda, meta
+from exchanges.instruments import check_order_size, format_quantity
+from exchanges.registry import client_order_id, get_adapter
+from exchanges import streams
 from backend.types import TradeSignal, Bot
+from backend.trade_counter import record_trade
+from backend.trade_history import TradeRecord, record_trade_history
+from backend import quota
+from dataclasses import asdict, replace
+import asyncio
+import logging
+import os
+import time
 import traceback
 
+# Most orders in flight at once per exchange, across all bots
+EXCHANGE_CONCURRENCY = int(os.getenv("EXCHANGE_CONCURRENCY", 10))
+
+# "single_order" flips a conflicting position with one order on venues that
+# support it; "close_then_open" always closes first, then opens
+POSITION_REVERSAL = os.getenv("POSITION_REVERSAL", "close_then_open").lower()
+
+# Attempts per order when the outcome of a request is unknown or transient
+ORDER_RETRIES = int(os.getenv("ORDER_RETRIES", 3))
+
+# Seconds before the first retry; doubled on each further attempt
+ORDER_RETRY_DELAY = float(os.getenv("ORDER_RETRY_DELAY", 0.5))
+
 # Log streams for each bot
 bot_logs = {}
 
+# exchange name -> semaphore bounding its concurrent orders
+exchange_slots = {}
+
+def get_exchange_slot(exchange: str) -> asyncio.Semaphore:
+    """Return the semaphore that limits concurrent orders on an exchange."""
+    if exchange not in exchange_slots:
+        exchange_slots[exchange] = asyncio.Semaphore(EXCHANGE_CONCURRENCY)
+    return exchange_slots[exchange]
+
 def log_message(bot_name: str, message: str):
     """Log a message for a specific bot."""
     if bot_name not in bot_logs:
         bot_logs[bot_name] = []
     bot_logs[bot_name].append(message)
 
-async def close_position(bot, signal):
+async def submit_order(bot, adapter, signal, send, record=None):
+    """
+    Send an order with send(signal), retrying transient failures.
+
+    A request whose outcome is unknown (timeout, 5xx) may have reached the
+    venue, so before each resend the order is looked up by its client order
+    ID. It is only sent again once the venue confirms it does not exist.
+
+    The order and the final answer are added to record, if given.
+    """
+    if record is not None:
+        record.order_sent(asdict(signal))
+    result = await _submit_order(bot, adapter, signal, send)
+    if record is not None:
+        record.order_answered(result)
+    return result
+
+async def _submit_order(bot, adapter, signal, send):
+    result = None
+    for attempt in range(ORDER_RETRIES):
+        if attempt:
+            await asyncio.sleep(ORDER_RETRY_DELAY * 2 ** (attempt - 1))
+
+            if result.get("sent"):
+                order = await adapter.find_order(signal) if signal.client_order_id else None
+                if order and order.get("status") == "error":
+                    log_message(bot.name, f"🔎 Order {signal.client_order_id} was canceled or rejected by {adapter.display_name} without a fill; not resending.")
+                    return order
+                if order:
+                    log_message(bot.name, f"🔎 Order {signal.client_order_id} found on {adapter.display_name} after a failed attempt; not resending.")
+                    return order
+                if order is None:
+                    log_message(bot.name, f"⚠️ Could not confirm whether order {signal.client_order_id} reached {adapter.display_name}; not resending.")
+                    return result
+
+            log_message(bot.name, f"🔁 Retrying order on {adapter.display_name} (attempt {attempt + 1}/{ORDER_RETRIES})...")
+
+        result = await send(signal)
+        if result.get("status") != "error" or not result.get("transient"):
+            return result
+
+        log_message(bot.name, f"⚠️ Order attempt failed: {result.get('message')}")
+
+    return result
+
+async def close_position(bot, signal, record=None):
     """
     Close the open position for a bot (sell or buy).
     """
@@ -19,61 +98,26 @@ async def close_position(bot, signal):
         # Log the position closure attempt
         log_message(bot.name, f"🔒 Closing position for {bot.symbol} with quantity {bot.quantity}...")
 
-        if bot.position == 'buy':
-            # Close buy order by executing a sell
-            sell_signal = TradeSignal(action="sell", symbol=signal.symbol, quantity=signal.quantity)
-            
-            # Use the exchange map to place the closing order
-            exchange = bot.exchange.lower()
-            exchange_map = {
-                "binance": binance.place_order,
-                "bybit": bybit.place_order,
-                "kucoin": KuCoin.place_order,
-                "oanda": oanda.place_order_oanda,
-                "metatrader5": meta.place_order_metatrader5
-            }
-            
-            if exchange in exchange_map:
-                if exchange == "oanda":
-                    order_result = await exchange_map[exchange](bot.api_key, bot.account_id, sell_signal)
-                elif exchange == "metatrader5":
-                    order_result = await exchange_map[exchange](bot.login, bot.password, bot.server, sell_signal)
-                else:
-                    order_result = await exchange_map[exchange](bot.api_key, bot.api_secret, sell_signal)
-                
-                log_message(bot.name, f"❌ Closed BUY position for {bot.symbol} ({bot.quantity})")
-                bot.position = "neutral"  # Reset position
-            else:
-                log_message(bot.name, f"❌ Unsupported exchange for closing position: {exchange}")
-                return f"Failed to close position: Unsupported exchange {exchange}"
-                
-        elif bot.position == 'sell':
-            # Close sell order by executing a buy
-            buy_signal = TradeSignal(action="buy", symbol=signal.symbol, quantity=signal.quantity)
-            
-            # Use the exchange map to place the closing order
-            exchange = bot.exchange.lower()
-            exchange_map = {
-                "binance": binance.place_order,
-                "bybit": bybit.place_order,
-                "kucoin": KuCoin.place_order,
-                "oanda": oanda.place_order_oanda,
-                "metatrader5": meta.place_order_metatrader5
-            }
-            
-            if exchange in exchange_map:
-                if exchange == "oanda":
-                    order_result = await exchange_map[exchange](bot.api_key, bot.account_id, buy_signal)
-                elif exchange == "metatrader5":
-                    order_result = await exchange_map[exchange](bot.login, bot.password, bot.server, buy_signal)
-                else:
-                    order_result = await exchange_map[exchange](bot.api_key, bot.api_secret, buy_signal)
-                
-                log_message(bot.name, f"❌ Closed SELL position for {bot.symbol} ({bot.quantity})")
-                bot.position = "neutral"  # Reset position
-            else:
+        if bot.position in ['buy', 'sell']:
+            # Close a buy position by executing a sell, and vice versa
+            closing_action = "sell" if bot.position == 'buy' else "buy"
+            closing_id = client_order_id(signal.client_order_id, "close") if signal.client_order_id else None
+            closing_signal = TradeSignal(action=closing_action, symbol=signal.symbol, quantity=signal.quantity,
+                                         client_order_id=closing_id)
+
+            adapter = get_adapter(bot)
+            if adapter is None:
+                exchange = bot.exchange.lower()
                 log_message(bot.name, f"❌ Unsupported exchange for closing position: {exchange}")
                 return f"Failed to close position: Unsupported exchange {exchange}"
+
+            streams.track_order(adapter, closing_id, bot, "neutral", log_message)
+            order_result = await submit_order(bot, adapter, closing_signal, adapter.place_order, record)
+            if order_result.get("status") == "error":
+                raise Exception(order_result.get("message"))
+
+            log_message(bot.name, f"❌ Closed {bot.position.upper()} position for {bot.symbol} ({bot.quantity})")
+            bot.position = "neutral"  # Reset position
         else:
             log_message(bot.name, "⚠️ No position to close.")
 
@@ -85,11 +129,12 @@ async def close_position(bot, signal):
         raise Exception(f"Failed to close position: {str(e)}")
 
 
-async def execute_trade(bot, signal):
+async def execute_trade(bot, signal, record=None):
     """
     Place an order for the bot depending on the trade signal.
     It first checks if the bot has an open position.
-    If the position is conflicting, it closes the open position and then places the new trade.
+    If the position is conflicting, it closes the open position and then places the new trade,
+    or flips it with a single order when POSITION_REVERSAL allows it and the venue supports it.
     
     Execute the trade itself without updating trade count.
     """
@@ -99,64 +144,82 @@ async def execute_trade(bot, signal):
     # Log the exchange type for debugging
     log_message(bot.name, f"🔍 Attempting trade with exchange: '{exchange}'")
     
+    adapter = get_adapter(bot)
+    reverse = False
+
+    if adapter is not None:
+        # Fills on a streamed account confirm or undo the position below;
+        # streams start with their bots, this only restarts a stopped one
+        streams.start_stream(adapter)
+
+        # Round to the venue's step size and reject sizes it would refuse
+        quantity, problem = await check_order_size(adapter, signal.quantity)
+        if problem:
+            log_message(bot.name, f"❌ Order size rejected before sending: {problem}")
+            return {"status": "error", "message": problem}
+        if float(quantity) != signal.quantity:
+            log_message(bot.name, f"📏 Quantity rounded from {signal.quantity} to {format_quantity(quantity)} for {adapter.display_name}")
+        # Sent as the exact step-aligned Decimal
+        signal = replace(signal, quantity=quantity)
+
     # First, check if the bot has an open position
     if bot.position in ['buy', 'sell']:
         # If the action in the signal is different from the current position, close the existing position
-        if (signal.action == 'buy' and bot.position == 'sell') or (signal.action == 'sell' and bot.position == 'buy'):
-            log_message(bot.name, f"🔁 Signal conflict detected: Closing '{bot.position}' position to switch to '{signal.action}'.")
+        conflict = (signal.action == 'buy' and bot.position == 'sell') or (signal.action == 'sell' and bot.position == 'buy')
+        if conflict:
+            if POSITION_REVERSAL == "single_order" and adapter is not None and adapter.supports_reversal:
+                # The reversal order is twice the size; it must pass the
+                # venue's size rules too, or the position is closed first
+                _, problem = await check_order_size(adapter, signal.quantity * 2)
+                if problem:
+                    log_message(bot.name, f"📏 Single-order reversal not possible ({problem}); closing first instead.")
+                else:
+                    reverse = True
+            if reverse:
+                # One order flips the position, no separate close
+                log_message(bot.name, f"🔁 Signal conflict detected: Reversing '{bot.position}' position to '{signal.action}' in a single order.")
+            else:
+                log_message(bot.name, f"🔁 Signal conflict detected: Closing '{bot.position}' position to switch to '{signal.action}'.")
+        elif signal.action == bot.position:
+            # Already in the same position
+            log_message(bot.name, f"ℹ️ Bot already has an open {signal.action.upper()} position. Ignoring duplicate signal.")
+            return {"status": "info", "message": f"Already in {signal.action} position for {bot.symbol}"}
+
+        if conflict and not reverse:
             try:
                 # Close current position
-                close_result = await close_position(bot, signal)
+                close_result = await close_position(bot, signal, record)
                 log_message(bot.name, f"✔️ {close_result}")
             except Exception as e:
                 log_message(bot.name, f"❌ Failed to close position: {str(e)}")
                 return {"status": "error", "message": f"Failed to close position: {str(e)}"}
-        elif signal.action == bot.position:
-            # Already in the same position
-            log_message(bot.name, f"ℹ️ Bot already has an open {signal.action.upper()} position. Ignoring duplicate signal.")
-            return {"status": "info", "message": f"Already in {signal.action} position for {bot.symbol}"}
 
     # After closing the conflicting position or if no position exists, place the new trade
-    exchange_map = {
-        "binance": binance.place_order,
-        "bybit": bybit.place_order,
-        "kucoin": KuCoin.place_order,
-        "oanda": oanda.place_order_oanda,
-        "metatrader5": meta.place_order_metatrader5
-    }
-
-    if exchange not in exchange_map:
+    if adapter is None:
         log_message(bot.name, f"❌ Unsupported exchange: {exchange}")
         return {"status": "error", "message": f"Unsupported exchange: {exchange}"}
 
     try:
-        # Use the appropriate exchange handler based on the exchange type
-        if exchange == "oanda":
-            # Verify that account_id and api_key are available
-            if not bot.account_id or not bot.api_key:
-                log_message(bot.name, f"❌ Missing credentials for OANDA: account_id or api_key")
-                return {"status": "error", "message": "Missing OANDA credentials"}
-                
-            log_message(bot.name, f"🔄 Placing {signal.action} order on OANDA for {signal.symbol}")
-            order_result = await oanda.place_order_oanda(bot.api_key, bot.account_id, signal)
-            
-        elif exchange == "metatrader5":
-            # Verify that MT5 credentials are available
-            if not bot.login or not bot.password or not bot.server:
-                log_message(bot.name, f"❌ Missing credentials for MetaTrader5: login, password, or server")
-                return {"status": "error", "message": "Missing MetaTrader5 credentials"}
-                
-            log_message(bot.name, f"🔄 Placing {signal.action} order on MetaTrader5 for {signal.symbol}")
-            order_result = await meta.place_order_metatrader5(bot.login, bot.password, bot.server, signal)
-            
+        # Verify that the venue's credentials are available
+        missing = adapter.missing_credentials()
+        if missing:
+            log_message(bot.name, f"❌ Missing credentials for {adapter.display_name}: {', '.join(missing)}")
+            return {"status": "error", "message": f"Missing {adapter.display_name} credentials"}
+
+        streams.track_order(adapter, signal.client_order_id, bot, signal.action, log_message)
+        if reverse:
+            log_message(bot.name, f"🔄 Placing {signal.action} reversal order on {adapter.display_name} for {adapter.symbol}")
+            order_result = await submit_order(bot, adapter, signal, adapter.reverse_position, record)
         else:
-            # Standard exchange handling (Binance, Bybit, KuCoin)
-            if not bot.api_key or not bot.api_secret:
-                log_message(bot.name, f"❌ Missing credentials for {exchange}: api_key or api_secret")
-                return {"status": "error", "message": f"Missing {exchange} credentials"}
-                
-            log_message(bot.name, f"🔄 Placing {signal.action} order on {exchange} for {signal.symbol}")
-            order_result = await exchange_map[exchange](bot.api_key, bot.api_secret, signal)
+            log_message(bot.name, f"🔄 Placing {signal.action} order on {adapter.display_name} for {adapter.symbol}")
+            order_result = await submit_order(bot, adapter, signal, adapter.place_order, record)
+
+        if order_result.get("status") == "error":
+            log_message(bot.name, f"❌ Order rejected by {adapter.display_name}: {order_result.get('message')}")
+            return {"status": "error", "message": f"Order failed: {order_result.get('message')}"}
+        if streams.order_state(signal.client_order_id) == streams.REJECTED:
+            log_message(bot.name, f"❌ {adapter.display_name} accepted the order but did not fill it.")
+            return {"status": "error", "message": "Order was not filled"}
 
         # Update the bot's position
         bot.position = signal.action
@@ -167,88 +230,51 @@ async def execute_trade(bot, signal):
         log_message(bot.name, f"❌ Failed to place order: {str(e)}")
         return {"status": "error", "message": f"Failed to place order: {str(e)}"}
 
-# Updated place_trade that manages both trade execution and count updates
-async def place_trade(bot, signal):
-    print("==== PLACE_TRADE FUNCTION STARTED ====")
+# Manages both trade execution and count updates
+async def place_trade(bot, signal, record=None):
+    """
+    Execute a trade and count it towards the user's plan if it succeeded.
+
+    The count and the trade's history record (created here unless the
+    caller passes one) are buffered and written in the background (see
+    backend.trade_counter and backend.trade_history), so the result
+    doesn't wait on Postgres.
+    """
     exchange = bot.exchange.lower()
-    print(f"Exchange: {exchange}")
-    
+    if record is None:
+        record = TradeRecord(bot_name=bot.name, exchange=exchange, symbol=signal.symbol,
+                             action=signal.action, quantity=signal.quantity)
+    record.user_email = bot.user_email
+    record.client_order_id = signal.client_order_id
+    record.position_before = bot.position
+
+    # Checked in memory, before the exchange is touched
+    problem = quota.reserve_trade(bot.user_email)
+    if problem:
+        log_message(bot.name, f"🚫 {problem}. Upgrade your plan to keep trading.")
+        record.status, record.message = "blocked", problem
+        record_trade_history(record)
+        return {"status": "error", "message": problem}
+
     try:
-        # Execute the trade first
-        print("About to execute trade...")
-        result = await execute_trade(bot, signal)
-        print(f"Trade execution result: {result}")
-        
-        # Only update trade count if trade was successful
+        async with get_exchange_slot(exchange):
+            record.started_at = time.time()
+            result = await execute_trade(bot, signal, record)
+
+        # Only count the trade if it was successful
         if result["status"] == "success":
-            print("==== TRADE SUCCESSFUL, UPDATING COUNT ====")
-            
-            try:
-                import os
-                import psycopg2
-                
-                # Print environment variables
-                print(f"Env vars: {dict(os.environ)}")
-                
-                DATABASE_URL = os.getenv("DATABASE_URL")
-                print(f"DATABASE_URL found: {'Yes' if DATABASE_URL else 'No'}")
-                
-                if not DATABASE_URL:
-                    print("DATABASE_URL not found!")
-                    return {**result, "warning": "Database URL not found"}
-                
-                print("Connecting to database...")
-                conn = psycopg2.connect(DATABASE_URL)
-                print("Database connection successful!")
-                
-                cur = conn.cursor()
-                
-                print(f"Looking for bot: {bot.name}")
-                cur.execute("SELECT user_email FROM bots WHERE name = %s", (bot.name,))
-                bot_user = cur.fetchone()
-                print(f"Bot user query result: {bot_user}")
-                
-                if not bot_user:
-                    print("Bot user not found!")
-                    return {**result, "warning": "Bot user not found"}
-                
-                user_email = bot_user[0]
-                print(f"Found user email: {user_email}")
-                
-                cur.execute("SELECT trade_count FROM users WHERE email = %s", (user_email,))
-                user_data = cur.fetchone()
-                print(f"User data query result: {user_data}")
-                
-                current_count = user_data[0] if user_data and user_data[0] is not None else 0
-                print(f"Current trade count: {current_count}")
-                
-                new_count = current_count + 1
-                print(f"New trade count: {new_count}")
-                
-                print("Updating trade count...")
-                cur.execute("UPDATE users SET trade_count = %s WHERE email = %s", (new_count, user_email))
-                print(f"Update affected {cur.rowcount} rows")
-                
-                conn.commit()
-                print("Update committed!")
-                
-                return result
-                
-            except Exception as e:
-                print(f"ERROR updating trade count: {str(e)}")
-                import traceback
-                print(f"STACK TRACE: {traceback.format_exc()}")
-                return {**result, "warning": f"Trade count update error: {str(e)}"}
-            finally:
-                if 'conn' in locals() and conn:
-                    conn.close()
-                    print("Database connection closed")
+            record_trade(bot.name)
         else:
-            print("Trade not successful, not updating count")
-            return result
-            
+            quota.release_trade(bot.user_email)
+        record.status, record.message = result["status"], result.get("message")
+        return result
+
     except Exception as e:
-        print(f"CRITICAL ERROR in place_trade: {str(e)}")
-        import traceback
-        print(f"STACK TRACE: {traceback.format_exc()}")
+        quota.release_trade(bot.user_email)
+        log_message(bot.name, f"❌ Critical error in place_trade: {str(e)}")
+        logging.error(traceback.format_exc())
+        record.status, record.message = "error", str(e)
         return {"status": "error", "message": str(e)}
+
+    finally:
+        record_trade_history(record)
@@ -1,6 +1,8 @@
-
-import psycopg2
+import logging
 import os
+from typing import Optional
+
+import asyncpg
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -9,30 +11,44 @@ load_dotenv()
 # Get the database URL from environment variables
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Establish database connection
-try:
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor()
-    print("✅ Database connected successfully!")
-except Exception as e:
-    print(f"❌ Error connecting to the database: {e}")
-
-# Function to create users table if it doesn't exist
-def create_users_table():
-    try:
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL,
-            password VARCHAR(100) NOT NULL
-        );
-        """)
-        conn.commit()
-        print("✅ Users table is ready!")
-    except Exception as e:
-        print(f"❌ Error creating table: {e}")
-        conn.rollback()
-
-# Call the function to ensure the table exists
-create_users_table()
+# Connections kept open by the pool, and the most it may open
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+
+# Longest a single statement may run (seconds)
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 30))
+
+# Idle pooled connections are closed after this long (seconds)
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))
+
+# Shared by every module; opened on application startup
+pool: Optional[asyncpg.Pool] = None
+
+
+async def open_pool() -> asyncpg.Pool:
+    """Create the connection pool, if it isn't open yet."""
+    global pool
+    if pool is None:
+        pool = await asyncpg.create_pool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_inactive_connection_lifetime=DB_POOL_MAX_IDLE)
+        logging.info("✅ Database pool opened")
+    return pool
+
+
+def get_pool() -> asyncpg.Pool:
+    """Return the shared pool; acquire connections from it per use."""
+    if pool is None:
+        raise RuntimeError("Database pool is not open")
+    return pool
+
+
+async def close_pool():
+    """Close every pooled connection; called on application shutdown."""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
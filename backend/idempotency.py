@@ -0,0 +1,51 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# How long a dispatched alert is remembered (seconds)
+SIGNAL_DEDUP_TTL = float(os.getenv("SIGNAL_DEDUP_TTL", 7 * 24 * 3600))
+
+# Most (bot, alert) pairs kept in memory; older ones are still in the database
+SIGNAL_DEDUP_MAX_ENTRIES = int(os.getenv("SIGNAL_DEDUP_MAX_ENTRIES", 10000))
+
+
+class IdempotencyCache:
+    """Bounded, TTL-evicting record of the alerts each bot was handed."""
+
+    def __init__(self, max_entries: int = SIGNAL_DEDUP_MAX_ENTRIES,
+                 ttl: float = SIGNAL_DEDUP_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (bot name, signal key) -> expiry, oldest first
+        self.entries = OrderedDict()
+
+    def _evict(self, now: float):
+        while self.entries:
+            key, expires = next(iter(self.entries.items()))
+            if expires > now and len(self.entries) <= self.max_entries:
+                break
+            self.entries.popitem(last=False)
+
+    def seen(self, bot_name: str, key: str) -> bool:
+        now = time.monotonic()
+        self._evict(now)
+        return self.entries.get((bot_name, key), 0) > now
+
+    def add(self, bot_name: str, key: str):
+        self.entries[(bot_name, key)] = time.monotonic() + self.ttl
+        self.entries.move_to_end((bot_name, key))
+        self._evict(time.monotonic())
+
+
+def signal_key(message_id: Optional[str], uidvalidity: Optional[int],
+               uid: int) -> str:
+    """Identify an alert email by Message-ID, or by UID if it has none."""
+    message_id = (message_id or "").strip()
+    if message_id:
+        return f"msgid:{message_id}"
+    return f"uid:{uidvalidity}:{uid}"
+
+
+# Alerts already dispatched, per bot
+signal_cache = IdempotencyCache()
@@ -0,0 +1,423 @@
+import asyncio
+import binascii
+import itertools
+import logging
+import os
+import quopri
+import re
+
+import aioimaplib
+
+# Per-command timeout for IMAP round trips (seconds)
+IMAP_TIMEOUT = float(os.getenv("IMAP_TIMEOUT", 30))
+
+# How long to stay in IDLE before re-issuing it (RFC 2177 asks for < 29 min)
+IMAP_IDLE_TIMEOUT = float(os.getenv("IMAP_IDLE_TIMEOUT", 600))
+
+# Most UIDs named in a single FETCH/STORE command
+IMAP_BATCH_SIZE = int(os.getenv("IMAP_BATCH_SIZE", 200))
+
+# Upper bound on the body bytes fetched per signal email
+IMAP_BODY_MAX_BYTES = int(os.getenv("IMAP_BODY_MAX_BYTES", 16384))
+
+# Headers needed to match an email against the bots of a mailbox
+SIGNAL_HEADERS = "SUBJECT DATE MESSAGE-ID"
+
+FETCH_LINE_RE = re.compile(rb"^\d+ FETCH ")
+
+
+async def open_session(imap_server: str, email_address: str,
+                       email_password: str, mailbox: str = "INBOX"):
+    """Open an async IMAP session, log in and select the mailbox.
+
+    Raises an exception if any step fails; the half-open session is closed
+    before the error is propagated.
+    """
+    session = aioimaplib.IMAP4_SSL(host=imap_server, timeout=IMAP_TIMEOUT)
+    try:
+        await session.wait_hello_from_server()
+
+        response = await session.login(email_address, email_password)
+        if response.result != "OK":
+            raise Exception(f"Login failed: {_response_text(response)}")
+
+        response = await session.select(mailbox)
+        if response.result != "OK":
+            raise Exception(f"Failed to select {mailbox.upper()}.")
+    except BaseException:
+        await close_session(session)
+        raise
+
+    return session
+
+
+async def close_session(session):
+    """Close the selected mailbox and log out, ignoring any errors."""
+    if session is None:
+        return
+
+    try:
+        if session.get_state() == "SELECTED":
+            await session.close()
+        await session.logout()
+    except Exception:
+        pass
+    finally:
+        transport = getattr(session.protocol, "transport", None)
+        if transport is not None:
+            transport.close()
+
+
+async def mailbox_status(session, mailbox: str = "INBOX"):
+    """Return the UIDVALIDITY and UIDNEXT of a mailbox.
+
+    Returns:
+        tuple: (uidvalidity, uidnext) as ints
+    """
+    response = await session.status(mailbox, "(UIDVALIDITY UIDNEXT)")
+    if response.result != "OK":
+        raise Exception(f"STATUS failed: {_response_text(response)}")
+
+    text = b" ".join(bytes(line) for line in response.lines)
+    uidvalidity = re.search(rb"UIDVALIDITY (\d+)", text)
+    uidnext = re.search(rb"UIDNEXT (\d+)", text)
+    if not uidvalidity or not uidnext:
+        raise Exception(f"STATUS response incomplete: {text!r}")
+    return int(uidvalidity.group(1)), int(uidnext.group(1))
+
+
+async def sort_uids(session, criteria: str):
+    """Return message UIDs matching criteria, newest first, using UID SORT.
+
+    Returns:
+        tuple: (status, list of UIDs as ints)
+    """
+    if not session.has_capability("SORT"):
+        raise aioimaplib.Abort("server has not SORT capability")
+
+    protocol = session.protocol
+    command = aioimaplib.Command("SORT",
+                                 protocol.new_tag(),
+                                 "(REVERSE DATE)",
+                                 "UTF-8",
+                                 criteria,
+                                 prefix="UID",
+                                 loop=protocol.loop,
+                                 timeout=session.timeout)
+    response = await protocol.execute(command)
+    return response.result, _parse_numbers(response)
+
+
+async def search_uids(session, criteria: str):
+    """Return message UIDs matching criteria using UID SEARCH (no ordering).
+
+    Returns:
+        tuple: (status, list of UIDs as ints)
+    """
+    response = await session.uid_search(criteria, charset=None)
+    return response.result, _parse_numbers(response)
+
+
+async def fetch_messages(session, uids):
+    """Fetch full messages by UID without setting their \\Seen flag.
+
+    Returns:
+        tuple: (status, {uid: raw message bytes})
+    """
+    messages = {}
+    for uid_set in uid_sets(uids):
+        response = await session.uid("fetch", uid_set, "(BODY.PEEK[])")
+        if response.result != "OK":
+            return response.result, messages
+
+        for text, literals in _fetch_records(response):
+            uid = _fetch_uid(text)
+            if uid is not None and literals:
+                messages[uid] = literals[-1]
+    return "OK", messages
+
+
+async def fetch_headers(session, uids):
+    """Fetch the signal headers and body structure of several messages.
+
+    Returns:
+        tuple: (status, {uid: (raw header bytes, BODYSTRUCTURE or None)})
+        where the structure is None if the server's answer could not be
+        parsed.
+    """
+    messages = {}
+    for uid_set in uid_sets(uids):
+        response = await session.uid(
+            "fetch", uid_set,
+            f"(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({SIGNAL_HEADERS})])")
+        if response.result != "OK":
+            return response.result, messages
+
+        for text, literals in _fetch_records(response):
+            uid = _fetch_uid(text)
+            if uid is None:
+                continue
+
+            structure = None
+            start = text.find(b"BODYSTRUCTURE ")
+            if start != -1:
+                try:
+                    structure, _ = _parse_value(
+                        text, start + len(b"BODYSTRUCTURE "))
+                except ValueError:
+                    logging.debug(f"Unparseable BODYSTRUCTURE for UID {uid}")
+
+            # The header block is the last item requested
+            messages[uid] = (literals[-1] if literals else b"", structure)
+    return "OK", messages
+
+
+async def fetch_bodies(session, structures):
+    """Fetch the signal text of several messages, capped in size.
+
+    Only the first text/plain part is downloaded (or the body of a
+    single-part text/html message), limited to IMAP_BODY_MAX_BYTES, and
+    decoded from its transfer encoding and charset.
+
+    Args:
+        structures (dict): {uid: BODYSTRUCTURE} as returned by fetch_headers
+
+    Returns:
+        tuple: (status, {uid: body text}); messages without a text part
+        are left out.
+    """
+    sections = {}
+    for uid, structure in structures.items():
+        part = _signal_part(structure)
+        if part:
+            sections.setdefault(part[0], {})[uid] = part
+
+    bodies = {}
+    for section, parts in sections.items():
+        for uid_set in uid_sets(parts):
+            response = await session.uid(
+                "fetch", uid_set,
+                f"(BODY.PEEK[{section}]<0.{IMAP_BODY_MAX_BYTES}>)")
+            if response.result != "OK":
+                return response.result, bodies
+
+            for text, literals in _fetch_records(response):
+                uid = _fetch_uid(text)
+                if uid in parts and literals:
+                    bodies[uid] = _decode_part(literals[-1], parts[uid])
+    return "OK", bodies
+
+
+async def store_flags(session, uids, command: str, flags: str):
+    """Add or remove flags on messages by UID, e.g. ('+FLAGS', '\\Seen').
+
+    One STORE is issued per IMAP_BATCH_SIZE UIDs.
+    """
+    for uid_set in uid_sets(uids):
+        response = await session.uid("store", uid_set, command, f"({flags})")
+        if response.result != "OK":
+            return response.result
+    return "OK"
+
+
+def uid_sets(uids):
+    """Yield compact IMAP sequence sets (e.g. "1:50,53") for a list of UIDs.
+
+    Each set covers at most IMAP_BATCH_SIZE UIDs.
+    """
+    uids = sorted(set(uids))
+    for start in range(0, len(uids), IMAP_BATCH_SIZE):
+        chunk = uids[start:start + IMAP_BATCH_SIZE]
+        ranges = []
+        first = last = chunk[0]
+        for uid in chunk[1:]:
+            if uid != last + 1:
+                ranges.append((first, last))
+                first = uid
+            last = uid
+        ranges.append((first, last))
+        yield ",".join(str(first) if first == last else f"{first}:{last}"
+                       for first, last in ranges)
+
+
+def supports_idle(session):
+    """Return True if the server advertised the IDLE capability."""
+    return session.has_capability("IDLE")
+
+
+async def wait_for_new_mail(session, timeout: float = IMAP_IDLE_TIMEOUT):
+    """Enter IDLE and wait until the server pushes new mail.
+
+    Returns:
+        bool: True if an EXISTS notification arrived, False if the IDLE
+        period expired without new mail.
+    """
+    idle = await session.idle_start(timeout=timeout)
+    try:
+        while True:
+            push = await session.wait_server_push(timeout + IMAP_TIMEOUT)
+            if push == aioimaplib.STOP_WAIT_SERVER_PUSH:
+                return False
+            if any(b"EXISTS" in bytes(line) for line in push):
+                return True
+            # RECENT, EXPUNGE, FETCH or "still here" pushes: keep idling
+    finally:
+        session.idle_done()
+        await asyncio.wait_for(idle, IMAP_TIMEOUT)
+
+
+def _parse_numbers(response):
+    """Extract message numbers/UIDs from a SEARCH/SORT response."""
+    if response.result != "OK" or not response.lines:
+        return []
+
+    numbers = []
+    for line in response.lines[:-1]:
+        if isinstance(line, (bytes, bytearray)):
+            numbers.extend(int(part) for part in bytes(line).split()
+                           if part.isdigit())
+    return numbers
+
+
+def _fetch_records(response):
+    """Group the lines of a multi-message FETCH response by message.
+
+    Returns:
+        list: [text, [literals]] per message, where text joins the
+        non-literal lines of the message.
+    """
+    records = []
+    for line in response.lines[:-1]:
+        if isinstance(line, bytearray):
+            if records:
+                records[-1][1].append(bytes(line))
+            continue
+
+        line = bytes(line)
+        if FETCH_LINE_RE.match(line):
+            records.append([line, []])
+        elif records:
+            records[-1][0] += b" " + line
+    return records
+
+
+def _fetch_uid(text):
+    match = re.search(rb"\bUID (\d+)", text)
+    return int(match.group(1)) if match else None
+
+
+def _parse_value(data: bytes, pos: int = 0):
+    """Parse one parenthesized list, quoted string, NIL or atom.
+
+    Returns:
+        tuple: (value, position after the value)
+    """
+    while data[pos:pos + 1] == b" ":
+        pos += 1
+    if pos >= len(data):
+        raise ValueError("Unexpected end of data")
+
+    char = data[pos:pos + 1]
+    if char == b"(":
+        items = []
+        pos += 1
+        while True:
+            while data[pos:pos + 1] == b" ":
+                pos += 1
+            if pos >= len(data):
+                raise ValueError("Unterminated list")
+            if data[pos:pos + 1] == b")":
+                return items, pos + 1
+            item, pos = _parse_value(data, pos)
+            items.append(item)
+
+    if char == b'"':
+        value = bytearray()
+        pos += 1
+        while pos < len(data):
+            char = data[pos:pos + 1]
+            if char == b"\\":
+                value += data[pos + 1:pos + 2]
+                pos += 2
+            elif char == b'"':
+                return value.decode(errors="replace"), pos + 1
+            else:
+                value += char
+                pos += 1
+        raise ValueError("Unterminated string")
+
+    if char == b"{":
+        raise ValueError("Literals are not supported here")
+
+    end = pos
+    while end < len(data) and data[end:end + 1] not in (b" ", b"(", b")"):
+        end += 1
+    atom = data[pos:end].decode(errors="replace")
+    return (None if atom.upper() == "NIL" else atom), end
+
+
+def _text_parts(structure, section=""):
+    """Yield (section, subtype, encoding, charset) of the text/plain parts.
+
+    Mirrors get_email_body: parts are visited depth first and text/html is
+    only considered when the message is not multipart.
+    """
+    if not isinstance(structure, list) or not structure:
+        return
+
+    if isinstance(structure[0], list):
+        # Multipart: the child bodies come before the subtype
+        children = itertools.takewhile(lambda item: isinstance(item, list),
+                                       structure)
+        for index, child in enumerate(children, 1):
+            yield from _text_parts(
+                child, f"{section}.{index}" if section else str(index))
+        return
+
+    if len(structure) < 6 or str(structure[0]).lower() != "text":
+        return
+
+    subtype = str(structure[1]).lower()
+    if subtype != "plain" and (subtype != "html" or section):
+        return
+
+    params = structure[2] if isinstance(structure[2], list) else []
+    params = dict(zip(params[::2], params[1::2]))
+    charset = next((value for key, value in params.items()
+                    if str(key).lower() == "charset"), None)
+    yield (section or "1", subtype, str(structure[5] or "7bit").lower(),
+           charset)
+
+
+def _signal_part(structure):
+    return next(_text_parts(structure), None)
+
+
+def _decode_part(data: bytes, part):
+    """Undo the transfer encoding and charset of a (possibly cut) body."""
+    _, _, encoding, charset = part
+    try:
+        if encoding == "base64":
+            data = re.sub(rb"\s+", b"", data)
+            # A capped fetch may end mid-quantum
+            data = binascii.a2b_base64(data[:len(data) - len(data) % 4])
+        elif encoding == "quoted-printable":
+            data = quopri.decodestring(data)
+    except (binascii.Error, ValueError) as e:
+        logging.error(f"Error decoding email part: {str(e)}")
+
+    try:
+        return data.decode(charset or "utf-8", errors="replace")
+    except LookupError:
+        return data.decode("utf-8", errors="replace")
+
+
+def _response_text(response):
+    """Decode the text lines of a response for log messages."""
+    text = []
+    for line in response.lines:
+        try:
+            text.append(bytes(line).decode(errors="replace"))
+        except Exception:
+            logging.debug("Undecodable IMAP response line")
+    return " ".join(text)
@@ -0,0 +1,90 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import aioimaplib
+
+from backend.reconnect import ConnectionState, get_connection_state
+from backend.routing import RoutingIndex
+from backend.types import Bot
+
+
+@dataclass
+class Mailbox:
+    """A single IMAP account shared by every bot that reads alerts from it."""
+    imap_server: str
+    email_address: str
+    email_password: str
+    session: aioimaplib.IMAP4_SSL = None
+    # Supervised task that watches this mailbox (IDLE or polling)
+    worker_task: Optional[asyncio.Task] = None
+    connect_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    connection: ConnectionState = field(default_factory=ConnectionState)
+    # Incremental sync: UIDs above last_uid have not been evaluated yet.
+    # last_uid is None until the first UNSEEN scan of a new UIDVALIDITY.
+    uidvalidity: Optional[int] = None
+    uidnext: Optional[int] = None
+    last_uid: Optional[int] = None
+    # UIDs above last_uid already handled in this session
+    processed_uids: Set[int] = field(default_factory=set)
+    subscribers: Dict[str, Bot] = field(default_factory=dict)
+    # Subject routing over the subscribers, rebuilt whenever they change
+    routing: RoutingIndex = field(default_factory=RoutingIndex)
+
+    def active_bots(self) -> List[Bot]:
+        """Return the subscribed bots that are not paused."""
+        return [bot for bot in self.subscribers.values() if not bot.paused]
+
+
+# One shared IMAP session per (imap_server, email_address)
+mailboxes: Dict[Tuple[str, str], Mailbox] = {}
+
+
+def mailbox_key(bot: Bot) -> Tuple[str, str]:
+    return (bot.imap_server.strip().lower(), bot.email_address.strip().lower())
+
+
+def find_mailbox(bot: Bot) -> Optional[Mailbox]:
+    """Return the mailbox a bot reads from, if one is registered."""
+    return mailboxes.get(mailbox_key(bot))
+
+
+def get_mailbox(bot: Bot) -> Mailbox:
+    """Return the mailbox for a bot's account, registering it if needed."""
+    key = mailbox_key(bot)
+    if key not in mailboxes:
+        mailboxes[key] = Mailbox(imap_server=bot.imap_server,
+                                 email_address=bot.email_address,
+                                 email_password=bot.email_password,
+                                 connection=get_connection_state(key))
+    return mailboxes[key]
+
+
+def subscribe(bot: Bot) -> Mailbox:
+    """Attach a bot to its mailbox so it receives every new message."""
+    mailbox = get_mailbox(bot)
+    mailbox.subscribers[bot.name] = bot
+    mailbox.routing = RoutingIndex(mailbox.subscribers.values())
+    return mailbox
+
+
+def unsubscribe(bot: Bot) -> Optional[Mailbox]:
+    """Detach a bot from its mailbox.
+
+    Returns:
+        Mailbox: the mailbox if it no longer has any subscribers (it is
+        removed from the registry and the caller should close its session),
+        otherwise None.
+    """
+    key = mailbox_key(bot)
+    mailbox = mailboxes.get(key)
+    if mailbox is None:
+        return None
+
+    mailbox.subscribers.pop(bot.name, None)
+    mailbox.routing = RoutingIndex(mailbox.subscribers.values())
+    if mailbox.subscribers:
+        return None
+
+    del mailboxes[key]
+    return mailbox
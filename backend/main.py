@@ -4,7 +4,6 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
-import psycopg2
 import os
 import secrets
 import random
@@ -24,12 +23,27 @@ from typing import Optional
 from backend import main2
 from backend.main2 import router
 from backend.auth import get_current_user, login_user, create_access_token, get_password_hash, verify_password
+from backend.db import close_pool, get_pool, open_pool
+from backend.migrations import check_schema
+from backend import quota
 
 # Load environment variables
 load_dotenv()
 
 # FastAPI App
 app = FastAPI()
+
+
+# Registered before the router so the pool is open by the time the router's
+# startup tasks load bots from the database. The schema itself is created by
+# 'python -m backend.migrations', run on deploy.
+@app.on_event("startup")
+async def open_database():
+    pool = await open_pool()
+    async with pool.acquire() as conn:
+        await check_schema(conn)
+
+
 app.include_router(router)
 
 # Razorpay Initialization - Replace with your actual keys
@@ -47,115 +61,6 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
-# Database Connection
-DATABASE_URL = os.getenv("DATABASE_URL")
-conn = psycopg2.connect(DATABASE_URL)
-cursor = conn.cursor()
-
-# Ensure required tables exist
-# Add subscription_plan and trade_count columns if they don't exist
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS subscriptions (
-        id SERIAL PRIMARY KEY,
-        name VARCHAR(100) NOT NULL,
-        price INTEGER,
-        bot_limit INTEGER
-    );
-""")
-conn.commit()
-
-# Then, create users table with reference to subscriptions
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        first_name VARCHAR(50) NOT NULL,
-        last_name VARCHAR(50) NOT NULL,
-        email VARCHAR(100) UNIQUE NOT NULL,
-        password VARCHAR(200) NOT NULL,
-        is_verified BOOLEAN DEFAULT FALSE,
-        subscription_id INTEGER REFERENCES subscriptions(id),
-        subscription_plan VARCHAR(20) DEFAULT 'free',
-        trade_count INTEGER DEFAULT 0
-    );
-    """)
-
-# Add columns if they don't exist
-cursor.execute("""
-    DO $$ 
-    BEGIN 
-        IF NOT EXISTS (SELECT FROM information_schema.columns 
-                      WHERE table_name = 'users' AND column_name = 'subscription_plan') THEN
-            ALTER TABLE users ADD COLUMN subscription_plan VARCHAR(20) DEFAULT 'free';
-        END IF;
-
-        IF NOT EXISTS (SELECT FROM information_schema.columns 
-                      WHERE table_name = 'users' AND column_name = 'trade_count') THEN
-            ALTER TABLE users ADD COLUMN trade_count INTEGER DEFAULT 0;
-        END IF;
-    END $$;
-    """)
-conn.commit()
-
-# Create bots table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS bots (
-        id SERIAL PRIMARY KEY,
-        name VARCHAR(100) UNIQUE NOT NULL,
-        exchange VARCHAR(50) NOT NULL,
-        symbol VARCHAR(50) NOT NULL,
-        quantity FLOAT NOT NULL,
-        email_address VARCHAR(100) NOT NULL,
-        email_password VARCHAR(200) NOT NULL,
-        imap_server VARCHAR(100) NOT NULL,
-        email_subject VARCHAR(200) NOT NULL,
-        api_key VARCHAR(200),
-        api_secret VARCHAR(200),
-        account_id VARCHAR(100),
-        user_email VARCHAR(100) NOT NULL,
-        paused BOOLEAN DEFAULT FALSE,      
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-    """)
-conn.commit()
-
-# Create orders table
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS orders (
-        id SERIAL PRIMARY KEY,
-        order_id VARCHAR(100) UNIQUE NOT NULL,
-        user_email VARCHAR(100) NOT NULL,
-        plan VARCHAR(20) NOT NULL,
-        amount INTEGER NOT NULL,
-        status VARCHAR(20) DEFAULT 'created',
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-    );
-""")
-conn.commit()
-
-# Insert initial subscriptions if they don't exist
-cursor.execute("SELECT COUNT(*) FROM subscriptions")
-subscription_count = cursor.fetchone()[0]
-if subscription_count == 0:
-    cursor.execute(
-        "INSERT INTO subscriptions (name, price, bot_limit) VALUES (%s, %s, %s)",
-        ("Free", 0, 1))
-    cursor.execute(
-        "INSERT INTO subscriptions (name, price, bot_limit) VALUES (%s, %s, %s)",
-        ("Pro", 999, 5))
-    cursor.execute(
-        "INSERT INTO subscriptions (name, price, bot_limit) VALUES (%s, %s, %s)",
-        ("Enterprise", 2499, 10))
-    conn.commit()
-
-# Insert initial subscriptions if they don't exist
-cursor.execute("SELECT COUNT(*) FROM subscriptions")
-subscription_count = cursor.fetchone()[0]
-if subscription_count == 0:
-    cursor.execute("INSERT INTO subscriptions (name, price, bot_limit) VALUES (%s, %s, %s)", ("Free", 0, 1))
-    cursor.execute("INSERT INTO subscriptions (name, price, bot_limit) VALUES (%s, %s, %s)", ("Pro", 999, 5))
-    cursor.execute("INSERT INTO subscriptions (name, price, bot_limit) VALUES (%s, %s, %s)", ("Enterprise", 2499, 10))
-    conn.commit()
-
 
 # Utility Functions
 def send_reset_email(email: str, reset_link: str):
@@ -262,8 +167,7 @@ async def get_current_user_from_token(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    cursor.execute("SELECT id, email, subscription_plan FROM users WHERE email = %s", (token_data.email,))
-    user = cursor.fetchone()
+    user = await get_pool().fetchrow("SELECT id, email, subscription_plan FROM users WHERE email = $1", token_data.email)
     if user is None:
         raise credentials_exception
     return {"id": user[0], "email": user[1], "subscription_plan": user[2]}
@@ -321,9 +225,9 @@ app.add_middleware(
 
 # Routes
 @app.post("/signup")
-def signup(user: User):
-    cursor.execute("SELECT id FROM users WHERE email = %s", (user.email, ))
-    existing_user = cursor.fetchone()
+async def signup(user: User):
+    existing_user = await get_pool().fetchrow(
+        "SELECT id FROM users WHERE email = $1", user.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already exists.")
 
@@ -337,18 +241,17 @@ def signup(user: User):
 
 
 @app.post("/verify-email")
-def verify_email(data: VerifyCode):
+async def verify_email(data: VerifyCode):
     if data.email in verification_codes:
         stored_data = verification_codes[data.email]
         if stored_data["code"] == data.code:
             user_data = stored_data["user_data"]
             hashed_password = get_password_hash(user_data['password'])
 
-            cursor.execute(
-                "INSERT INTO users (first_name, last_name, email, password, is_verified, subscription_id) VALUES (%s, %s, %s, %s, %s, %s)",
-                (user_data['first_name'], user_data['last_name'],
-                 user_data['email'], hashed_password, True, user_data['subscription_id']))
-            conn.commit()
+            await get_pool().execute(
+                "INSERT INTO users (first_name, last_name, email, password, is_verified, subscription_id) VALUES ($1, $2, $3, $4, $5, $6)",
+                user_data['first_name'], user_data['last_name'],
+                user_data['email'], hashed_password, True, user_data['subscription_id'])
             del verification_codes[data.email]
             return {"message": "Email verified successfully."}
         else:
@@ -359,15 +262,14 @@ def verify_email(data: VerifyCode):
 
 
 @app.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    return login_user(form_data)
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    return await login_user(form_data)
 
 
 @app.post("/forgot-password")
-def forgot_password(request: Request, data: VerifyCode):
-    cursor.execute("SELECT id, email FROM users WHERE email = %s",
-                   (data.email, ))
-    user = cursor.fetchone()
+async def forgot_password(request: Request, data: VerifyCode):
+    user = await get_pool().fetchrow(
+        "SELECT id, email FROM users WHERE email = $1", data.email)
     if not user:
         raise HTTPException(status_code=404, detail="Email not registered")
 
@@ -379,7 +281,7 @@ def forgot_password(request: Request, data: VerifyCode):
 
 
 @app.post("/reset-password")
-def reset_password(data: VerifyCode):
+async def reset_password(data: VerifyCode):
     try:
         payload = jwt.decode(data.code, SECRET_KEY, algorithms=[ALGORITHM])
         email = payload.get("sub")
@@ -387,9 +289,9 @@ def reset_password(data: VerifyCode):
             raise HTTPException(status_code=400, detail="Invalid reset token")
 
         hashed_password = get_password_hash(data.code)
-        cursor.execute("UPDATE users SET password = %s WHERE email = %s",
-                       (hashed_password, email))
-        conn.commit()
+        await get_pool().execute(
+            "UPDATE users SET password = $1 WHERE email = $2",
+            hashed_password, email)
         return {"message": "Password reset successful."}
 
     except JWTError:
@@ -426,11 +328,10 @@ async def create_order(plan_request: PlanRequest, authorization: str = Header(No
         order = razorpay_client.order.create(data=order_data)
         
         # Store order details in database
-        cursor.execute(
-            "INSERT INTO orders (order_id, user_email, plan, amount, status) VALUES (%s, %s, %s, %s, %s)",
-            (order["id"], user["email"], plan, amount, "created")
+        await get_pool().execute(
+            "INSERT INTO orders (order_id, user_email, plan, amount, status) VALUES ($1, $2, $3, $4, $5)",
+            order["id"], user["email"], plan, amount, "created"
         )
-        conn.commit()
         
         # Return necessary details for frontend
         return {
@@ -466,18 +367,22 @@ async def verify_payment(payment_data: VerifyPaymentRequest, authorization: str
         # Verify signature
         razorpay_client.utility.verify_payment_signature(params_dict)
         
-        # Update order status in database
-        cursor.execute(
-            "UPDATE orders SET status = %s WHERE order_id = %s",
-            ("completed", payment_data.razorpay_order_id)
-        )
-        
-        # Update user subscription plan
-        cursor.execute(
-            "UPDATE users SET subscription_plan = %s WHERE email = %s",
-            (payment_data.plan, user["email"])
-        )
-        conn.commit()
+        async with get_pool().acquire() as conn:
+            async with conn.transaction():
+                # Update order status in database
+                await conn.execute(
+                    "UPDATE orders SET status = $1 WHERE order_id = $2",
+                    "completed", payment_data.razorpay_order_id
+                )
+
+                # Update user subscription plan
+                await conn.execute(
+                    "UPDATE users SET subscription_plan = $1 WHERE email = $2",
+                    payment_data.plan, user["email"]
+                )
+
+        # The cached plan limits change with the plan
+        await quota.change_plan(user["email"], payment_data.plan)
         
         return {"status": "success", "message": "Payment verified successfully"}
         
@@ -498,12 +403,17 @@ async def startup_event():
     logger.info("Starting application...")
     try:
         # Test database connection
-        cursor.execute("SELECT 1")
+        await get_pool().fetchval("SELECT 1")
         logger.info("Database connection successful")
     except Exception as e:
         logger.error(f"Database connection failed: {e}")
     logger.info("Application startup complete")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await close_pool()
+
 # Start the FastAPI application
 if __name__ == "__main__":
     import uvicorn
@@ -1,12 +1,11 @@
-import imaplib
 import email
 import asyncio
+import json
 import re
 import logging
 import os
-import psycopg2
+import asyncpg
 from datetime import datetime
-import psycopg2.extras
 from dotenv import load_dotenv
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException, Depends, Header
 from pydantic import BaseModel
@@ -17,16 +16,20 @@ from jose import JWTError, jwt
 from email.header import decode_header
 import time
 from fastapi.responses import JSONResponse
-import random
 
 # Load environment variables
 load_dotenv()
 
-# Get database URL and secret key from environment variables
-DATABASE_URL = os.getenv("DATABASE_URL")
+# Get secret key from environment variables
 SECRET_KEY = os.getenv("SECRET_KEY", "your_secret_key")
 ALGORITHM = "HS256"
 
+# Most mailboxes allowed to connect or process mail at the same time
+MAILBOX_CONCURRENCY = int(os.getenv("MAILBOX_CONCURRENCY", 20))
+
+# Most trade history rows returned by one request
+TRADE_HISTORY_PAGE_LIMIT = int(os.getenv("TRADE_HISTORY_PAGE_LIMIT", 1000))
+
 # OAuth2 setup
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
@@ -38,8 +41,25 @@ bot_logs = {}
 # Active bots dictionary
 active_bots: Dict[str, 'Bot'] = {}
 
+# Bounds how many mailbox workers talk to IMAP servers at once
+mailbox_slots = asyncio.Semaphore(MAILBOX_CONCURRENCY)
+
 
 from backend.types import Bot, TradeSignal
+from backend.db import get_pool
+from backend.trade_counter import start_trade_counter, stop_trade_counter
+from backend.trade_history import TradeRecord, start_trade_history, stop_trade_history
+from backend import quota
+from backend import imap_engine
+from backend.mailbox import Mailbox, find_mailbox, mailboxes, mailbox_key, subscribe, unsubscribe
+from backend.idempotency import SIGNAL_DEDUP_TTL, signal_cache, signal_key
+from backend.reconnect import OPEN
+from backend.routing import EMAIL_SUBJECT, ORDER_FILL
+from exchanges import streams
+from exchanges.instruments import check_order_size, format_quantity
+from exchanges.registry import base_urls, client_order_id, get_adapter
+from exchanges.session import close_sessions, open_sessions
+from exchanges.signing import sync_clocks
 
 
 class BotConfigRequest(BaseModel):
@@ -68,21 +88,6 @@ class BotConfigRequest(BaseModel):
     email_subject: str | None = None
 
 
-def get_db_connection():
-    """Get a connection to the PostgreSQL database."""
-    try:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
-    except Exception as e:
-        logging.error(f"Database connection error: {str(e)}")
-        raise HTTPException(status_code=500,
-                            detail="Could not connect to database")
-
-
-def normalize_symbol(symbol: str) -> str:
-    return re.sub(r'\W+', '', symbol.upper())
-
-
 def log_message(bot_name: str, message: str):
     """Log a message for a specific bot."""
     if bot_name not in bot_logs:
@@ -94,35 +99,129 @@ def log_message(bot_name: str, message: str):
     logging.info(f"Bot {bot_name}: {message}")
 
 
-def connect_imap(bot: Bot):
-    """Establish a secure IMAP connection for a bot."""
-    try:
-        log_message(
-            bot.name,
-            f"📩 Connecting to IMAP server {bot.imap_server} for bot '{bot.name}'..."
-        )
-        bot.imap_session = imaplib.IMAP4_SSL(bot.imap_server)
-        status, response = bot.imap_session.login(bot.email_address,
-                                                  bot.email_password)
+def log_mailbox(mailbox: Mailbox, message: str):
+    """Log a message for every active bot subscribed to a mailbox."""
+    for bot in mailbox.active_bots():
+        log_message(bot.name, message)
 
-        if status != "OK":
-            raise Exception(f"Login failed: {response}")
 
-        status, mailbox = bot.imap_session.select("inbox")
-        if status != "OK":
-            raise Exception("Failed to select INBOX.")
+async def connect_mailbox(mailbox: Mailbox, force: bool = False):
+    """Establish the shared IMAP session for a mailbox.
 
-        log_message(
-            bot.name,
-            f"✅ IMAP session established successfully for bot '{bot.name}'! Inbox selected."
+    Attempts follow the mailbox's reconnect backoff and are refused while
+    its circuit is open, unless force is set (a user starting a bot).
+    """
+    async with mailbox.connect_lock:
+        # Another bot may have connected it while we were waiting
+        if mailbox.session:
+            return True
+
+        connection = mailbox.connection
+        if not force and not connection.allow_attempt():
+            return False
+
+        if await _open_mailbox_session(mailbox):
+            connection.record_success()
+            return True
+
+        delay = connection.record_failure()
+        if connection.circuit == OPEN:
+            log_mailbox(
+                mailbox,
+                f"🔌 IMAP circuit open after {connection.failures} failed attempts, pausing reconnects for {delay:.0f}s"
+            )
+        return False
+
+
+async def _open_mailbox_session(mailbox: Mailbox, password: str = None):
+    """Log in with the mailbox's password, or with password if given."""
+    session = None
+    try:
+        log_mailbox(
+            mailbox,
+            f"📩 Connecting to IMAP server {mailbox.imap_server} for {mailbox.email_address}..."
+        )
+        session = await imap_engine.open_session(
+            mailbox.imap_server, mailbox.email_address,
+            password or mailbox.email_password, "inbox")
+        uidvalidity, uidnext = await imap_engine.mailbox_status(session)
+        await restore_sync_state(mailbox, uidvalidity, uidnext)
+        mailbox.session = session
+
+        log_mailbox(
+            mailbox,
+            f"✅ IMAP session established successfully for {mailbox.email_address}! Inbox selected."
         )
         return True
     except Exception as e:
-        log_message(bot.name, f"⚠️ IMAP connection failed: {str(e)}")
-        bot.imap_session = None
+        log_mailbox(mailbox, f"⚠️ IMAP connection failed: {str(e)}")
+        # The event loop keeps the transport alive until it is closed
+        await imap_engine.close_session(session)
+        mailbox.session = None
         return False
 
 
+async def connect_imap(bot: Bot):
+    """Subscribe a bot to its mailbox and make sure the shared session is up.
+
+    The mailbox's worker is started if needed and becomes the bot's
+    monitoring task; it keeps reconnecting on its own if this attempt fails.
+    """
+    mailbox = subscribe(bot)
+    try:
+        return await _connect_subscriber(bot, mailbox)
+    finally:
+        start_mailbox_worker(mailbox)
+
+
+async def _connect_subscriber(bot: Bot, mailbox: Mailbox):
+    if bot.email_password == mailbox.email_password:
+        if mailbox.session:
+            log_message(
+                bot.name,
+                f"✅ Sharing the IMAP session for {mailbox.email_address} ({len(mailbox.subscribers)} bot(s) subscribed)"
+            )
+            return True
+        return await connect_mailbox(mailbox, force=True)
+
+    # Another password for the account: it is only adopted once a login
+    # with it succeeds, and a failure is this bot's alone, so it doesn't
+    # count against the shared connection's circuit
+    async with mailbox.connect_lock:
+        if mailbox.session:
+            try:
+                session = await imap_engine.open_session(bot.imap_server,
+                                                         bot.email_address,
+                                                         bot.email_password,
+                                                         "inbox")
+                await imap_engine.close_session(session)
+            except Exception as e:
+                log_message(bot.name, f"⚠️ IMAP connection failed: {str(e)}")
+                return False
+        elif await _open_mailbox_session(mailbox, bot.email_password):
+            mailbox.connection.record_success()
+        else:
+            return False
+
+        mailbox.email_password = bot.email_password
+        return True
+
+
+async def release_imap(bot: Bot):
+    """Unsubscribe a bot from its mailbox, closing the session if unused."""
+    bot.monitoring_task = None
+    mailbox = unsubscribe(bot)
+    if mailbox is None:
+        return
+
+    stop_mailbox_worker(mailbox)
+    if mailbox.session:
+        log_message(bot.name,
+                    f"Closing IMAP session for {mailbox.email_address}")
+        await imap_engine.close_session(mailbox.session)
+        mailbox.session = None
+
+
 def decode_email_subject(subject):
     """Decode email subject line to proper text format.
 
@@ -216,405 +315,642 @@ def get_email_body(msg):
     return body
 
 
-async def check_email_for_signals():
-    """Check unread emails in the inbox for trade signals for each bot, prioritizing newest first."""
+def log_route(bot: Bot, route, subject: str, date_str: str) -> bool:
+    """Log whether an email was routed to a bot.
+
+    Args:
+        route (tuple): (route kind, matched pattern) from the mailbox's
+            RoutingIndex, or None if the subject is not meant for the bot
+
+    Returns:
+        bool: True if the email is meant for the bot
+    """
+    bot_name = bot.name
+
+    if route is None:
+        log_message(
+            bot_name, f"""
+        🚫 Email ignored — Subject mismatch.  
+        📅 Email Date: {date_str}  
+        📨 Subject: {subject}  
+        """)
+        return False
+
+    kind, pattern = route
+    if kind == ORDER_FILL:
+        log_message(
+            bot_name,
+            f"📊 Order fill detected: {subject}"
+        )
+    elif kind == EMAIL_SUBJECT:
+        log_message(
+            bot_name,
+            f"📄 Email subject match found: '{pattern}'"
+        )
+    else:
+        log_message(
+            bot_name,
+            f"📄 Symbol match found in subject: '{pattern}'"
+        )
+    return True
+
+
+async def handle_email_for_bot(bot: Bot, subject: str, date_str: str,
+                               body: str, key: str) -> str:
+    """Trade on an email whose subject matched the bot.
+
+    key identifies the alert; the order's client order ID is derived from
+    it so a retried or redelivered alert maps onto the same order.
+
+    Returns:
+        str: "traded", "failed" or "no_signal"
+    """
     # Import bot_manager at the function level to avoid circular imports
     from backend import bot_manager
 
-    while True:
-        for bot_name, bot in active_bots.items():
-            # Skip paused bots
-            if bot.paused:
-                # Only log this once in a while to avoid spamming logs
-                if random.random() < 0.01:  # ~1% chance to log
-                    log_message(bot_name,
-                                "⏸️ Bot is paused, skipping email check")
-                continue
+    bot_name = bot.name
+    received_at = time.time()
 
-            # Only try to reconnect if bot is not paused
-            if not bot.paused and not bot.imap_session:
-                log_message(bot_name,
-                            "⚠️ IMAP session inactive. Reconnecting...")
-                if not connect_imap(bot):
-                    log_message(
-                        bot_name,
-                        "⚠️ Failed to reconnect to IMAP, will retry later")
-                    await asyncio.sleep(
-                        5)  # Wait a bit before trying other bots
-                continue
+    log_message(
+        bot_name,
+        f"📄 Processing email body for trading signals...")
 
-            try:
-                # Check pause state AGAIN before search
-                if bot.paused:
-                    continue
+    # Process the body for buy/sell signals
+    body_lower = body.lower()
 
-                # Search for unread emails in newest-first order
-                try:
-                    # First try with SORT command which is more reliable for sorting
-                    status, messages = bot.imap_session.sort(
-                        'REVERSE DATE', 'UTF-8', 'UNSEEN')
-                except Exception as e:
-                    log_message(
-                        bot_name,
-                        f"⚠️ SORT command failed, falling back to standard search: {str(e)}"
-                    )
-                    # Fallback to basic search without date sorting (IMAP servers without SORT capability)
-                    status, messages = bot.imap_session.search(
-                        None, "(UNSEEN)")
+    # Define the signal based on keywords in the body
+    action = None
+    if re.search(r'\b(buy|demand)\b', body_lower):
+        action = "buy"
+        log_message(
+            bot_name,
+            "🔍 BUY signal detected in the email body!")
+    elif re.search(r'\b(sell|supply)\b', body_lower):
+        action = "sell"
+        log_message(
+            bot_name,
+            "🔍 SELL signal detected in the email body!")
 
-                if status != "OK":
-                    log_message(bot_name, "⚠️ IMAP search failed.")
+    if not action:
+        log_message(
+            bot_name, f"""
+        🚫 No valid trade signal found in email.  
+        📅 Email Date: {date_str}  
+        📨 Subject: {subject}  
+        📝 Body: {body[:500]}{'...' if len(body) > 500 else ''}
+        """)
+        return "no_signal"
+
+    # Check for position conflict; bot_manager closes or reverses it
+    if bot.position != "neutral" and bot.position != action:
+        log_message(
+            bot_name,
+            f"🔁 Signal conflict detected: Switching '{bot.position}' position to '{action}'."
+        )
+
+    # Create a trade signal
+    signal = TradeSignal(action=action,
+                         symbol=bot.symbol,
+                         quantity=bot.quantity,
+                         client_order_id=client_order_id(bot_name, key, action))
+    record = TradeRecord(bot_name=bot_name, exchange=bot.exchange.lower(),
+                         symbol=bot.symbol, action=action, quantity=bot.quantity,
+                         signal_key=key, subject=subject, signal_at=received_at)
+
+    try:
+        # Execute the trade
+        log_message(
+            bot_name,
+            f"🚀 Executing {action.upper()} order for {bot.symbol}..."
+        )
+        result = await bot_manager.place_trade(
+            bot, signal, record)
+        if result.get("status") == "error":
+            raise Exception(result.get("message"))
+
+        log_message(
+            bot_name, f"""
+            ✅ Trade executed successfully: {action.upper()} {bot.symbol}
+            📅 Email Date: {date_str}  
+            📨 Subject: {subject}  
+            📝 Body: {body[:500]}{'...' if len(body) > 500 else ''}
+            """)
+
+        # Update bot position
+        bot.position = action
+        return "traded"
+
+    except Exception as e:
+        log_message(
+            bot_name, f"""
+            ❌ Trade failed: {str(e)}  
+            📅 Email Date: {date_str}  
+            📨 Subject: {subject}  
+            📝 Body: {body[:500]}{'...' if len(body) > 500 else ''}
+            """)
+        return "failed"
+
+
+async def load_sync_state(mailbox: Mailbox):
+    """Read the persisted (uidvalidity, last_uid) of a mailbox, if any."""
+    imap_server, email_address = mailbox_key(mailbox)
+    return await get_pool().fetchrow(
+        "SELECT uidvalidity, last_uid FROM mailbox_sync_state WHERE imap_server = $1 AND email_address = $2",
+        imap_server, email_address)
+
+
+async def save_sync_state(mailbox: Mailbox, uidvalidity: int, last_uid: int):
+    """Persist the high-water mark of a mailbox."""
+    imap_server, email_address = mailbox_key(mailbox)
+    await get_pool().execute(
+        """
+        INSERT INTO mailbox_sync_state (imap_server, email_address, uidvalidity, last_uid)
+        VALUES ($1, $2, $3, $4)
+        ON CONFLICT (imap_server, email_address) DO UPDATE
+        SET uidvalidity = EXCLUDED.uidvalidity,
+            last_uid = EXCLUDED.last_uid,
+            updated_at = CURRENT_TIMESTAMP
+    """, imap_server, email_address, uidvalidity, last_uid)
+
+
+async def restore_sync_state(mailbox: Mailbox, uidvalidity: int,
+                             uidnext: int):
+    """Resume incremental sync from the persisted high-water mark."""
+    mailbox.uidnext = uidnext
+
+    # Reconnect within this process: the in-memory mark is the latest one
+    if mailbox.uidvalidity == uidvalidity and mailbox.last_uid is not None:
+        return
+
+    try:
+        stored = await load_sync_state(mailbox)
+    except Exception as e:
+        logging.error(f"Error loading mailbox sync state: {str(e)}")
+        stored = None
+
+    mailbox.uidvalidity = uidvalidity
+    mailbox.processed_uids.clear()
+    if stored and stored[0] == uidvalidity:
+        mailbox.last_uid = stored[1]
+        log_mailbox(mailbox,
+                    f"🔖 Resuming mailbox sync after UID {mailbox.last_uid}")
+    else:
+        # First sync (or the server renumbered the mailbox): scan unread mail
+        mailbox.last_uid = None
+        if stored:
+            log_mailbox(
+                mailbox,
+                "⚠️ Mailbox UIDVALIDITY changed, rescanning unread emails")
+
+
+async def advance_sync_state(mailbox: Mailbox, uids, processed):
+    """Move the high-water mark past every UID that has been evaluated."""
+    pending = [uid for uid in uids if uid not in processed]
+
+    if mailbox.last_uid is None:
+        # Rescan unread mail next time if the first scan was interrupted
+        if pending:
+            return
+        new_last_uid = max(uids + [mailbox.uidnext - 1])
+    elif pending:
+        # Stop just below the oldest UID we still owe a look at, and
+        # remember what was already handled above it
+        new_last_uid = min(pending) - 1
+        mailbox.processed_uids.update(processed)
+    else:
+        new_last_uid = max(uids, default=mailbox.last_uid)
+
+    mailbox.processed_uids = {
+        uid
+        for uid in mailbox.processed_uids if uid > new_last_uid
+    }
+    if new_last_uid == mailbox.last_uid:
+        return
+
+    mailbox.last_uid = new_last_uid
+    try:
+        await save_sync_state(mailbox, mailbox.uidvalidity, new_last_uid)
+    except Exception as e:
+        logging.error(f"Error saving mailbox sync state: {str(e)}")
+
+
+async def claim_signal_in_db(bot_name: str, key: str) -> bool:
+    """Record an alert as dispatched to a bot, unless it already was.
+
+    Returns:
+        bool: True if the alert is new (or its record has expired)
+    """
+    claimed = await get_pool().fetchval(
+        """
+        INSERT INTO processed_signals (bot_name, signal_key)
+        VALUES ($1, $2)
+        ON CONFLICT (bot_name, signal_key) DO UPDATE
+        SET processed_at = CURRENT_TIMESTAMP
+        WHERE processed_signals.processed_at < CURRENT_TIMESTAMP - make_interval(secs => $3)
+        RETURNING 1
+    """, bot_name, key, float(SIGNAL_DEDUP_TTL))
+    return claimed is not None
+
+
+async def purge_processed_signals():
+    """Delete dispatched-alert records older than SIGNAL_DEDUP_TTL."""
+    await get_pool().execute(
+        "DELETE FROM processed_signals WHERE processed_at < CURRENT_TIMESTAMP - make_interval(secs => $1)",
+        float(SIGNAL_DEDUP_TTL))
+
+
+async def claim_signal(bot: Bot, key: str) -> bool:
+    """Claim an alert for a bot before dispatching it.
+
+    Returns False if the bot was already handed this alert, in this process
+    or (through the processed_signals table) before a restart.
+    """
+    if signal_cache.seen(bot.name, key):
+        return False
+    signal_cache.add(bot.name, key)
+
+    try:
+        return await claim_signal_in_db(bot.name, key)
+    except Exception as e:
+        # The in-memory cache still guards this process
+        logging.error(f"Error recording processed signal: {str(e)}")
+        return True
+
+
+async def dispatch_signal(bots, key: str, subject: str, date_str: str,
+                          body: str):
+    """Hand one alert to all of its target bots concurrently.
+
+    Orders still respect the per-exchange limits in bot_manager.
+
+    Returns:
+        dict: {bot name: outcome} for the bots the alert was dispatched to
+    """
+
+    async def dispatch(bot: Bot):
+        # Never dispatch the same alert to a bot twice
+        if not await claim_signal(bot, key):
+            log_message(
+                bot.name,
+                f"🔁 Alert already handled, skipping duplicate: {subject}")
+            return None
+        return await handle_email_for_bot(bot, subject, date_str, body, key)
+
+    results = await asyncio.gather(*(dispatch(bot) for bot in bots),
+                                   return_exceptions=True)
+
+    outcomes = {}
+    for bot, result in zip(bots, results):
+        if isinstance(result, BaseException):
+            # CancelledError has no message; name it instead
+            log_message(bot.name, f"❌ Trade failed: {str(result) or type(result).__name__}")
+            outcomes[bot.name] = "failed"
+        elif result is not None:
+            outcomes[bot.name] = result
+
+    if len(outcomes) > 1:
+        summary = ", ".join(f"{name}: {outcome}"
+                            for name, outcome in outcomes.items())
+        logging.info(f"📤 Alert '{subject}' dispatched to {len(outcomes)} bots ({summary})")
+    return outcomes
+
+
+async def process_mailbox(mailbox: Mailbox):
+    """Check a mailbox's new emails for trade signals, prioritizing newest first.
+
+    Only UIDs above the mailbox's high-water mark are searched, and messages
+    are fetched with BODY.PEEK so unmatched mail stays unread without any
+    flag updates. Subjects are matched from a batched header fetch first;
+    only mail some bot matched has its text body fetched, once, and fanned
+    out to those bots.
+    """
+    session = mailbox.session
+    try:
+        bots = mailbox.active_bots()
+        if not bots:
+            return
+
+        # Only look at unread mail we have not evaluated yet
+        if mailbox.last_uid is None:
+            criteria = "UNSEEN"
+        else:
+            criteria = f"UID {mailbox.last_uid + 1}:* UNSEEN"
+
+        # Search for new emails in newest-first order
+        try:
+            # First try with SORT command which is more reliable for sorting
+            status, uids = await imap_engine.sort_uids(
+                mailbox.session, criteria)
+        except Exception as e:
+            log_mailbox(
+                mailbox,
+                f"⚠️ SORT command failed, falling back to standard search: {str(e)}"
+            )
+            # Fallback to basic search without date sorting (IMAP servers without SORT capability)
+            status, uids = await imap_engine.search_uids(
+                mailbox.session, criteria)
+
+        if status != "OK":
+            log_mailbox(mailbox, "⚠️ IMAP search failed.")
+            return
+
+        # "n:*" always matches the newest message, even below n
+        if mailbox.last_uid is not None:
+            uids = [
+                uid for uid in uids if uid > mailbox.last_uid
+                and uid not in mailbox.processed_uids
+            ]
+
+        log_mailbox(mailbox, f"📥 Found {len(uids)} new emails to process")
+
+        processed = set()
+        try:
+            # Stage one: match subjects from the headers alone
+            status, headers = await imap_engine.fetch_headers(
+                mailbox.session, uids)
+            if status != "OK":
+                log_mailbox(mailbox, "⚠️ Failed to fetch email headers")
+                return
+
+            matches = {}
+            for uid in uids:
+                if uid not in headers:
+                    log_mailbox(mailbox, f"⚠️ Failed to fetch email")
                     continue
 
-                # Process the message IDs
-                if isinstance(messages[0], bytes):
-                    # Handle the standard search result format
-                    unread_ids = messages[0].split()
+                header, structure = headers[uid]
+                msg = email.message_from_bytes(header)
+
+                # Extract subject, date and the alert's identity
+                subject = decode_email_subject(msg.get("Subject", ""))
+                date_str = msg.get("Date", "Unknown date")
+                key = signal_key(msg.get("Message-ID"), mailbox.uidvalidity,
+                                 uid)
+
+                # One pass over the subject resolves every target bot
+                routes = mailbox.routing.route(subject)
+                matched = [
+                    bot for bot in bots
+                    if log_route(bot, routes.get(bot.name), subject, date_str)
+                ]
+                if matched:
+                    matches[uid] = (subject, date_str, key, structure,
+                                    matched)
                 else:
-                    # Handle the SORT command result format
-                    unread_ids = messages
+                    processed.add(uid)
+
+            # Stage two: fetch the capped text body of matched mail only
+            status, bodies = await imap_engine.fetch_bodies(
+                mailbox.session, {
+                    uid: match[3]
+                    for uid, match in matches.items() if match[3] is not None
+                })
+            if status != "OK":
+                log_mailbox(mailbox, f"⚠️ Failed to fetch email")
+                return
 
+            # Unreadable body structures: parse the full messages instead
+            unparsed = [
+                uid for uid, match in matches.items() if match[3] is None
+            ]
+            status, raw_emails = await imap_engine.fetch_messages(
+                mailbox.session, unparsed)
+            if status != "OK":
+                log_mailbox(mailbox, f"⚠️ Failed to fetch email")
+                return
+
+            traded = {}
+            for uid, (subject, date_str, key, structure,
+                      matched) in matches.items():
+                # Check pause state AGAIN before each email
+                if not mailbox.active_bots():
+                    break
+
+                if structure is None:
+                    if uid not in raw_emails:
+                        log_mailbox(mailbox, f"⚠️ Failed to fetch email")
+                        continue
+                    body = get_email_body(
+                        email.message_from_bytes(raw_emails[uid]))
+                else:
+                    body = bodies.get(uid, "")
+
+                if not body:
+                    log_mailbox(mailbox,
+                                "⚠️ Could not extract email body. Skipping.")
+                    processed.add(uid)
+                    continue
+
+                outcomes = await dispatch_signal(
+                    [bot for bot in matched if not bot.paused], key, subject,
+                    date_str, body)
+                processed.add(uid)
+
+                # Mail that no bot traded on was only peeked at and stays unread
+                if "traded" in outcomes.values():
+                    traded[uid] = outcomes
+
+            if traded:
+                await mark_traded_seen(mailbox, traded)
+        finally:
+            await advance_sync_state(mailbox, uids, processed)
+
+    except Exception as e:
+        log_mailbox(mailbox, f"⚠️ Email check failed: {str(e)}")
+        # Unless a reconnect already replaced it, close the session we used;
+        # dropping the reference alone would leak the server connection
+        if mailbox.session is session:
+            await imap_engine.close_session(session)
+            mailbox.session = None
+
+
+async def mark_traded_seen(mailbox: Mailbox, traded):
+    """Flag every traded email as seen with a single STORE.
+
+    Args:
+        traded (dict): {uid: {bot name: outcome}} of the emails traded on
+    """
+    # The mailbox worker reconnects a lost session on its next pass
+    if not mailbox.session:
+        log_mailbox(mailbox, "⚠️ IMAP session lost during processing")
+        return
+
+    try:
+        status = await imap_engine.store_flags(mailbox.session, list(traded),
+                                               '+FLAGS', '\\Seen')
+        if status != "OK":
+            raise Exception(f"STORE returned {status}")
+    except Exception as e:
+        log_mailbox(mailbox, f"⚠️ Failed to mark email as seen: {str(e)}")
+        await imap_engine.close_session(mailbox.session)
+        mailbox.session = None
+        return
+
+    for outcomes in traded.values():
+        for bot_name, outcome in outcomes.items():
+            if outcome == "traded":
+                log_message(bot_name,
+                            f"📧 Marked email as seen after successful trade")
+            else:
                 log_message(
                     bot_name,
-                    f"📥 Found {len(unread_ids)} unread emails to process")
+                    f"📧 Marked email as seen (traded by another bot on this inbox)"
+                )
 
-                for num in unread_ids:
-                    # Check pause state AGAIN before each email
-                    if bot.paused:
-                        break
 
-                    status, msg_data = bot.imap_session.fetch(num, "(RFC822)")
+async def watch_mailbox_idle(mailbox: Mailbox):
+    """Process a mailbox whenever the server pushes new mail (IMAP IDLE).
 
-                    if status != "OK" or not msg_data or not msg_data[0]:
-                        log_message(bot_name, f"⚠️ Failed to fetch email")
-                        continue
+    Returns once the session is dropped or no bot is active any more.
+    """
+    session = mailbox.session
+    log_mailbox(mailbox, "📡 Server supports IDLE, switching to push mode")
 
-                    msg = email.message_from_bytes(msg_data[0][1])
+    try:
+        while mailbox.active_bots() and mailbox.session is session:
+            # Catch up on anything that arrived while we were not idling
+            async with mailbox_slots:
+                await process_mailbox(mailbox)
+            if not mailbox.active_bots() or mailbox.session is not session:
+                break
+
+            if await imap_engine.wait_for_new_mail(session):
+                log_mailbox(mailbox, "📬 New mail pushed by server")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        log_mailbox(mailbox, f"⚠️ IMAP IDLE failed: {str(e)}")
+        if mailbox.session is session:
+            await imap_engine.close_session(session)
+            mailbox.session = None
 
-                    # Extract subject, date, and body
-                    subject = decode_email_subject(msg.get("Subject", ""))
-                    date_str = msg.get("Date", "Unknown date")
 
-                    # Get email body
-                    body = get_email_body(msg)
-                    if not body:
-                        log_message(
-                            bot_name,
-                            "⚠️ Could not extract email body. Skipping.")
-                        continue
+async def run_mailbox_worker(mailbox: Mailbox):
+    """Watch one shared mailbox until none of its bots is active.
 
-                    # Check for subject match using email_subject, symbol, or order fill alerts
-                    should_process = False
-                    if "order" in subject.lower() and any(symbol in subject.upper() for symbol in [bot.symbol, "GBPUSD", "NZDUSD", "XAUUSD"]):
-                        should_process = True
-                        log_message(
-                            bot_name,
-                            f"📊 Order fill detected: {subject}"
-                        )
-                    elif bot.email_subject and bot.email_subject.strip():
-                        # If email_subject is specified in database, check if it's in the subject
-                        if bot.email_subject.lower() in subject.lower():
-                            should_process = True
-                            log_message(
-                                bot_name,
-                                f"📄 Email subject match found: '{bot.email_subject}'"
-                            )
-                    else:
-                        # Fallback to symbol matching if no email_subject is specified
-                        normalized_symbol = normalize_symbol(bot.symbol)
-                        if normalized_symbol.lower() in subject.lower():
-                            should_process = True
-                            log_message(
-                                bot_name,
-                                f"📄 Symbol match found in subject: '{normalized_symbol}'"
-                            )
-
-                    if should_process:
-                        log_message(
-                            bot_name,
-                            f"📄 Processing email body for trading signals...")
-
-                        # Process the body for buy/sell signals
-                        body_lower = body.lower()
-
-                        # Define the signal based on keywords in the body
-                        action = None
-                        if re.search(r'\b(buy|demand)\b', body_lower):
-                            action = "buy"
-                            log_message(
-                                bot_name,
-                                "🔍 BUY signal detected in the email body!")
-                        elif re.search(r'\b(sell|supply)\b', body_lower):
-                            action = "sell"
-                            log_message(
-                                bot_name,
-                                "🔍 SELL signal detected in the email body!")
-
-                        if action:
-                            # Check for position conflict
-                            if bot.position != "neutral" and bot.position != action:
-                                log_message(
-                                    bot_name,
-                                    f"🔁 Signal conflict detected: Closing '{bot.position}' positions to switch to '{action}'."
-                                )
-
-                                try:
-                                    # Close existing position before switching
-                                    close_signal = TradeSignal(
-                                        action="close",
-                                        symbol=bot.symbol,
-                                        quantity=bot.quantity)
-                                    close_result = await bot_manager.close_position(
-                                        bot, close_signal)
-                                    log_message(
-                                        bot_name,
-                                        f"🔒 Closed '{bot.position}' position: {close_result}"
-                                    )
-
-                                    # Update position to neutral after closing
-                                    bot.position = "neutral"
-                                except Exception as e:
-                                    log_message(
-                                        bot_name,
-                                        f"❌ Failed to close position: {str(e)}"
-                                    )
-                                    continue
-
-                            # Create a trade signal
-                            signal = TradeSignal(action=action,
-                                                 symbol=bot.symbol,
-                                                 quantity=bot.quantity)
-
-                            try:
-                                # Execute the trade
-                                log_message(
-                                    bot_name,
-                                    f"🚀 Executing {action.upper()} order for {bot.symbol}..."
-                                )
-                                result = await bot_manager.place_trade(
-                                    bot, signal)
-
-                                log_message(
-                                    bot_name, f"""
-                                ✅ Trade executed successfully: {action.upper()} {bot.symbol}
-                                📅 Email Date: {date_str}  
-                                📨 Subject: {subject}  
-                                📝 Body: {body[:500]}{'...' if len(body) > 500 else ''}
-                                """)
-
-                                # Update bot position
-                                bot.position = action
-
-                                # Mark email as seen since we found and executed a valid signal
-                                if bot.imap_session:
-                                    try:
-                                        bot.imap_session.store(
-                                            num, '+FLAGS', '\\Seen')
-                                        log_message(
-                                            bot_name,
-                                            f"📧 Marked email as seen after successful trade"
-                                        )
-                                    except Exception as e:
-                                        log_message(
-                                            bot_name,
-                                            f"⚠️ Failed to mark email as seen: {str(e)}"
-                                        )
-                                        # Try to reconnect
-                                        reconnect_bot(bot)
-
-                            except Exception as e:
-                                log_message(
-                                    bot_name, f"""
-                                ❌ Trade failed: {str(e)}  
-                                📅 Email Date: {date_str}  
-                                📨 Subject: {subject}  
-                                📝 Body: {body[:500]}{'...' if len(body) > 500 else ''}
-                                """)
-
-                                # Mark email as UNSEEN if trade failed
-                                if bot.imap_session:
-                                    try:
-                                        # Remove the \Seen flag to mark as unread again
-                                        bot.imap_session.store(
-                                            num, '-FLAGS', '\\Seen')
-                                        log_message(
-                                            bot_name,
-                                            f"📧 Marked email as UNSEEN again (trade failed)"
-                                        )
-                                    except Exception as e:
-                                        log_message(
-                                            bot_name,
-                                            f"⚠️ Failed to mark email as unseen: {str(e)}"
-                                        )
-                                        # Try to reconnect
-                                        reconnect_bot(bot)
-                        else:
-                            log_message(
-                                bot_name, f"""
-                            🚫 No valid trade signal found in email.  
-                            📅 Email Date: {date_str}  
-                            📨 Subject: {subject}  
-                            📝 Body: {body[:500]}{'...' if len(body) > 500 else ''}
-                            """)
-
-                            # Mark email as UNSEEN again so it remains unread for the user
-                            if bot.imap_session:
-                                try:
-                                    # Remove the \Seen flag to mark as unread again
-                                    bot.imap_session.store(
-                                        num, '-FLAGS', '\\Seen')
-                                    log_message(
-                                        bot_name,
-                                        f"📧 Marked email as UNSEEN again (no valid signal)"
-                                    )
-                                except Exception as e:
-                                    log_message(
-                                        bot_name,
-                                        f"⚠️ Failed to mark email as unseen: {str(e)}"
-                                    )
-                                    # Try to reconnect
-                                    reconnect_bot(bot)
-                    else:
-                        log_message(
-                            bot_name, f"""
-                        🚫 Email ignored — Subject mismatch.  
-                        📅 Email Date: {date_str}  
-                        📨 Subject: {subject}  
-                        📝 Body: {body[:500]}{'...' if len(body) > 500 else ''}
-                        """)
-
-                        # Mark email as UNSEEN again so it remains unread for the user
-                        if bot.imap_session:
-                            try:
-                                # Remove the \Seen flag to mark as unread again
-                                bot.imap_session.store(num, '-FLAGS', '\\Seen')
-                                log_message(
-                                    bot_name,
-                                    f"📧 Marked email as UNSEEN again (subject mismatch)"
-                                )
-                            except Exception as e:
-                                log_message(
-                                    bot_name,
-                                    f"⚠️ Failed to mark email as unseen: {str(e)}"
-                                )
-                                # Try to reconnect
-                                reconnect_bot(bot)
-
-                    # If there's an error with the IMAP session, break and try to reconnect
-                    if not bot.imap_session:
-                        log_message(bot_name,
-                                    "⚠️ IMAP session lost during processing")
-                        reconnect_bot(bot)
-                        break
+    The worker owns the mailbox's session: it is the only task that uses
+    it or reconnects it, and IDLE re-issues or one-second polls keep it
+    alive. Connection failures only delay this mailbox; connects and processing
+    passes share MAILBOX_CONCURRENCY slots with the other workers, while
+    waiting in IDLE does not hold a slot.
+    """
+    while mailbox.active_bots():
+        try:
+            if not mailbox.session:
+                log_mailbox(mailbox,
+                            "⚠️ IMAP session inactive. Reconnecting...")
+                async with mailbox_slots:
+                    connected = await connect_mailbox(mailbox)
+                if not connected:
+                    delay = max(mailbox.connection.retry_in(), 1)
+                    log_mailbox(
+                        mailbox,
+                        f"⚠️ Failed to reconnect to IMAP, will retry in {delay:.0f}s"
+                    )
+                    await asyncio.sleep(delay)
+                continue
+
+            # Push mode: the IDLE watcher fetches as soon as mail arrives
+            if imap_engine.supports_idle(mailbox.session):
+                await watch_mailbox_idle(mailbox)
+                continue
+
+            # Polling fallback for servers without IDLE
+            async with mailbox_slots:
+                await process_mailbox(mailbox)
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log_mailbox(mailbox, f"⚠️ Mailbox worker error: {str(e)}")
+            await asyncio.sleep(5)
 
-            except Exception as e:
-                log_message(bot_name, f"⚠️ Email check failed: {str(e)}")
-                bot.imap_session = None
 
-        await asyncio.sleep(1)
+def start_mailbox_worker(mailbox: Mailbox):
+    """Start a mailbox's worker unless it is running, and attach it to its bots."""
+    if mailbox.worker_task is None or mailbox.worker_task.done():
+        mailbox.worker_task = asyncio.create_task(
+            run_mailbox_worker(mailbox))
 
+    for bot in mailbox.subscribers.values():
+        bot.monitoring_task = mailbox.worker_task
 
-async def keep_imap_alive():
-    """Keep each bot's IMAP session alive."""
+
+def stop_mailbox_worker(mailbox: Mailbox):
+    """Cancel a mailbox's worker, if one is running."""
+    if mailbox.worker_task and not mailbox.worker_task.done():
+        mailbox.worker_task.cancel()
+    mailbox.worker_task = None
+
+
+async def check_email_for_signals():
+    """Supervise the per-mailbox workers that check emails for trade signals.
+
+    Each shared mailbox is watched by its own task (see run_mailbox_worker);
+    this loop only restarts workers that stopped while bots still need them.
+    """
     while True:
-        try:
-            for bot_name, bot in active_bots.items():
-                # Skip IMAP checks for paused bots
-                if bot.paused:
-                    continue
+        for mailbox in list(mailboxes.values()):
+            # Skip mailboxes whose bots are all paused
+            if not mailbox.active_bots():
+                continue
 
-                if bot.imap_session:
-                    try:
-                        status, response = bot.imap_session.noop()
-                        if status == "OK":
-                            log_message(bot_name,
-                                        "✅ IMAP connection is healthy")
-                        else:
-                            log_message(
-                                bot_name,
-                                "⚠️ IMAP connection appears stale, reconnecting..."
-                            )
-                            # Close old connection if possible
-                            try:
-                                bot.imap_session.close()
-                                bot.imap_session.logout()
-                            except:
-                                pass
-                            # Reconnect
-                            connect_imap(bot)
-                    except Exception as e:
-                        log_message(bot_name,
-                                    f"⚠️ Error in IMAP keep-alive: {str(e)}")
-                        # Reconnect on error
-                        connect_imap(bot)
-
-            # Check every 5 minutes
-            await asyncio.sleep(30)
-        except Exception as e:
-            logging.error(f"Error in keep_imap_alive: {str(e)}")
-            await asyncio.sleep(60)  # Shorter sleep on error
+            if mailbox.worker_task and not mailbox.worker_task.done():
+                continue
 
+            if mailbox.worker_task:
+                log_mailbox(mailbox, "♻️ Mailbox worker stopped, restarting")
+            start_mailbox_worker(mailbox)
 
-def reconnect_bot(bot):
-    """Explicitly reconnect a bot's IMAP session."""
-    try:
-        # Close any existing connection first
-        if bot.imap_session:
-            try:
-                bot.imap_session.close()
-                bot.imap_session.logout()
-            except:
-                pass
-            bot.imap_session = None
-
-        # Attempt to establish a new connection
-        if connect_imap(bot):
-            log_message(bot.name,
-                        "✅ Bot IMAP connection re-established successfully")
-            return True
-        else:
-            log_message(bot.name,
-                        "❌ Failed to re-establish bot IMAP connection")
-            return False
-    except Exception as e:
-        log_message(bot.name, f"❌ Error reconnecting bot: {str(e)}")
-        return False
+        await asyncio.sleep(5)
 
 
 @router.on_event("startup")
 async def start_tasks():
     """Initialize tasks that run on application startup."""
     logging.info("🚀 Starting background tasks...")
-    asyncio.create_task(keep_imap_alive())
+    # Importing bot_manager registers the exchange adapters
+    from backend import bot_manager
+    await open_sessions(*base_urls())
+    # Signed orders are stamped with each venue's server time
+    asyncio.create_task(sync_clocks())
+    start_trade_counter()
+    await start_trade_history()
+    try:
+        await quota.warm_quotas()
+    except Exception as e:
+        logging.error(f"Error loading plan quotas: {str(e)}")
     asyncio.create_task(check_email_for_signals())
     asyncio.create_task(startup_check_emails())
 
 
+@router.on_event("shutdown")
+async def stop_tasks():
+    """Release shared resources on application shutdown."""
+    from exchanges.meta import close_bridge_sessions
+    from exchanges.streams import close_streams
+    await close_streams()
+    await stop_trade_counter()
+    await stop_trade_history()
+    await close_bridge_sessions()
+    await close_sessions()
+
+
 # Modify the startup_check_emails function to load the paused state
 async def startup_check_emails():
     """Initial check for all active bots on startup."""
     logging.info("📨 Performing initial email check for all bots...")
 
-    # Retrieve bots from database
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        await purge_processed_signals()
+    except Exception as e:
+        logging.error(f"Error purging processed signals: {str(e)}")
 
-        # Add the paused column to the bots table if it doesn't exist
-        try:
-            cursor.execute(
-                "ALTER TABLE bots ADD COLUMN IF NOT EXISTS paused BOOLEAN DEFAULT FALSE"
-            )
-            conn.commit()
-            logging.info(
-                "✅ Added 'paused' column to bots table if it didn't exist")
-        except Exception as e:
-            logging.error(f"Error adding paused column: {str(e)}")
-            conn.rollback()
+    # Retrieve bots from database
+    try:
+        pool = get_pool()
 
-        cursor.execute("SELECT * FROM bots")
-        bots_data = cursor.fetchall()
-        conn.close()
+        bots_data = await pool.fetch("SELECT * FROM bots")
 
         # Initialize and start each bot
         for bot_data in bots_data:
@@ -637,12 +973,13 @@ async def startup_check_emails():
                     api_key=bot_data["api_key"],
                     api_secret=bot_data["api_secret"],
                     account_id=bot_data["account_id"],
+                    user_email=bot_data["user_email"],
                     paused=paused_state  # Set the paused state from the database
                 )
 
                 # Only establish IMAP connection if bot is not paused
                 if not paused_state:
-                    if connect_imap(bot):
+                    if await connect_imap(bot):
                         log_message(
                             bot_name,
                             f"✅ Bot loaded from database (active) and connected to IMAP"
@@ -657,6 +994,8 @@ async def startup_check_emails():
                         bot_name,
                         f"✅ Bot loaded from database (paused) - IMAP connection skipped"
                     )
+                if not bot.paused:
+                    streams.start_stream(get_adapter(bot))
                 active_bots[bot_name] = bot
 
         logging.info(f"✅ Initialized {len(active_bots)} bots from database")
@@ -691,23 +1030,28 @@ async def get_current_user(authorization: str = Header(None)):
 async def create_bot(config: BotConfigRequest,
                      current_user: dict = Depends(get_current_user)):
     """Create a trading bot and save to the database with user email."""
-    conn = None
+    bot_reserved = False
     try:
         user_email = current_user["email"]
         logging.info(f"✅ Creating bot for authenticated user: {user_email}")
 
-        # Create a database connection
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        pool = get_pool()
 
         # Check if bot name already exists
-        cursor.execute("SELECT name FROM bots WHERE name = %s",
-                       (config.name, ))
-        if cursor.fetchone():
-            conn.close()
+        if await pool.fetchval("SELECT name FROM bots WHERE name = $1",
+                               config.name):
             return JSONResponse(status_code=400,
                                 content={"detail": "Bot name already exists"})
 
+        # Enforce the plan's bot limit (users who signed up since startup
+        # aren't cached yet)
+        if user_email not in quota.quotas:
+            await quota.load_quota(user_email)
+        problem = quota.reserve_bot(user_email)
+        if problem:
+            return JSONResponse(status_code=403, content={"detail": problem})
+        bot_reserved = True
+
         # Validate MetaTrader5 fields if needed
         if config.exchange.lower() == "metatrader5":
             required_fields = [
@@ -715,7 +1059,6 @@ async def create_bot(config: BotConfigRequest,
                 config.deviation, config.magic_number
             ]
             if not all(required_fields):
-                conn.close()
                 return JSONResponse(
                     status_code=400,
                     content={
@@ -735,6 +1078,7 @@ async def create_bot(config: BotConfigRequest,
                        api_key=config.api_key,
                        api_secret=config.api_secret,
                        account_id=config.account_id,
+                       user_email=user_email,
                        login=config.login,
                        password=config.password,
                        server=config.server,
@@ -742,33 +1086,40 @@ async def create_bot(config: BotConfigRequest,
                        deviation=config.deviation,
                        magic_number=config.magic_number)
 
-        # Test IMAP connection
-        if not connect_imap(temp_bot):
-            conn.close()
+        # Reject symbols and quantities the venue would refuse
+        adapter = get_adapter(temp_bot)
+        if adapter is not None:
+            quantity, problem = await check_order_size(adapter,
+                                                       temp_bot.quantity)
+            if not problem and float(quantity) != temp_bot.quantity:
+                problem = f"Quantity {temp_bot.quantity} is not a multiple of the step size for {adapter.symbol}; use {format_quantity(quantity)}"
+            if problem:
+                return JSONResponse(status_code=400,
+                                    content={"detail": problem})
+
+        # Test IMAP connection (shared with other bots on the same inbox)
+        if not await connect_imap(temp_bot):
+            await release_imap(temp_bot)
             return JSONResponse(
                 status_code=400,
                 content={"detail": "Failed to connect to the IMAP server."})
 
         # Insert bot into the database with consistent column names
-        cursor.execute(
+        await pool.execute(
             """
             INSERT INTO bots (
                 name, exchange, symbol, quantity, 
                 email_address, email_password, imap_server, email_subject,
                 api_key, api_secret, account_id, user_email
             ) VALUES (
-                %s, %s, %s, %s, 
-                %s, %s, %s, %s,
-                %s, %s, %s, %s
+                $1, $2, $3, $4,
+                $5, $6, $7, $8,
+                $9, $10, $11, $12
             )
-        """, (config.name, config.exchange, config.symbol, config.quantity,
-              config.email_address, config.email_password, config.imap_server,
-              config.email_subject, config.api_key, config.api_secret,
-              config.account_id, user_email))
-
-        conn.commit()
-        conn.close()
-        conn = None  # Set to None to avoid "connection already closed" error
+        """, config.name, config.exchange, config.symbol, config.quantity,
+            config.email_address, config.email_password, config.imap_server,
+            config.email_subject, config.api_key, config.api_secret,
+            config.account_id, user_email)
 
         log_message(
             temp_bot.name,
@@ -776,7 +1127,9 @@ async def create_bot(config: BotConfigRequest,
         )
 
         # Store the bot in active_bots
+        streams.start_stream(adapter)
         active_bots[temp_bot.name] = temp_bot
+        bot_reserved = False
 
         # Instead of calling monitor_emails, use the existing check_email_for_signals function
         # This function is already running in the background
@@ -788,24 +1141,23 @@ async def create_bot(config: BotConfigRequest,
             "botName": config.name,
             "userEmail": user_email
         }
-    except psycopg2.IntegrityError as e:
+    except asyncpg.IntegrityConstraintViolationError as e:
         logging.error(f"Database integrity error: {str(e)}")
-        if conn is not None:
-            conn.rollback()
-            conn.close()
+        if 'temp_bot' in locals() and temp_bot.name not in active_bots:
+            await release_imap(temp_bot)
         return JSONResponse(status_code=400,
                             content={"detail": f"Database error: {str(e)}"})
     except Exception as e:
         logging.error(f"Error creating bot: {str(e)}")
-        if conn is not None:
-            try:
-                conn.rollback()
-                conn.close()
-            except:
-                pass
+        if 'temp_bot' in locals() and temp_bot.name not in active_bots:
+            await release_imap(temp_bot)
         return JSONResponse(
             status_code=500,
             content={"detail": f"Failed to create bot: {str(e)}"})
+    finally:
+        # The bot was not created after all
+        if bot_reserved:
+            quota.release_bot(current_user["email"])
 
 
 # Add a new endpoint to toggle bot pause state
@@ -816,15 +1168,12 @@ async def toggle_bot(bot_name: str,
         user_email = current_user["email"]
 
         # Verify the bot exists and belongs to the user
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute(
-            "SELECT * FROM bots WHERE name = %s AND user_email = %s",
-            (bot_name, user_email))
-        bot_data = cursor.fetchone()
+        pool = get_pool()
+        bot_data = await pool.fetchrow(
+            "SELECT * FROM bots WHERE name = $1 AND user_email = $2",
+            bot_name, user_email)
 
         if not bot_data:
-            conn.close()
             return JSONResponse(
                 status_code=404,
                 content={
@@ -847,15 +1196,16 @@ async def toggle_bot(bot_name: str,
                 api_key=bot_data["api_key"],
                 api_secret=bot_data["api_secret"],
                 account_id=bot_data["account_id"],
+                user_email=bot_data["user_email"],
                 paused=False  # Default to not paused
             )
 
             # Connect to IMAP
-            connect_imap(bot)
+            await connect_imap(bot)
+            streams.start_stream(get_adapter(bot))
             active_bots[bot_name] = bot
             log_message(bot_name, f"Bot activated by user {user_email}")
 
-            conn.close()
             return {
                 "message": f"Bot '{bot_name}' has been activated",
                 "paused": False
@@ -867,27 +1217,18 @@ async def toggle_bot(bot_name: str,
         # Update the paused state immediately
         active_bots[bot_name].paused = new_paused_state
 
-        # If pausing, immediately close IMAP connection
+        # If pausing, leave the shared mailbox (its session closes once unused)
         if new_paused_state:
-            if active_bots[bot_name].imap_session:
-                try:
-                    log_message(
-                        bot_name,
-                        "Forcefully closing IMAP session due to pause")
-                    active_bots[bot_name].imap_session.close()
-                    active_bots[bot_name].imap_session.logout()
-                except Exception as e:
-                    log_message(bot_name,
-                                f"Error during forced IMAP logout: {str(e)}")
-                finally:
-                    # Always set to None even if close/logout failed
-                    active_bots[bot_name].imap_session = None
-                    log_message(
-                        bot_name,
-                        "IMAP session set to None - bot is now fully paused")
-        # If resuming, re-establish the connection
-        elif not active_bots[bot_name].imap_session:
-            if connect_imap(active_bots[bot_name]):
+            try:
+                await release_imap(active_bots[bot_name])
+            except Exception as e:
+                log_message(bot_name,
+                            f"Error during forced IMAP logout: {str(e)}")
+            log_message(bot_name,
+                        "Unsubscribed from mailbox - bot is now fully paused")
+        # If resuming, re-subscribe and re-establish the connection
+        else:
+            if await connect_imap(active_bots[bot_name]):
                 log_message(bot_name,
                             "IMAP session re-established after resume")
             else:
@@ -896,10 +1237,8 @@ async def toggle_bot(bot_name: str,
                     "Failed to re-establish IMAP session after resume")
 
         # Update the database
-        cursor.execute("UPDATE bots SET paused = %s WHERE name = %s",
-                       (new_paused_state, bot_name))
-        conn.commit()
-        conn.close()
+        await pool.execute("UPDATE bots SET paused = $1 WHERE name = $2",
+                           new_paused_state, bot_name)
 
         state = "paused" if new_paused_state else "resumed"
         return {
@@ -907,8 +1246,6 @@ async def toggle_bot(bot_name: str,
             "paused": new_paused_state
         }
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
         log_message(bot_name, f"Error toggling bot state: {str(e)}")
         raise HTTPException(status_code=500,
                             detail=f"Failed to toggle bot: {str(e)}")
@@ -982,46 +1319,11 @@ async def get_bots(current_user: dict = Depends(get_current_user)):
     """Retrieve all bots from the database for the authenticated user with all columns."""
     try:
         user_email = current_user["email"]
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-
-        # Check if bots table exists
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'bots'
-            );
-        """)
-        table_exists = cursor.fetchone()[0]
-
-        if not table_exists:
-            # Create bots table if it doesn't exist
-            cursor.execute("""
-                CREATE TABLE bots (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) UNIQUE NOT NULL,
-                    exchange VARCHAR(50) NOT NULL,
-                    symbol VARCHAR(50) NOT NULL,
-                    quantity FLOAT NOT NULL,
-                    email_address VARCHAR(100) NOT NULL,
-                    email_password VARCHAR(200) NOT NULL,
-                    imap_server VARCHAR(100) NOT NULL,
-                    email_subject VARCHAR(200) NOT NULL,
-                    api_key VARCHAR(200),
-                    api_secret VARCHAR(200),
-                    account_id VARCHAR(100),
-                    user_email VARCHAR(100) NOT NULL,
-                    paused BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-            """)
-            conn.commit()
+        pool = get_pool()
 
         # Select all columns from the bots table for the authenticated user
-        cursor.execute("SELECT * FROM bots WHERE user_email = %s",
-                       (user_email, ))
-        bots = cursor.fetchall()
-        conn.close()
+        bots = await pool.fetch("SELECT * FROM bots WHERE user_email = $1",
+                                user_email)
 
         # Convert to list of dictionaries
         bots_list = []
@@ -1046,22 +1348,106 @@ async def get_bots(current_user: dict = Depends(get_current_user)):
                 bot_dict["position"] = active_bot.position
                 bot_dict[
                     "paused"] = active_bot.paused  # Include the paused state
+                mailbox = find_mailbox(active_bot)
+                bot_dict["imap_connection"] = mailbox.connection.report(
+                    mailbox.session is not None) if mailbox else None
+                adapter = get_adapter(active_bot)
+                bot_dict["rate_limit"] = adapter.rate_limit(
+                ) if adapter else None
             else:
                 bot_dict["status"] = "stopped"
                 bot_dict["position"] = "neutral"
                 bot_dict["paused"] = bot_dict.get(
                     "paused", False)  # Default to False if not present
+                bot_dict["imap_connection"] = None
+                bot_dict["rate_limit"] = None
 
             bots_list.append(bot_dict)
 
         return {"bots": bots_list}
     except Exception as e:
-        if 'conn' in locals() and conn:
-            conn.close()
         raise HTTPException(status_code=500,
                             detail=f"Failed to retrieve bots: {str(e)}")
 
 
+
+def trade_dict(row) -> dict:
+    """Turn a trades row into JSON-ready data."""
+    trade = dict(row)
+    for column in ("requests", "responses"):
+        if trade[column] is not None:
+            trade[column] = json.loads(trade[column])
+    return trade
+
+
+async def fetch_trades(condition: str, args: list, limit: int,
+                       before: Optional[datetime]) -> List[dict]:
+    """Newest trades matching condition, paged backwards with before."""
+    if before is not None:
+        args = args + [before]
+        condition += f" AND signal_at < ${len(args)}"
+    args = args + [max(1, min(limit, TRADE_HISTORY_PAGE_LIMIT))]
+    rows = await get_pool().fetch(
+        f"SELECT * FROM trades WHERE {condition} ORDER BY signal_at DESC LIMIT ${len(args)}",
+        *args)
+    return [trade_dict(row) for row in rows]
+
+
+@router.get("/trades")
+async def get_trades(limit: int = 100, before: Optional[datetime] = None,
+                     current_user: dict = Depends(get_current_user)):
+    """Trade history of every bot of the authenticated user, newest first."""
+    try:
+        trades = await fetch_trades("user_email = $1", [current_user["email"]],
+                                    limit, before)
+        return {"trades": trades}
+    except Exception as e:
+        raise HTTPException(status_code=500,
+                            detail=f"Failed to retrieve trades: {str(e)}")
+
+
+@router.get("/trades/{bot_name}")
+async def get_bot_trades(bot_name: str, limit: int = 100,
+                         before: Optional[datetime] = None,
+                         current_user: dict = Depends(get_current_user)):
+    """Trade history of one of the authenticated user's bots, newest first."""
+    try:
+        trades = await fetch_trades("bot_name = $1 AND user_email = $2",
+                                    [bot_name, current_user["email"]],
+                                    limit, before)
+        return {"trades": trades}
+    except Exception as e:
+        raise HTTPException(status_code=500,
+                            detail=f"Failed to retrieve trades: {str(e)}")
+
+
+@router.get("/trade-stats/{bot_name}")
+async def get_bot_trade_stats(bot_name: str, days: int = 30,
+                              current_user: dict = Depends(get_current_user)):
+    """Trade counts and latencies (milliseconds) per outcome for one bot."""
+    try:
+        rows = await get_pool().fetch(
+            """
+            SELECT status,
+                   COUNT(*) AS trades,
+                   percentile_cont(0.5) WITHIN GROUP (
+                       ORDER BY EXTRACT(EPOCH FROM responded_at - signal_at) * 1000) AS p50_latency_ms,
+                   percentile_cont(0.95) WITHIN GROUP (
+                       ORDER BY EXTRACT(EPOCH FROM responded_at - signal_at) * 1000) AS p95_latency_ms,
+                   AVG(EXTRACT(EPOCH FROM started_at - signal_at) * 1000) AS avg_queue_ms,
+                   AVG(EXTRACT(EPOCH FROM responded_at - sent_at) * 1000) AS avg_exchange_ms
+            FROM trades
+            WHERE bot_name = $1 AND user_email = $2
+              AND signal_at >= now() - make_interval(days => $3)
+            GROUP BY status
+            """, bot_name, current_user["email"], days)
+        return {"bot_name": bot_name, "days": days,
+                "stats": [dict(row) for row in rows]}
+    except Exception as e:
+        raise HTTPException(status_code=500,
+                            detail=f"Failed to retrieve trade stats: {str(e)}")
+
+
 @router.get("/status")
 async def status():
     return {"message": "Trading Bot is running with database integration!"}
@@ -0,0 +1,231 @@
+"""Versioned schema migrations.
+
+Run before starting the app (and after every deploy):
+
+    python -m backend.migrations
+
+Each migration runs once, in its own transaction, and is recorded in
+schema_migrations. Add new schema changes as a new entry at the end of
+MIGRATIONS; never edit one that has already shipped.
+"""
+import asyncio
+import logging
+from typing import List, Tuple
+
+import asyncpg
+
+from backend.db import DATABASE_URL
+
+# Serializes concurrent runs, e.g. two instances deploying at once
+MIGRATION_LOCK_ID = 72_270_001
+
+# (version, description, SQL), applied in version order
+MIGRATIONS: List[Tuple[int, str, str]] = [
+    (1, "Base tables and subscription plans", """
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            price INTEGER,
+            bot_limit INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            first_name VARCHAR(50) NOT NULL,
+            last_name VARCHAR(50) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password VARCHAR(200) NOT NULL,
+            is_verified BOOLEAN DEFAULT FALSE,
+            subscription_id INTEGER REFERENCES subscriptions(id),
+            subscription_plan VARCHAR(20) DEFAULT 'free',
+            trade_count INTEGER DEFAULT 0
+        );
+
+        -- Databases created by older versions may lack these columns
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS first_name VARCHAR(50) NOT NULL DEFAULT '';
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS last_name VARCHAR(50) NOT NULL DEFAULT '';
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS is_verified BOOLEAN DEFAULT FALSE;
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS subscription_id INTEGER REFERENCES subscriptions(id);
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS subscription_plan VARCHAR(20) DEFAULT 'free';
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS trade_count INTEGER DEFAULT 0;
+        ALTER TABLE users ALTER COLUMN password TYPE VARCHAR(200);
+
+        -- The old standalone users table required a username the app never sets
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT FROM information_schema.columns
+                       WHERE table_name = 'users' AND column_name = 'username') THEN
+                ALTER TABLE users ALTER COLUMN username DROP NOT NULL;
+            END IF;
+        END $$;
+
+        CREATE TABLE IF NOT EXISTS bots (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) UNIQUE NOT NULL,
+            exchange VARCHAR(50) NOT NULL,
+            symbol VARCHAR(50) NOT NULL,
+            quantity FLOAT NOT NULL,
+            email_address VARCHAR(100) NOT NULL,
+            email_password VARCHAR(200) NOT NULL,
+            imap_server VARCHAR(100) NOT NULL,
+            email_subject VARCHAR(200) NOT NULL,
+            api_key VARCHAR(200),
+            api_secret VARCHAR(200),
+            account_id VARCHAR(100),
+            user_email VARCHAR(100) NOT NULL,
+            paused BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        ALTER TABLE bots ADD COLUMN IF NOT EXISTS paused BOOLEAN DEFAULT FALSE;
+
+        CREATE TABLE IF NOT EXISTS mailbox_sync_state (
+            imap_server VARCHAR(100) NOT NULL,
+            email_address VARCHAR(100) NOT NULL,
+            uidvalidity BIGINT NOT NULL,
+            last_uid BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (imap_server, email_address)
+        );
+
+        CREATE TABLE IF NOT EXISTS processed_signals (
+            bot_name VARCHAR(100) NOT NULL,
+            signal_key TEXT NOT NULL,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (bot_name, signal_key)
+        );
+
+        CREATE TABLE IF NOT EXISTS orders (
+            id SERIAL PRIMARY KEY,
+            order_id VARCHAR(100) UNIQUE NOT NULL,
+            user_email VARCHAR(100) NOT NULL,
+            plan VARCHAR(20) NOT NULL,
+            amount INTEGER NOT NULL,
+            status VARCHAR(20) DEFAULT 'created',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+
+        INSERT INTO subscriptions (name, price, bot_limit)
+        SELECT * FROM (VALUES ('Free', 0, 1), ('Pro', 999, 5),
+                              ('Enterprise', 2499, 10)) AS plans
+        WHERE NOT EXISTS (SELECT FROM subscriptions);
+    """),
+    (2, "Indexes for the per-user and payment lookups", """
+        -- /get-bots, quota loading and bot ownership checks
+        CREATE INDEX IF NOT EXISTS bots_user_email_idx ON bots (user_email);
+        -- Login and payment verification. The UNIQUE constraints index
+        -- these already; only tables created without them need one.
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT FROM pg_index i
+                           JOIN pg_attribute a ON a.attrelid = i.indrelid
+                                              AND a.attnum = i.indkey[0]
+                           WHERE i.indrelid = 'users'::regclass AND a.attname = 'email') THEN
+                CREATE INDEX users_email_idx ON users (email);
+            END IF;
+
+            IF NOT EXISTS (SELECT FROM pg_index i
+                           JOIN pg_attribute a ON a.attrelid = i.indrelid
+                                              AND a.attnum = i.indkey[0]
+                           WHERE i.indrelid = 'orders'::regclass AND a.attname = 'order_id') THEN
+                CREATE INDEX orders_order_id_idx ON orders (order_id);
+            END IF;
+        END $$;
+    """),
+    (3, "Partitioned trade history", """
+        -- Append-only; monthly partitions are created by backend.trade_history
+        CREATE TABLE IF NOT EXISTS trades (
+            id BIGSERIAL,
+            signal_at TIMESTAMPTZ NOT NULL,
+            bot_name VARCHAR(100) NOT NULL,
+            user_email VARCHAR(100),
+            exchange VARCHAR(50) NOT NULL,
+            symbol VARCHAR(50) NOT NULL,
+            action VARCHAR(10) NOT NULL,
+            quantity DOUBLE PRECISION,
+            client_order_id VARCHAR(64),
+            signal_key TEXT,
+            subject TEXT,
+            position_before VARCHAR(10),
+            status VARCHAR(20) NOT NULL,
+            message TEXT,
+            requests JSONB,
+            responses JSONB,
+            started_at TIMESTAMPTZ,
+            sent_at TIMESTAMPTZ,
+            responded_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ
+        ) PARTITION BY RANGE (signal_at);
+
+        CREATE INDEX IF NOT EXISTS trades_bot_name_idx ON trades (bot_name, signal_at DESC);
+        CREATE INDEX IF NOT EXISTS trades_user_email_idx ON trades (user_email, signal_at DESC);
+    """),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def applied_version(conn) -> int:
+    """Highest migration applied to the database, 0 if none."""
+    if await conn.fetchval("SELECT to_regclass('schema_migrations')") is None:
+        return 0
+    return await conn.fetchval(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+
+
+async def migrate(conn) -> int:
+    """Apply every pending migration.
+
+    Returns:
+        int: number of migrations applied
+    """
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            """)
+        current = await applied_version(conn)
+
+        applied = 0
+        for version, description, sql in MIGRATIONS:
+            if version <= current:
+                continue
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES ($1, $2)",
+                    version, description)
+            logging.info(f"✅ Applied migration {version}: {description}")
+            applied += 1
+        return applied
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+
+async def check_schema(conn) -> bool:
+    """Warn if the database is behind this version of the code."""
+    version = await applied_version(conn)
+    if version < LATEST_VERSION:
+        logging.error(f"❌ Database schema is at version {version}, expected {LATEST_VERSION}. "
+                      f"Run 'python -m backend.migrations'.")
+        return False
+    return True
+
+
+async def main():
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        applied = await migrate(conn)
+    finally:
+        await conn.close()
+    logging.info(f"✅ Database schema is at version {LATEST_VERSION} "
+                 f"({applied} migrations applied)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
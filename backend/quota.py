@@ -0,0 +1,120 @@
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from backend.db import get_pool
+from backend.subscription import PLANS
+
+# Plan assumed for users whose plan is unset or unknown
+DEFAULT_PLAN = "free"
+
+
+@dataclass
+class UserQuota:
+    """A user's plan and usage, as counted against PLANS."""
+    plan: str
+    bot_count: int = 0
+    trade_count: int = 0
+
+    def limits(self) -> dict:
+        return PLANS.get(self.plan, PLANS[DEFAULT_PLAN])
+
+
+# user email -> quota, warmed at startup and kept current in memory
+quotas: Dict[str, UserQuota] = {}
+
+_QUOTA_QUERY = """
+    SELECT users.email, users.subscription_plan, users.trade_count,
+           COUNT(bots.id) AS bot_count
+    FROM users
+    LEFT JOIN bots ON bots.user_email = users.email
+"""
+
+# Grouped by the primary key, so the other users columns may be selected
+# next to the count (users.email is only UNIQUE, which Postgres won't accept)
+_QUOTA_GROUP = " GROUP BY users.id"
+
+
+def _from_row(row) -> UserQuota:
+    return UserQuota(plan=(row["subscription_plan"] or DEFAULT_PLAN).lower(),
+                     bot_count=row["bot_count"],
+                     trade_count=row["trade_count"] or 0)
+
+
+async def warm_quotas():
+    """Load every user's quota; called on application startup."""
+    rows = await get_pool().fetch(_QUOTA_QUERY + _QUOTA_GROUP)
+    for row in rows:
+        quotas[row["email"]] = _from_row(row)
+    logging.info(f"✅ Loaded plan quotas for {len(rows)} users")
+
+
+async def load_quota(email: str) -> Optional[UserQuota]:
+    """Reload one user's quota from the database, e.g. after a plan change."""
+    row = await get_pool().fetchrow(
+        _QUOTA_QUERY + " WHERE users.email = $1" + _QUOTA_GROUP, email)
+    if row is None:
+        quotas.pop(email, None)
+        return None
+    quotas[email] = _from_row(row)
+    return quotas[email]
+
+
+async def change_plan(email: str, plan: str):
+    """Apply a plan change to the cached quota; never raises.
+
+    The usage counts are kept as they are: the database's trade_count lags
+    behind trades still buffered in backend.trade_counter or in flight.
+    Users not cached yet are loaded.
+    """
+    quota = quotas.get(email)
+    if quota is not None:
+        quota.plan = (plan or DEFAULT_PLAN).lower()
+        return
+    try:
+        await load_quota(email)
+    except Exception as e:
+        logging.error(f"Error loading plan quota for {email}: {str(e)}")
+
+
+def reserve_trade(email: Optional[str]) -> Optional[str]:
+    """Count a trade against the user's plan before it is sent.
+
+    Returns:
+        str: why the plan does not allow the trade, or None if it was
+        reserved (hand it back with release_trade if the trade fails)
+    """
+    quota = quotas.get(email)
+    if quota is None:
+        return None
+    limit = quota.limits()["trade_limit"]
+    if limit >= 0 and quota.trade_count >= limit:
+        return f"Trade limit of the {quota.plan} plan reached ({limit} trades)"
+    quota.trade_count += 1
+    return None
+
+
+def release_trade(email: Optional[str]):
+    """Hand back a trade reserved for an order that did not go through."""
+    quota = quotas.get(email)
+    if quota is not None and quota.trade_count > 0:
+        quota.trade_count -= 1
+
+
+def reserve_bot(email: str) -> Optional[str]:
+    """Count a new bot against the user's plan; see reserve_trade."""
+    quota = quotas.get(email)
+    if quota is None:
+        return None
+    limit = quota.limits()["bots"]
+    if limit >= 0 and quota.bot_count >= limit:
+        return f"Bot limit of the {quota.plan} plan reached ({limit} bots)"
+    quota.bot_count += 1
+    return None
+
+
+def release_bot(email: str):
+    """Hand back a bot reserved for a bot that was not created."""
+    quota = quotas.get(email)
+    if quota is not None and quota.bot_count > 0:
+        quota.bot_count -= 1
@@ -0,0 +1,83 @@
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+# Delay before the first retry, doubled after every failed attempt (seconds)
+IMAP_BACKOFF_BASE = float(os.getenv("IMAP_BACKOFF_BASE", 2))
+IMAP_BACKOFF_MAX = float(os.getenv("IMAP_BACKOFF_MAX", 300))
+
+# Consecutive failures that open the circuit, and how long it stays open
+IMAP_CIRCUIT_THRESHOLD = int(os.getenv("IMAP_CIRCUIT_THRESHOLD", 5))
+IMAP_CIRCUIT_COOLDOWN = float(os.getenv("IMAP_CIRCUIT_COOLDOWN", 600))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+@dataclass
+class ConnectionState:
+    """Reconnect schedule and circuit breaker for one IMAP account.
+
+    Failed attempts are spaced by exponential backoff with jitter. After
+    IMAP_CIRCUIT_THRESHOLD failures in a row the circuit opens and no
+    attempt is made for IMAP_CIRCUIT_COOLDOWN; the next attempt is a single
+    half-open trial that either closes the circuit or opens it again.
+    """
+    circuit: str = CLOSED
+    failures: int = 0
+    next_attempt: float = 0.0
+
+    def retry_in(self) -> float:
+        """Seconds until the next connection attempt is allowed."""
+        return max(0.0, self.next_attempt - time.monotonic())
+
+    def allow_attempt(self) -> bool:
+        """Return True if a connection attempt may be made now."""
+        if self.retry_in() > 0:
+            return False
+        if self.circuit == OPEN:
+            self.circuit = HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.circuit = CLOSED
+        self.failures = 0
+        self.next_attempt = 0.0
+
+    def record_failure(self) -> float:
+        """Schedule the next attempt after a failure and return its delay."""
+        self.failures += 1
+        if self.circuit == HALF_OPEN or self.failures >= IMAP_CIRCUIT_THRESHOLD:
+            self.circuit = OPEN
+            delay = IMAP_CIRCUIT_COOLDOWN
+        else:
+            delay = min(IMAP_BACKOFF_MAX,
+                        IMAP_BACKOFF_BASE * 2**(self.failures - 1))
+
+        # Jitter keeps accounts on the same host from retrying in lockstep
+        delay = random.uniform(delay / 2, delay)
+        self.next_attempt = time.monotonic() + delay
+        return delay
+
+    def report(self, connected: bool) -> dict:
+        """Connection state as shown to users in /get-bots."""
+        return {
+            "connected": connected,
+            "circuit": self.circuit,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in()),
+        }
+
+
+# Kept across subscribe/unsubscribe so pausing a bot does not reset them
+connection_states: Dict[Tuple[str, str], ConnectionState] = {}
+
+
+def get_connection_state(key: Tuple[str, str]) -> ConnectionState:
+    """Return the connection state of an (imap_server, account) key."""
+    if key not in connection_states:
+        connection_states[key] = ConnectionState()
+    return connection_states[key]
@@ -0,0 +1,115 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from backend.types import Bot
+
+# Order fill alerts for these symbols are routed to every bot of a mailbox
+ORDER_FILL_SYMBOLS = ["GBPUSD", "NZDUSD", "XAUUSD"]
+
+# Route kinds, in order of precedence
+ORDER_FILL = "order_fill"
+EMAIL_SUBJECT = "email_subject"
+SYMBOL = "symbol"
+
+
+def normalize_symbol(symbol: str) -> str:
+    return re.sub(r'\W+', '', symbol.upper())
+
+
+class AhoCorasick:
+    """Find which of a fixed set of patterns occur in a text in one pass."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Set[str]] = [set()]
+
+        for pattern in set(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(pattern)
+
+        # Breadth-first so each failure link points to a finished state
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text: str) -> Set[str]:
+        """Return the (non-empty) patterns that occur in text."""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found |= self.output[state]
+        return found
+
+
+class RoutingIndex:
+    """Resolves the bots an email subject is meant for.
+
+    A bot is selected when the subject is an order fill alert ("order" plus
+    its symbol or one of ORDER_FILL_SYMBOLS), otherwise when it contains
+    the bot's email_subject, or, for bots without one, its normalized
+    symbol. Matching is case-insensitive except for the order fill symbol,
+    which must appear in upper case as configured.
+    """
+
+    def __init__(self, bots: Iterable[Bot] = ()):
+        # pattern -> [(bot name, route kind, pattern shown in logs)]
+        self.order_routes: Dict[str, List[str]] = {}
+        self.subject_routes: Dict[str, List[Tuple[str, str, str]]] = {}
+        self.bot_names: List[str] = []
+
+        for bot in bots:
+            self.bot_names.append(bot.name)
+            self.order_routes.setdefault(bot.symbol, []).append(bot.name)
+
+            if bot.email_subject and bot.email_subject.strip():
+                route = (bot.name, EMAIL_SUBJECT, bot.email_subject)
+                pattern = bot.email_subject.lower()
+            else:
+                normalized_symbol = normalize_symbol(bot.symbol)
+                route = (bot.name, SYMBOL, normalized_symbol)
+                pattern = normalized_symbol.lower()
+            self.subject_routes.setdefault(pattern, []).append(route)
+
+        self.order_matcher = AhoCorasick(
+            list(self.order_routes) + ORDER_FILL_SYMBOLS)
+        self.subject_matcher = AhoCorasick(self.subject_routes)
+
+    def route(self, subject: str) -> Dict[str, Tuple[str, str]]:
+        """Return {bot name: (route kind, matched pattern)} for a subject."""
+        routes = {}
+
+        if "order" in subject.lower():
+            # Empty patterns are contained in every subject
+            found = self.order_matcher.find(subject.upper()) | {""}
+            if found & set(ORDER_FILL_SYMBOLS):
+                return {name: (ORDER_FILL, subject) for name in self.bot_names}
+            for pattern in found:
+                for name in self.order_routes.get(pattern, []):
+                    routes[name] = (ORDER_FILL, subject)
+
+        found = self.subject_matcher.find(subject.lower()) | {""}
+        for pattern in found:
+            for name, kind, shown in self.subject_routes.get(pattern, []):
+                routes.setdefault(name, (kind, shown))
+        return routes
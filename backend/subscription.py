@@ -4,7 +4,7 @@ import razorpay
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException
 from backend.auth import get_current_user
-import psycopg2
+from backend.db import get_pool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,9 +21,6 @@ PLANS = {
     'enterprise': {'price': 249900, 'bots': -1, 'trade_limit': -1}
 }
 
-def get_db_connection():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
-
 @router.post("/create-order")
 async def create_order(plan_data: dict, current_user: dict = Depends(get_current_user)):
     plan = plan_data.get('plan')
@@ -61,18 +58,15 @@ async def verify_payment(payment_data: dict, current_user: dict = Depends(get_cu
         })
         
         # Update user's subscription in database
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        cur.execute("""
+        await get_pool().execute("""
             UPDATE users 
-            SET subscription_plan = %s, 
+            SET subscription_plan = $1, 
                 subscription_date = CURRENT_TIMESTAMP 
-            WHERE email = %s""", (payment_data['plan'], current_user['email']))
-        
-        conn.commit()
-        cur.close()
-        conn.close()
+            WHERE email = $2""", payment_data['plan'], current_user['email'])
+
+        # Import here: backend.quota imports PLANS from this module
+        from backend import quota
+        await quota.change_plan(current_user['email'], payment_data['plan'])
         
         return {"status": "success"}
     except Exception as e:
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from typing import Optional
+
+from backend.db import get_pool
+
+# Longest a counted trade waits before it is written (seconds)
+TRADE_COUNT_FLUSH_INTERVAL = float(os.getenv("TRADE_COUNT_FLUSH_INTERVAL", 1))
+
+# bot name -> successful trades not yet written to users.trade_count
+pending_trades: Counter = Counter()
+
+_flush_task: Optional[asyncio.Task] = None
+
+
+def record_trade(bot_name: str):
+    """Count a successful trade; written to Postgres by the next flush."""
+    pending_trades[bot_name] += 1
+
+
+async def flush_trade_counts():
+    """Write the buffered counts in one atomic statement.
+
+    Counts are keyed by bot and summed per owner inside the UPDATE, so
+    concurrent trades for one user can't overwrite each other. On failure
+    the counts are put back and retried on the next flush.
+    """
+    if not pending_trades:
+        return
+
+    batch = dict(pending_trades)
+    pending_trades.clear()
+    try:
+        await get_pool().execute(
+            """
+            UPDATE users
+            SET trade_count = COALESCE(users.trade_count, 0) + counted.trades
+            FROM (
+                SELECT bots.user_email, SUM(pending.trades) AS trades
+                FROM unnest($1::text[], $2::int[]) AS pending(bot_name, trades)
+                JOIN bots ON bots.name = pending.bot_name
+                GROUP BY bots.user_email
+            ) AS counted
+            WHERE users.email = counted.user_email
+        """, list(batch), list(batch.values()))
+    except Exception as e:
+        logging.error(f"Error writing trade counts: {str(e)}")
+        pending_trades.update(batch)
+
+
+async def run_trade_counter():
+    while True:
+        await asyncio.sleep(TRADE_COUNT_FLUSH_INTERVAL)
+        await flush_trade_counts()
+
+
+def start_trade_counter():
+    """Start the background flush; called on application startup."""
+    global _flush_task
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(run_trade_counter())
+
+
+async def stop_trade_counter():
+    """Stop the background flush and write what is left."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    await flush_trade_counts()
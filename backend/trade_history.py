@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional, Set, Tuple
+
+from backend.db import get_pool
+
+# Longest a finished trade waits before it is written (seconds)
+TRADE_HISTORY_FLUSH_INTERVAL = float(os.getenv("TRADE_HISTORY_FLUSH_INTERVAL", 2))
+
+# Rows buffered while Postgres is unreachable; the oldest are dropped beyond
+TRADE_HISTORY_MAX_PENDING = int(os.getenv("TRADE_HISTORY_MAX_PENDING", 10000))
+
+# Columns written by COPY, in the order of TradeRecord.row()
+COLUMNS = ("signal_at", "bot_name", "user_email", "exchange", "symbol",
+           "action", "quantity", "client_order_id", "signal_key", "subject",
+           "position_before", "status", "message", "requests", "responses",
+           "started_at", "sent_at", "responded_at", "finished_at")
+
+
+def _timestamp(seconds: Optional[float]) -> Optional[datetime]:
+    if seconds is None:
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc)
+
+
+@dataclass
+class TradeRecord:
+    """One signal and what became of it, with a timestamp per stage."""
+    bot_name: str
+    exchange: str
+    symbol: str
+    action: str
+    quantity: float
+    user_email: Optional[str] = None
+    client_order_id: Optional[str] = None
+    signal_key: Optional[str] = None
+    subject: Optional[str] = None
+    position_before: Optional[str] = None
+    status: Optional[str] = None
+    message: Optional[str] = None
+    # Every order sent for the signal (a close, then the open) and the
+    # venue's answer to each
+    requests: List[dict] = field(default_factory=list)
+    responses: List[dict] = field(default_factory=list)
+    # Wall-clock stages: signal received, exchange slot acquired, first
+    # order sent, last venue response, trade finished
+    signal_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    sent_at: Optional[float] = None
+    responded_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def order_sent(self, request: dict):
+        if self.sent_at is None:
+            self.sent_at = time.time()
+        self.requests.append(request)
+
+    def order_answered(self, response: dict):
+        self.responded_at = time.time()
+        self.responses.append(response)
+
+    def row(self) -> Tuple:
+        return (_timestamp(self.signal_at), self.bot_name, self.user_email,
+                self.exchange, self.symbol, self.action, self.quantity,
+                self.client_order_id, self.signal_key, self.subject,
+                self.position_before, self.status, self.message,
+                json.dumps(self.requests, default=str),
+                json.dumps(self.responses, default=str),
+                _timestamp(self.started_at), _timestamp(self.sent_at),
+                _timestamp(self.responded_at), _timestamp(self.finished_at))
+
+
+# Finished trades not yet written to the trades table
+pending_records: List[TradeRecord] = []
+
+# First day of each month whose partition is known to exist
+_partitions: Set[datetime] = set()
+
+_flush_task: Optional[asyncio.Task] = None
+
+
+def record_trade_history(record: TradeRecord):
+    """Queue a finished trade; written to Postgres by the next flush."""
+    if record.finished_at is None:
+        record.finished_at = time.time()
+    pending_records.append(record)
+    if len(pending_records) > TRADE_HISTORY_MAX_PENDING:
+        del pending_records[:len(pending_records) - TRADE_HISTORY_MAX_PENDING]
+
+
+def _month(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+async def ensure_partitions(conn, months):
+    """Create the monthly partitions of trades that rows are about to use."""
+    for month in sorted(set(months) - _partitions):
+        await conn.execute(
+            f"CREATE TABLE IF NOT EXISTS trades_{month:%Y_%m} PARTITION OF trades "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_next_month(month).isoformat()}')")
+        _partitions.add(month)
+
+
+async def flush_trade_history():
+    """Write the buffered trades with a single COPY.
+
+    On failure the rows are put back and retried on the next flush.
+    """
+    if not pending_records:
+        return
+
+    batch = pending_records[:]
+    pending_records.clear()
+    try:
+        rows = [record.row() for record in batch]
+        async with get_pool().acquire() as conn:
+            await ensure_partitions(conn, (_month(row[0]) for row in rows))
+            await conn.copy_records_to_table("trades", records=rows,
+                                             columns=COLUMNS)
+    except Exception as e:
+        logging.error(f"Error writing trade history: {str(e)}")
+        pending_records[:0] = batch
+        if len(pending_records) > TRADE_HISTORY_MAX_PENDING:
+            del pending_records[:len(pending_records) - TRADE_HISTORY_MAX_PENDING]
+
+
+async def run_trade_history():
+    while True:
+        await asyncio.sleep(TRADE_HISTORY_FLUSH_INTERVAL)
+        await flush_trade_history()
+
+
+async def start_trade_history():
+    """Start the background flush; called on application startup.
+
+    This month's and next month's partitions are created up front so the
+    first flushes don't have to.
+    """
+    global _flush_task
+    this_month = _month(datetime.now(timezone.utc))
+    try:
+        async with get_pool().acquire() as conn:
+            await ensure_partitions(conn, [this_month, _next_month(this_month)])
+    except Exception as e:
+        logging.error(f"Error creating trade history partitions: {str(e)}")
+    if _flush_task is None or _flush_task.done():
+        _flush_task = asyncio.create_task(run_trade_history())
+
+
+async def stop_trade_history():
+    """Stop the background flush and write what is left."""
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
+    await flush_trade_history()
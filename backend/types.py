@@ -1,13 +1,14 @@
 
 from dataclasses import dataclass
 from typing import Optional
-import imaplib
 
 @dataclass
 class TradeSignal:
     action: str
     symbol: str
     quantity: float
+    # Deterministic ID sent with the order so retries can be matched to it
+    client_order_id: Optional[str] = None
 
 @dataclass
 class Bot:
@@ -30,5 +31,6 @@ class Bot:
     email_password: str = None
     imap_server: str = None
     email_subject: str = None
-    imap_session: imaplib.IMAP4_SSL = None
+    # Owner, for plan limits
+    user_email: str = None
     monitoring_task = None
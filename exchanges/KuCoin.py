@@ -1,46 +1,109 @@
 
-import aiohttp
-import hmac
-import hashlib
-import base64
-import time
+from exchanges.instruments import format_quantity
+from exchanges.registry import (ExchangeAdapter, exception_result,
+                                read_lookup, read_response, register)
+from exchanges.session import get_session
+from exchanges.signing import ServerClock, encode_body, sign_b64
+from exchanges.streams import FILLED, REJECTED
 
 BASE_URL = "https://api.kucoin.com"
 
+# Response code of a successful request
+SUCCESS = "200000"
+
+# Response code for an invalid KC-API-TIMESTAMP
+TIMESTAMP_REJECTED = "400002"
+
+clock = ServerClock(BASE_URL, "/api/v1/timestamp", lambda body: body["data"])
+
 def generate_kucoin_signature(api_secret, api_passphrase, timestamp, method, endpoint, body=""):
-    """Generate the KuCoin signature."""
-    data_to_sign = f"{timestamp}{method}{endpoint}{body}"
-    signature = base64.b64encode(hmac.new(api_secret.encode(), data_to_sign.encode(), hashlib.sha256).digest()).decode()
-    passphrase = base64.b64encode(hmac.new(api_secret.encode(), api_passphrase.encode(), hashlib.sha256).digest()).decode()
+    """Generate the KuCoin signature over the exact body sent."""
+    signature = sign_b64(api_secret, f"{timestamp}{method}{endpoint}{body}")
+    passphrase = sign_b64(api_secret, api_passphrase)
     return signature, passphrase
 
+def signed_headers(api_key, api_secret, api_passphrase, method, endpoint, body=""):
+    """Headers for a signed KuCoin request (API key version 2)."""
+    timestamp = str(clock.timestamp_ms())
+    signature, passphrase = generate_kucoin_signature(api_secret, api_passphrase, timestamp, method, endpoint, body)
+    return {
+        "KC-API-KEY": api_key,
+        "KC-API-SIGN": signature,
+        "KC-API-TIMESTAMP": timestamp,
+        "KC-API-PASSPHRASE": passphrase,
+        "KC-API-KEY-VERSION": "2",
+        "Content-Type": "application/json",
+    }
+
 async def place_order(api_key, api_secret, api_passphrase, signal):
     """Place an order on KuCoin."""
     endpoint = "/api/v1/orders"
     url = f"{BASE_URL}{endpoint}"
-    method = "POST"
-    timestamp = str(int(time.time() * 1000))
 
     payload = {
         "symbol": signal.symbol,
         "side": signal.action.lower(),
         "type": "market",
-        "size": str(signal.quantity),
+        "size": format_quantity(signal.quantity),
     }
+    if signal.client_order_id:
+        payload["clientOid"] = signal.client_order_id
 
-    signature, passphrase = generate_kucoin_signature(api_secret, api_passphrase, timestamp, method, endpoint, body=str(payload))
-
-    headers = {
-        "KC-API-KEY": api_key,
-        "KC-API-SIGN": signature,
-        "KC-API-TIMESTAMP": timestamp,
-        "KC-API-PASSPHRASE": passphrase,
-        "Content-Type": "application/json",
-    }
+    body = encode_body(payload)
+    headers = signed_headers(api_key, api_secret, api_passphrase, "POST", endpoint, body)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                return await response.json()
+        session = get_session(BASE_URL)
+        async with session.post(url, data=body, headers=headers) as response:
+            return await read_response(
+                response, rejected=lambda body: body.get("code") != SUCCESS,
+                clock=clock,
+                timestamp_rejected=lambda body: body.get("code") == TIMESTAMP_REJECTED)
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return exception_result(e)
+
+
+def order_state(order):
+    """Fill state of a queried order, from its active flag and dealt size."""
+    if float(order.get("dealSize") or 0) > 0:
+        return FILLED
+    if not order.get("isActive") and order.get("cancelExist"):
+        return REJECTED
+    return None
+
+
+async def find_order(api_key, api_secret, api_passphrase, signal):
+    """Look a KuCoin order up by its client order ID."""
+    endpoint = f"/api/v1/order/client-order/{signal.client_order_id}"
+    url = f"{BASE_URL}{endpoint}"
+    headers = signed_headers(api_key, api_secret, api_passphrase, "GET", endpoint)
+
+    try:
+        session = get_session(BASE_URL)
+        async with session.get(url, headers=headers) as response:
+            return await read_lookup(
+                response, lambda body: body.get("data"),
+                lambda status, body: status == 404 or
+                (body.get("code") == SUCCESS and not body.get("data")),
+                order_state)
+    except Exception:
+        return None
+
+
+@register("kucoin")
+class KuCoinAdapter(ExchangeAdapter):
+    """KuCoin takes its API passphrase from the bot's account_id field."""
+    display_name = "KuCoin"
+    base_url = BASE_URL
+    credentials = ("api_key", "api_secret", "account_id")
+    symbol_separator = "-"
+
+    async def place_order(self, signal):
+        return await place_order(self.bot.api_key, self.bot.api_secret,
+                                 self.bot.account_id,
+                                 self.venue_signal(signal))
+
+    async def find_order(self, signal):
+        return await find_order(self.bot.api_key, self.bot.api_secret,
+                                self.bot.account_id,
+                                self.venue_signal(signal))
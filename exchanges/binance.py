@@ -1,24 +1,245 @@
+import asyncio
+import os
+import time
+from decimal import Decimal
+from urllib.parse import urlencode
+
 import aiohttp
+from yarl import URL
+
+from exchanges.instruments import Instrument, format_quantity
+from exchanges.ratelimit import get_limiter, retry_after_seconds
+from exchanges.registry import (ExchangeAdapter, error_result,
+                                exception_result, read_lookup, read_response,
+                                register)
+from exchanges.session import get_session
+from exchanges.signing import RECV_WINDOW, ServerClock, sign_hex
+from exchanges.streams import FILLED, REJECTED
+
+# REST API host (order, listenKey and metadata endpoints)
+BASE_URL = os.getenv("BINANCE_BASE_URL", "https://api.binance.com")
+
+# User data stream endpoint; the listenKey is appended
+STREAM_URL = os.getenv("BINANCE_STREAM_URL", "wss://stream.binance.com:9443/ws")
+
+# listenKeys expire after 60 minutes unless kept alive (seconds)
+LISTEN_KEY_KEEPALIVE = 30 * 60
+
+# executionReport order status -> fill stream state
+ORDER_STATES = {
+    "PARTIALLY_FILLED": FILLED,
+    "FILLED": FILLED,
+    "CANCELED": REJECTED,
+    "REJECTED": REJECTED,
+    "EXPIRED": REJECTED,
+    "EXPIRED_IN_MATCH": REJECTED,
+}
+
+# Request weight allowed per minute (Binance REQUEST_WEIGHT limit)
+WEIGHT_LIMIT = int(os.getenv("BINANCE_WEIGHT_LIMIT", 6000))
+
+# Weight of POST /api/v3/order
+ORDER_WEIGHT = 1
+
+# Weight of GET /api/v3/order
+QUERY_WEIGHT = 4
+
+# Weight of GET /api/v3/exchangeInfo and /api/v3/ticker/price (all symbols)
+EXCHANGE_INFO_WEIGHT = 20
+TICKER_WEIGHT = 4
+
+# Error code for "Order does not exist"
+UNKNOWN_ORDER = -2013
+
+# Error code for a timestamp outside the recvWindow
+TIMESTAMP_REJECTED = -1021
+
+clock = ServerClock(BASE_URL, "/api/v3/time", lambda body: body["serverTime"])
 
-BASE_URL = "https://api.binance.com"
+
+def signed_query(api_secret, params):
+    """Encode params with a timestamp and sign the exact query string."""
+    query = urlencode({**params,
+                       "timestamp": clock.timestamp_ms(),
+                       "recvWindow": RECV_WINDOW})
+    return f"{query}&signature={sign_hex(api_secret, query)}"
+
+
+def weight_limiter(api_key):
+    return get_limiter("binance", api_key, WEIGHT_LIMIT, WEIGHT_LIMIT / 60)
+
+
+def observe_limits(limiter, response):
+    """Sync the limiter with the used weight Binance reports."""
+    used = response.headers.get("X-MBX-USED-WEIGHT-1M") or \
+        response.headers.get("X-MBX-USED-WEIGHT")
+    retry_after = None
+    if response.status in (418, 429):
+        # 429: slow down; 418: the IP is banned until Retry-After
+        retry_after = retry_after_seconds(
+            response.headers.get("Retry-After")) or 60
+    limiter.observe(remaining=WEIGHT_LIMIT - int(used) if used else None,
+                    retry_after=retry_after)
 
 async def place_order(api_key, api_secret, signal):
     """Place an order on Binance."""
     url = f"{BASE_URL}/api/v3/order"
     headers = {
         "X-MBX-APIKEY": api_key,
+        "Content-Type": "application/x-www-form-urlencoded",
     }
 
     payload = {
         "symbol": signal.symbol,
         "side": signal.action.upper(),
         "type": "MARKET",
-        "quantity": signal.quantity,
+        "quantity": format_quantity(signal.quantity),
     }
+    if signal.client_order_id:
+        payload["newClientOrderId"] = signal.client_order_id
+
+    limiter = weight_limiter(api_key)
+    if not await limiter.acquire(ORDER_WEIGHT):
+        return error_result("Binance request weight exhausted, order not sent",
+                            transient=True, sent=False)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, params=payload, headers=headers) as response:
-                return await response.json()
+        session = get_session(BASE_URL)
+        body = signed_query(api_secret, payload)
+        async with session.post(url, data=body, headers=headers) as response:
+            observe_limits(limiter, response)
+            return await read_response(
+                response, clock=clock,
+                timestamp_rejected=lambda body: body.get("code") == TIMESTAMP_REJECTED)
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return exception_result(e)
+
+
+def order_state(order):
+    """Fill state of a queried order; canceled after a partial fill is FILLED."""
+    if float(order.get("executedQty") or 0) > 0:
+        return FILLED
+    return ORDER_STATES.get(order.get("status"))
+
+
+async def find_order(api_key, api_secret, signal):
+    """Look a Binance order up by its client order ID."""
+    url = f"{BASE_URL}/api/v3/order"
+    headers = {
+        "X-MBX-APIKEY": api_key,
+    }
+
+    params = {
+        "symbol": signal.symbol,
+        "origClientOrderId": signal.client_order_id,
+    }
+
+    limiter = weight_limiter(api_key)
+    if not await limiter.acquire(QUERY_WEIGHT):
+        return None
+
+    try:
+        session = get_session(BASE_URL)
+        signed_url = URL(f"{url}?{signed_query(api_secret, params)}",
+                         encoded=True)
+        async with session.get(signed_url, headers=headers) as response:
+            observe_limits(limiter, response)
+            return await read_lookup(
+                response, lambda body: body,
+                lambda status, body: body.get("code") == UNKNOWN_ORDER,
+                order_state)
+    except Exception:
+        return None
+
+
+async def load_instruments(api_key):
+    """Load lot size and notional filters, with last prices, for every symbol."""
+    limiter = weight_limiter(api_key)
+    if not await limiter.acquire(EXCHANGE_INFO_WEIGHT + TICKER_WEIGHT):
+        return None
+
+    session = get_session(BASE_URL)
+    async with session.get(f"{BASE_URL}/api/v3/exchangeInfo") as response:
+        observe_limits(limiter, response)
+        info = await response.json()
+    async with session.get(f"{BASE_URL}/api/v3/ticker/price") as response:
+        observe_limits(limiter, response)
+        prices = {ticker["symbol"]: Decimal(ticker["price"])
+                  for ticker in await response.json()}
+
+    instruments = {}
+    for symbol in info["symbols"]:
+        filters = {f["filterType"]: f for f in symbol["filters"]}
+        lot = filters.get("LOT_SIZE", {})
+        market_lot = filters.get("MARKET_LOT_SIZE", {})
+        # NOTIONAL replaced MIN_NOTIONAL; either may apply to market orders
+        notional = filters.get("NOTIONAL") or filters.get("MIN_NOTIONAL") or {}
+        applies = notional.get("applyMinToMarket", notional.get("applyToMarket", True))
+
+        max_qty = Decimal(market_lot.get("maxQty") or lot.get("maxQty") or 0)
+        instruments[symbol["symbol"]] = Instrument(
+            symbol=symbol["symbol"],
+            step_size=Decimal(lot.get("stepSize", 0)),
+            min_qty=Decimal(lot.get("minQty", 0)),
+            max_qty=max_qty or None,
+            min_notional=Decimal(notional["minNotional"]) if applies and notional else None,
+            price=prices.get(symbol["symbol"]))
+    return instruments
+
+
+async def stream_fills(api_key, report, connected):
+    """Follow an account's executionReport events on its user data stream."""
+    session = get_session(BASE_URL)
+    url = f"{BASE_URL}/api/v3/userDataStream"
+    headers = {"X-MBX-APIKEY": api_key}
+    async with session.post(url, headers=headers) as response:
+        listen_key = (await response.json())["listenKey"]
+
+    async with get_session(STREAM_URL).ws_connect(
+            f"{STREAM_URL}/{listen_key}", heartbeat=60) as ws:
+        connected()
+        keepalive_at = time.monotonic() + LISTEN_KEY_KEEPALIVE
+        while True:
+            try:
+                message = await ws.receive(
+                    timeout=max(keepalive_at - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                async with session.put(url, headers=headers,
+                                       params={"listenKey": listen_key}):
+                    pass
+                keepalive_at = time.monotonic() + LISTEN_KEY_KEEPALIVE
+                continue
+
+            if message.type != aiohttp.WSMsgType.TEXT:
+                return
+            event = message.json()
+            if event.get("e") == "executionReport":
+                # "C" holds the original ID when the order was canceled
+                report(event.get("C") or event.get("c"),
+                       ORDER_STATES.get(event.get("X")))
+
+
+@register("binance")
+class BinanceAdapter(ExchangeAdapter):
+    display_name = "Binance"
+    base_url = BASE_URL
+
+    def rate_limit(self):
+        return weight_limiter(self.bot.api_key).state()
+
+    async def load_instruments(self):
+        return await load_instruments(self.bot.api_key)
+
+    def stream_key(self):
+        return ("binance", self.bot.api_key)
+
+    async def stream_fills(self, report, connected):
+        await stream_fills(self.bot.api_key, report, connected)
+
+    async def place_order(self, signal):
+        return await place_order(self.bot.api_key, self.bot.api_secret,
+                                 self.venue_signal(signal))
+
+    async def find_order(self, signal):
+        return await find_order(self.bot.api_key, self.bot.api_secret,
+                                self.venue_signal(signal))
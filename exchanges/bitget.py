@@ -1,49 +1,111 @@
 
-import aiohttp
+from urllib.parse import urlencode
+
+from yarl import URL
+
+from exchanges.instruments import format_quantity
+from exchanges.registry import (ExchangeAdapter, exception_result,
+                                read_lookup, read_response, register)
+from exchanges.session import get_session
+from exchanges.signing import ServerClock, encode_body, sign_b64
+from exchanges.streams import FILLED, REJECTED
 
 BASE_URL = "https://api.bitget.com"
 
-async def place_order(api_key, api_secret, passphrase, signal):
-    """Place an order on Bitget."""
-    url = f"{BASE_URL}/api/v2/spot/order"
-    headers = {
+# Response code of a successful request
+SUCCESS = "00000"
+
+# Response code for an expired request timestamp
+TIMESTAMP_REJECTED = "40008"
+
+clock = ServerClock(BASE_URL, "/api/v2/public/time",
+                    lambda body: int(body["data"]["serverTime"]))
+
+
+def signed_headers(api_key, api_secret, passphrase, method, path, body=""):
+    """Headers signing the exact request path (with query) and body sent."""
+    timestamp = str(clock.timestamp_ms())
+    return {
         "ACCESS-KEY": api_key,
+        "ACCESS-SIGN": sign_b64(api_secret, f"{timestamp}{method}{path}{body}"),
+        "ACCESS-TIMESTAMP": timestamp,
         "ACCESS-PASSPHRASE": passphrase,
+        "Content-Type": "application/json",
+        "locale": "en-US",
     }
 
+
+async def place_order(api_key, api_secret, passphrase, signal):
+    """Place an order on Bitget."""
+    path = "/api/v2/spot/trade/place-order"
+    url = f"{BASE_URL}{path}"
+
     payload = {
         "symbol": signal.symbol,
         "side": signal.action.lower(),
         "orderType": "market",
-        "quantity": signal.quantity,
+        "force": "gtc",
+        "size": format_quantity(signal.quantity),
     }
+    if signal.client_order_id:
+        payload["clientOid"] = signal.client_order_id
+
+    body = encode_body(payload)
+    headers = signed_headers(api_key, api_secret, passphrase, "POST", path, body)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                return await response.json()
+        session = get_session(BASE_URL)
+        async with session.post(url, data=body, headers=headers) as response:
+            return await read_response(
+                response, rejected=lambda body: body.get("code") != SUCCESS,
+                clock=clock,
+                timestamp_rejected=lambda body: body.get("code") == TIMESTAMP_REJECTED)
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return exception_result(e)
 
 
-# 📈 Update the bot manager to include Bitget
-from exchanges import binance, bybit, kucoin, okx, bitget
+def order_state(order):
+    """Fill state of a queried order; canceled after a partial fill is FILLED."""
+    if float(order.get("baseVolume") or 0) > 0:
+        return FILLED
+    if order.get("status") == "cancelled":
+        return REJECTED
+    return None
+
+
+async def find_order(api_key, api_secret, passphrase, signal):
+    """Look a Bitget order up by its client order ID."""
+    path = "/api/v2/spot/trade/orderInfo?" + urlencode({
+        "clientOid": signal.client_order_id,
+    })
+    headers = signed_headers(api_key, api_secret, passphrase, "GET", path)
+
+    try:
+        session = get_session(BASE_URL)
+        async with session.get(URL(f"{BASE_URL}{path}", encoded=True),
+                               headers=headers) as response:
+            return await read_lookup(
+                response, lambda body: (body.get("data") or [None])[0],
+                lambda status, body: body.get("code") == SUCCESS and
+                not body.get("data"),
+                order_state)
+    except Exception:
+        return None
 
-async def place_trade(bot, api_key, api_secret, passphrase, signal):
-    exchange = bot["exchange"]
 
-    if exchange == "binance":
-        return await binance.place_order(api_key, api_secret, signal)
-    elif exchange == "bybit":
-        return await bybit.place_order(api_key, api_secret, signal)
-    elif exchange == "kucoin":
-        return await kucoin.place_order(api_key, api_secret, signal)
-    elif exchange == "okx":
-        return await okx.place_order(api_key, api_secret, signal)
-    elif exchange == "bitget":
-        return await bitget.place_order(api_key, api_secret, passphrase, signal)
-    else:
-        return {"status": "error", "message": "Unsupported exchange"}
+@register("bitget")
+class BitgetAdapter(ExchangeAdapter):
+    """Bitget takes its API passphrase from the bot's account_id field."""
+    display_name = "Bitget"
+    base_url = BASE_URL
+    credentials = ("api_key", "api_secret", "account_id")
 
+    async def place_order(self, signal):
+        return await place_order(self.bot.api_key, self.bot.api_secret,
+                                 self.bot.account_id,
+                                 self.venue_signal(signal))
 
-# ✅ Bitget is ready to go! Want me to add more features, like stop-loss or leverage trades? Let me know! 🚀
+    async def find_order(self, signal):
+        return await find_order(self.bot.api_key, self.bot.api_secret,
+                                self.bot.account_id,
+                                self.venue_signal(signal))
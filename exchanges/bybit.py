@@ -1,25 +1,266 @@
+import asyncio
+import os
+import time
+from decimal import Decimal
+from urllib.parse import urlencode
+
 import aiohttp
+from yarl import URL
+
+from exchanges.instruments import Instrument, format_quantity
+from exchanges.ratelimit import get_limiter
+from exchanges.registry import (ExchangeAdapter, error_result,
+                                exception_result, read_lookup, read_response,
+                                register)
+from exchanges.session import get_session
+from exchanges.signing import (RECV_WINDOW, ServerClock, encode_body,
+                               sign_hex)
+from exchanges.streams import FILLED, REJECTED
 
 BASE_URL = "https://api.bybit.com"
 
+# Private WebSocket endpoint
+STREAM_URL = os.getenv("BYBIT_STREAM_URL", "wss://stream.bybit.com/v5/private")
+
+# Bybit drops private connections without a ping for this long (seconds)
+STREAM_PING_INTERVAL = 20
+
+# orderStatus -> fill stream state
+ORDER_STATES = {
+    "PartiallyFilled": FILLED,
+    "PartiallyFilledCanceled": FILLED,
+    "Filled": FILLED,
+    "Cancelled": REJECTED,
+    "Rejected": REJECTED,
+    "Deactivated": REJECTED,
+}
+
+# Order requests allowed per second and key
+ORDER_RATE_LIMIT = int(os.getenv("BYBIT_ORDER_RATE_LIMIT", 10))
+
+# Product type traded by bots: linear (USDT perpetuals), inverse or spot
+CATEGORY = os.getenv("BYBIT_CATEGORY", "linear")
+
+# retCode for "too many visits"
+RATE_LIMIT_ERROR = 10006
+
+# retCode for a timestamp outside the recv window
+TIMESTAMP_REJECTED = 10002
+
+clock = ServerClock(BASE_URL, "/v5/market/time",
+                    lambda body: int(body["result"]["timeNano"]) / 1e6)
+
+
+def signed_headers(api_key, api_secret, payload):
+    """Headers signing the exact query string or JSON body sent."""
+    timestamp = str(clock.timestamp_ms())
+    recv_window = str(RECV_WINDOW)
+    signature = sign_hex(api_secret,
+                         f"{timestamp}{api_key}{recv_window}{payload}")
+    return {
+        "X-BAPI-API-KEY": api_key,
+        "X-BAPI-TIMESTAMP": timestamp,
+        "X-BAPI-RECV-WINDOW": recv_window,
+        "X-BAPI-SIGN": signature,
+        "Content-Type": "application/json",
+    }
+
+
+def order_limiter(api_key):
+    return get_limiter("bybit", api_key, ORDER_RATE_LIMIT, ORDER_RATE_LIMIT)
+
+
+def observe_limits(limiter, response, result):
+    """Sync the limiter with the X-Bapi-Limit headers and 10006 errors."""
+    remaining = response.headers.get("X-Bapi-Limit-Status", "")
+    reset_at = response.headers.get("X-Bapi-Limit-Reset-Timestamp", "")
+    remaining = int(remaining) if remaining.isdigit() else None
+
+    if response.status == 429 or (isinstance(result, dict) and result.get(
+            "retCode", result.get("ret_code")) == RATE_LIMIT_ERROR):
+        remaining = 0
+
+    retry_after = None
+    if remaining == 0:
+        # Blocked until the window resets
+        retry_after = 1
+        if reset_at.isdigit():
+            retry_after = max(int(reset_at) / 1000 - time.time(), 1)
+    limiter.observe(remaining=remaining, retry_after=retry_after)
+
 async def place_order(api_key, api_secret, signal):
     """Place an order on Bybit."""
-    url = f"{BASE_URL}/v2/private/order/create"
-    headers = {
-        "X-BYBIT-API-KEY": api_key,
-    }
+    url = f"{BASE_URL}/v5/order/create"
 
     payload = {
+        "category": CATEGORY,
         "symbol": signal.symbol,
-        "side": signal.action.upper(),
-        "order_type": "Market",
-        "qty": signal.quantity,
-        "time_in_force": "GoodTillCancel",
+        "side": signal.action.capitalize(),
+        "orderType": "Market",
+        "qty": format_quantity(signal.quantity),
     }
+    if signal.client_order_id:
+        payload["orderLinkId"] = signal.client_order_id
+
+    limiter = order_limiter(api_key)
+    if not await limiter.acquire():
+        return error_result("Bybit order rate limit reached, order not sent",
+                            transient=True, sent=False)
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                return await response.json()
+        session = get_session(BASE_URL)
+        body = encode_body(payload)
+        headers = signed_headers(api_key, api_secret, body)
+        async with session.post(url, data=body, headers=headers) as response:
+            result = await read_response(
+                response, rejected=ret_code, clock=clock,
+                timestamp_rejected=lambda body: ret_code(body) == TIMESTAMP_REJECTED)
+            reply = result.get("body", result)
+            observe_limits(limiter, response, reply)
+            if ret_code(reply) == RATE_LIMIT_ERROR:
+                # Refused before matching, so the order does not exist
+                return error_result(result["message"], transient=True,
+                                    sent=False)
+            return result
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return exception_result(e)
+
+
+def ret_code(body):
+    """Return Bybit's non-zero error code in a response body, if any."""
+    if not isinstance(body, dict):
+        return None
+    return body.get("retCode", body.get("ret_code")) or None
+
+
+
+def order_list(body):
+    """Return the orders in a v5 query response."""
+    return (body.get("result") or {}).get("list")
+
+
+async def find_order(api_key, api_secret, signal):
+    """Look a Bybit order up by its order link ID."""
+    url = f"{BASE_URL}/v5/order/realtime"
+
+    query = urlencode({
+        "category": CATEGORY,
+        "symbol": signal.symbol,
+        "orderLinkId": signal.client_order_id,
+    })
+
+    try:
+        session = get_session(BASE_URL)
+        headers = signed_headers(api_key, api_secret, query)
+        async with session.get(URL(f"{url}?{query}", encoded=True),
+                               headers=headers) as response:
+            return await read_lookup(
+                response, lambda body: (order_list(body) or [None])[0],
+                lambda status, body: ret_code(body) is None and
+                not order_list(body),
+                lambda order: ORDER_STATES.get(order.get("orderStatus")))
+    except Exception:
+        return None
+
+
+async def load_instruments():
+    """Load the lot size filters, with last prices, of CATEGORY's symbols."""
+    session = get_session(BASE_URL)
+    listed = []
+    cursor = ""
+    while True:
+        params = {"category": CATEGORY, "limit": 1000}
+        if cursor:
+            params["cursor"] = cursor
+        async with session.get(f"{BASE_URL}/v5/market/instruments-info",
+                               params=params) as response:
+            result = (await response.json())["result"]
+        listed.extend(result["list"])
+        cursor = result.get("nextPageCursor")
+        if not cursor:
+            break
+
+    async with session.get(f"{BASE_URL}/v5/market/tickers",
+                           params={"category": CATEGORY}) as response:
+        prices = {ticker["symbol"]: Decimal(ticker["lastPrice"])
+                  for ticker in (await response.json())["result"]["list"]}
+
+    instruments = {}
+    for symbol in listed:
+        lot = symbol["lotSizeFilter"]
+        # Spot quotes its step as basePrecision and its notional as minOrderAmt
+        step = lot.get("qtyStep") or lot.get("basePrecision") or 0
+        max_qty = lot.get("maxMktOrderQty") or lot.get("maxOrderQty")
+        min_notional = lot.get("minNotionalValue") or lot.get("minOrderAmt")
+        instruments[symbol["symbol"]] = Instrument(
+            symbol=symbol["symbol"],
+            step_size=Decimal(step),
+            min_qty=Decimal(lot.get("minOrderQty") or 0),
+            max_qty=Decimal(max_qty) if max_qty else None,
+            min_notional=Decimal(min_notional) if min_notional else None,
+            price=prices.get(symbol["symbol"]))
+    return instruments
+
+
+async def stream_fills(api_key, api_secret, report, connected):
+    """Follow an account's order topic on the private WebSocket."""
+    async with get_session(STREAM_URL).ws_connect(STREAM_URL) as ws:
+        expires = clock.timestamp_ms() + 10000
+        await ws.send_json({
+            "op": "auth",
+            "args": [api_key, expires,
+                     sign_hex(api_secret, f"GET/realtime{expires}")]
+        })
+        await ws.send_json({"op": "subscribe", "args": ["order"]})
+
+        while True:
+            try:
+                message = await ws.receive(timeout=STREAM_PING_INTERVAL)
+            except asyncio.TimeoutError:
+                await ws.send_json({"op": "ping"})
+                continue
+
+            if message.type != aiohttp.WSMsgType.TEXT:
+                return
+            event = message.json()
+            if event.get("op") in ("auth", "subscribe"):
+                if not event.get("success"):
+                    raise Exception(f"Bybit stream {event['op']} failed: {event}")
+                if event["op"] == "subscribe":
+                    connected()
+            elif event.get("topic") == "order":
+                for order in event.get("data", []):
+                    report(order.get("orderLinkId"),
+                           ORDER_STATES.get(order.get("orderStatus")))
+
+
+@register("bybit")
+class BybitAdapter(ExchangeAdapter):
+    display_name = "Bybit"
+    base_url = BASE_URL
+    # One-way mode derivatives net a 2x opposite order into a reversal. Spot
+    # has no position to net, and hedge mode (positionIdx 1/2) would open
+    # the other side instead, so accounts in hedge mode need
+    # POSITION_REVERSAL=close_then_open.
+    supports_reversal = CATEGORY != "spot"
+
+    def rate_limit(self):
+        return order_limiter(self.bot.api_key).state()
+
+    async def load_instruments(self):
+        return await load_instruments()
+
+    def stream_key(self):
+        return ("bybit", self.bot.api_key)
+
+    async def stream_fills(self, report, connected):
+        await stream_fills(self.bot.api_key, self.bot.api_secret, report,
+                           connected)
+
+    async def place_order(self, signal):
+        return await place_order(self.bot.api_key, self.bot.api_secret,
+                                 self.venue_signal(signal))
+
+    async def find_order(self, signal):
+        return await find_order(self.bot.api_key, self.bot.api_secret,
+                                self.venue_signal(signal))
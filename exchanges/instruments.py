@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from decimal import ROUND_DOWN, Decimal
+from typing import Dict, Optional, Tuple
+
+# Instrument metadata older than this is refreshed in the background (seconds)
+INSTRUMENT_CACHE_TTL = float(os.getenv("INSTRUMENT_CACHE_TTL", 3600))
+
+# Metadata older than this is evicted and reloaded before use (seconds)
+INSTRUMENT_CACHE_MAX_AGE = float(os.getenv("INSTRUMENT_CACHE_MAX_AGE", 86400))
+
+# Minimum delay between load attempts while a venue's metadata is missing
+INSTRUMENT_RETRY_INTERVAL = float(os.getenv("INSTRUMENT_RETRY_INTERVAL", 60))
+
+
+@dataclass
+class Instrument:
+    """Order size rules of one symbol on one venue."""
+    symbol: str
+    step_size: Decimal
+    min_qty: Decimal = Decimal(0)
+    max_qty: Optional[Decimal] = None
+    min_notional: Optional[Decimal] = None
+    # Reference price for the notional check, as of the last refresh
+    price: Optional[Decimal] = None
+
+    def check_quantity(self, quantity: float) -> Tuple[Decimal, Optional[str]]:
+        """Round a quantity down to the step size and validate it.
+
+        Returns:
+            tuple: (rounded quantity, reason it would be rejected or None)
+        """
+        qty = Decimal(str(quantity))
+        if self.step_size > 0:
+            qty = (qty / self.step_size).to_integral_value(
+                rounding=ROUND_DOWN) * self.step_size
+
+        if qty <= 0 or qty < self.min_qty:
+            return qty, f"Quantity {quantity} is below the minimum of {self.min_qty} for {self.symbol}"
+        if self.max_qty is not None and qty > self.max_qty:
+            return qty, f"Quantity {quantity} is above the maximum of {self.max_qty} for {self.symbol}"
+        if self.min_notional and self.price and qty * self.price < self.min_notional:
+            return qty, f"Order value {qty * self.price} is below the minimum notional of {self.min_notional} for {self.symbol}"
+        return qty, None
+
+
+def format_quantity(quantity) -> str:
+    """Write an order size in plain decimal notation for a venue.
+
+    str() of a small float or Decimal may use an exponent ("5e-05"), which
+    venues reject.
+    """
+    return f"{Decimal(str(quantity)):f}"
+
+
+class InstrumentCache:
+    """Instrument metadata of one venue, loaded lazily by its adapter.
+
+    The first lookup waits for adapter.load_instruments(). Later lookups
+    are served from memory; once the data is older than
+    INSTRUMENT_CACHE_TTL it is refreshed in the background, and once it is
+    older than INSTRUMENT_CACHE_MAX_AGE it is evicted and reloaded first.
+    """
+
+    def __init__(self):
+        self.instruments: Dict[str, Instrument] = {}
+        self.loaded_at = 0.0
+        self.attempted_at = None
+        self.lock = asyncio.Lock()
+        self.refresh_task: Optional[asyncio.Task] = None
+
+    def age(self) -> float:
+        return time.monotonic() - self.loaded_at
+
+    async def refresh(self, adapter) -> bool:
+        async with self.lock:
+            self.attempted_at = time.monotonic()
+            try:
+                instruments = await adapter.load_instruments()
+            except Exception:
+                instruments = None
+            if not instruments:
+                return False
+            self.instruments = instruments
+            self.loaded_at = time.monotonic()
+            return True
+
+    async def get(self, adapter, symbol: str) -> Optional[Instrument]:
+        if not self.instruments or self.age() > INSTRUMENT_CACHE_MAX_AGE:
+            self.instruments = {}
+            # Don't hold every order up while the venue is unreachable
+            if self.attempted_at is None or \
+                    time.monotonic() - self.attempted_at > INSTRUMENT_RETRY_INTERVAL:
+                await self.refresh(adapter)
+        elif self.age() > INSTRUMENT_CACHE_TTL and (
+                self.refresh_task is None or self.refresh_task.done()):
+            self.refresh_task = asyncio.create_task(self.refresh(adapter))
+        return self.instruments.get(symbol)
+
+
+# adapter.instrument_key() -> cache
+instrument_caches: Dict[tuple, InstrumentCache] = {}
+
+
+async def get_instrument(adapter) -> Tuple[Optional[Instrument], bool]:
+    """Return the metadata of an adapter's symbol.
+
+    Returns:
+        tuple: (instrument or None, whether the venue's metadata is loaded;
+        if it is loaded and the instrument is None the symbol is unknown)
+    """
+    key = adapter.instrument_key()
+    if key not in instrument_caches:
+        instrument_caches[key] = InstrumentCache()
+    cache = instrument_caches[key]
+    instrument = await cache.get(adapter, adapter.symbol)
+    return instrument, bool(cache.instruments)
+
+
+async def check_order_size(adapter, quantity: float) -> Tuple[Decimal, Optional[str]]:
+    """Round and validate a quantity for an adapter's symbol.
+
+    Venues without metadata, or whose metadata cannot be loaded right now,
+    pass the quantity through unchanged and leave validation to the venue.
+    Rounded quantities are exact Decimals; adapters send them with
+    format_quantity.
+
+    Returns:
+        tuple: (quantity to send, reason the order would be rejected or None)
+    """
+    instrument, loaded = await get_instrument(adapter)
+    if instrument is None:
+        if loaded:
+            return quantity, f"Unknown symbol {adapter.symbol} on {adapter.display_name}"
+        return quantity, None
+    return instrument.check_quantity(quantity)
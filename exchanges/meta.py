@@ -1,48 +1,152 @@
-import aiohttp
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
 
-# MetaTrader5 API base URL (hypothetical for example)
-METATRADER5_BASE_URL = "http://localhost:5000/api"  # Assuming MetaTrader5 API is running locally
+from exchanges.registry import (ExchangeAdapter, exception_result,
+                                read_lookup, read_response, register)
+from exchanges.session import get_session
 
-async def place_order_metatrader5(login, password, server, signal):
-    """Place an order on MetaTrader5 using login credentials."""
-    url = f"{METATRADER5_BASE_URL}/trade"
-    headers = {
-        "Content-Type": "application/json",
-    }
+# Local MetaTrader5 bridge
+METATRADER5_BASE_URL = os.getenv("METATRADER5_BASE_URL", "http://localhost:5000/api")
+
+# Lifetime assumed for bridge session tokens when the bridge doesn't say (seconds)
+METATRADER5_SESSION_TTL = float(os.getenv("METATRADER5_SESSION_TTL", 3600))
+
+# Tokens are renewed this long before they expire (seconds)
+METATRADER5_SESSION_RENEW_MARGIN = float(os.getenv("METATRADER5_SESSION_RENEW_MARGIN", 60))
+
+
+@dataclass
+class BridgeSession:
+    """Bridge login of one MT5 account; the bridge keeps the broker session."""
+    token: Optional[str] = None
+    expires_at: float = 0.0
+    # One login at a time per account
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def valid(self) -> bool:
+        return self.token is not None and \
+            time.monotonic() < self.expires_at - METATRADER5_SESSION_RENEW_MARGIN
+
+
+# (login, server) -> bridge session
+bridge_sessions: Dict[Tuple[str, str], BridgeSession] = {}
+
+
+async def bridge_token(login, password, server, renew=False):
+    """Return the account's session token, logging in to the bridge if needed.
+
+    Args:
+        renew: log in again even if the token looks valid (the bridge
+            rejected it)
+    """
+    key = (str(login), server)
+    if key not in bridge_sessions:
+        bridge_sessions[key] = BridgeSession()
+    bridge = bridge_sessions[key]
+    stale_token = bridge.token if renew else None
+
+    async with bridge.lock:
+        # Another request may have logged in while this one waited
+        if bridge.valid() and bridge.token != stale_token:
+            return bridge.token
+
+        session = get_session(METATRADER5_BASE_URL)
+        payload = {
+            "login": login,
+            "password": password,
+            "server": server,
+        }
+        async with session.post(f"{METATRADER5_BASE_URL}/session",
+                                json=payload) as response:
+            body = await response.json(content_type=None)
+            if response.status >= 400 or not body.get("token"):
+                bridge.token = None
+                raise Exception(f"MetaTrader5 bridge login failed: {body}")
+
+        bridge.token = body["token"]
+        bridge.expires_at = time.monotonic() + float(
+            body.get("expires_in") or METATRADER5_SESSION_TTL)
+        return bridge.token
+
+
+async def bridge_request(method, path, login, password, server, reader, **kwargs):
+    """Send a request with the account's session token and read it with reader.
+
+    A 401 means the bridge dropped the session before the request ran, so
+    it is sent once more with a fresh login.
+    """
+    session = get_session(METATRADER5_BASE_URL)
+    renew = False
+    while True:
+        token = await bridge_token(login, password, server, renew=renew)
+        headers = {"Authorization": f"Bearer {token}"}
+        async with session.request(method, f"{METATRADER5_BASE_URL}{path}",
+                                   headers=headers, **kwargs) as response:
+            if response.status == 401 and not renew:
+                renew = True
+                continue
+            return await reader(response)
 
+
+async def close_bridge_sessions():
+    """Log every account out of the bridge; called on application shutdown."""
+    session = get_session(METATRADER5_BASE_URL)
+    for bridge in list(bridge_sessions.values()):
+        if not bridge.valid():
+            continue
+        try:
+            async with session.delete(
+                    f"{METATRADER5_BASE_URL}/session",
+                    headers={"Authorization": f"Bearer {bridge.token}"}):
+                pass
+        except Exception:
+            pass
+    bridge_sessions.clear()
+
+
+async def place_order_metatrader5(login, password, server, signal):
+    """Place an order on MetaTrader5 through the account's bridge session."""
     payload = {
-        "login": login,
-        "password": password,
-        "server": server,
         "symbol": signal.symbol,
         "action": signal.action.lower(),
-        "quantity": signal.quantity,
+        "quantity": float(signal.quantity),
         "type": "MARKET",  # Assuming a MARKET order for simplicity
+        "client_order_id": signal.client_order_id,
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                return await response.json()
+        return await bridge_request("POST", "/trade", login, password, server,
+                                    read_response, json=payload)
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return exception_result(e)
 
 
-async def get_account_details_metatrader5(login, server):
+async def find_order_metatrader5(login, password, server, signal):
+    """Look a MetaTrader5 order up by its client order ID."""
+
+    async def read(response):
+        return await read_lookup(response, lambda body: body,
+                                 lambda status, body: status == 404)
+
+    try:
+        return await bridge_request("GET", f"/trade/{signal.client_order_id}",
+                                    login, password, server, read)
+    except Exception:
+        return None
+
+
+async def get_account_details_metatrader5(login, password, server):
     """Fetch account details for MetaTrader5."""
-    url = f"{METATRADER5_BASE_URL}/accounts/{login}"
-    headers = {
-        "Content-Type": "application/json",
-    }
 
-    params = {
-        "server": server
-    }
+    async def read(response):
+        return await response.json()
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                return await response.json()
+        return await bridge_request("GET", f"/accounts/{login}", login,
+                                    password, server, read)
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -53,3 +157,26 @@ class TradeSignal:
         self.action = action
         self.symbol = symbol
         self.quantity = quantity
+
+
+@register("metatrader5")
+class MetaTrader5Adapter(ExchangeAdapter):
+    display_name = "MetaTrader5"
+    base_url = METATRADER5_BASE_URL
+    credentials = ("login", "password", "server")
+
+    def map_symbol(self, symbol):
+        # Broker symbols carry their own suffixes (e.g. "XAUUSD.m")
+        return symbol
+
+    async def place_order(self, signal):
+        return await place_order_metatrader5(self.bot.login,
+                                             self.bot.password,
+                                             self.bot.server,
+                                             self.venue_signal(signal))
+
+    async def find_order(self, signal):
+        return await find_order_metatrader5(self.bot.login,
+                                            self.bot.password,
+                                            self.bot.server,
+                                            self.venue_signal(signal))
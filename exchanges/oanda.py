@@ -1,9 +1,38 @@
+import json
+import os
+from decimal import Decimal
+
 import aiohttp
 
+from exchanges.instruments import Instrument, format_quantity
+from exchanges.registry import (ExchangeAdapter, exception_result,
+                                read_lookup, read_response, register)
+from exchanges.session import get_session
+from exchanges.streams import FILLED, REJECTED
+
 # Use the demo environment for testing
 OANDA_BASE_URL = "https://api-fxpractice.oanda.com/v3"
 
-async def place_order_oanda(api_key, account_id, signal):
+# Streaming API host for the same environment
+OANDA_STREAM_URL = os.getenv("OANDA_STREAM_URL", "https://stream-fxpractice.oanda.com/v3")
+
+# The transaction stream sends a heartbeat every 5 seconds
+STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_read=30)
+
+# Order state -> fill stream state
+ORDER_STATES = {
+    "FILLED": FILLED,
+    "CANCELLED": REJECTED,
+}
+
+# Transaction type -> fill stream state
+TRANSACTION_STATES = {
+    "ORDER_FILL": FILLED,
+    "ORDER_CANCEL": REJECTED,
+    "MARKET_ORDER_REJECT": REJECTED,
+}
+
+async def place_order_oanda(api_key, account_id, signal, position_fill="DEFAULT"):
     """Place an order on OANDA with API key and account ID."""
     url = f"{OANDA_BASE_URL}/accounts/{account_id}/orders"
     headers = {
@@ -14,17 +43,89 @@ async def place_order_oanda(api_key, account_id, signal):
     payload = {
         "order": {
             "instrument": signal.symbol,
-            "units": str(signal.quantity) if signal.action.lower() == 'buy' else str(-signal.quantity),
+            "units": format_quantity(signal.quantity) if signal.action.lower() == 'buy' else format_quantity(-signal.quantity),
             "type": "MARKET",
+            "positionFill": position_fill,
         }
     }
+    if signal.client_order_id:
+        payload["order"]["clientExtensions"] = {"id": signal.client_order_id}
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                return await response.json()
+        session = get_session(OANDA_BASE_URL)
+        async with session.post(url, json=payload, headers=headers) as response:
+            # A 201 carrying a cancel transaction is a rejected market order
+            return await read_response(
+                response,
+                rejected=lambda body: "orderCancelTransaction" in body)
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return exception_result(e)
+
+
+async def find_order_oanda(api_key, account_id, signal):
+    """Look an OANDA order up by its client extensions ID."""
+    url = f"{OANDA_BASE_URL}/accounts/{account_id}/orders/@{signal.client_order_id}"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    try:
+        session = get_session(OANDA_BASE_URL)
+        async with session.get(url, headers=headers) as response:
+            return await read_lookup(
+                response, lambda body: body.get("order"),
+                lambda status, body: status == 404,
+                lambda order: ORDER_STATES.get(order.get("state")))
+    except Exception:
+        return None
+
+
+async def load_instruments_oanda(api_key, account_id):
+    """Load the trade size rules of the instruments tradeable on an account."""
+    url = f"{OANDA_BASE_URL}/accounts/{account_id}/instruments"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    session = get_session(OANDA_BASE_URL)
+    async with session.get(url, headers=headers) as response:
+        body = await response.json()
+
+    instruments = {}
+    for instrument in body["instruments"]:
+        max_units = instrument.get("maximumOrderUnits")
+        instruments[instrument["name"]] = Instrument(
+            symbol=instrument["name"],
+            step_size=Decimal(1).scaleb(-int(instrument.get("tradeUnitsPrecision", 0))),
+            min_qty=Decimal(instrument.get("minimumTradeSize", 0)),
+            max_qty=Decimal(max_units) if max_units else None)
+    return instruments
+
+
+async def stream_fills_oanda(api_key, account_id, report, connected):
+    """Follow an account's fills and cancels on its transaction stream."""
+    url = f"{OANDA_STREAM_URL}/accounts/{account_id}/transactions/stream"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+    }
+
+    session = get_session(OANDA_STREAM_URL)
+    async with session.get(url, headers=headers,
+                           timeout=STREAM_TIMEOUT) as response:
+        if response.status != 200:
+            raise Exception(f"OANDA transaction stream: HTTP {response.status}")
+        connected()
+        async for line in response.content:
+            if not line.strip():
+                continue
+            transaction = json.loads(line)
+            state = TRANSACTION_STATES.get(transaction.get("type"))
+            if state is None:
+                continue
+            # Rejects carry the order's extensions; fills and cancels its ID
+            client_id = transaction.get("clientOrderID") or \
+                (transaction.get("clientExtensions") or {}).get("id")
+            report(client_id, state)
 
 
 async def get_account_details(api_key):
@@ -36,9 +137,9 @@ async def get_account_details(api_key):
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        session = get_session(OANDA_BASE_URL)
+        async with session.get(url, headers=headers) as response:
+            return await response.json()
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -53,3 +154,42 @@ class TradeSignal:
 
 # Now your backend can fetch account details and place trades in the demo environment! 🚀
 # Let me know if you want me to wire this up with your main bot logic or add error handling. 💡
+
+
+@register("oanda")
+class OandaAdapter(ExchangeAdapter):
+    display_name = "OANDA"
+    base_url = OANDA_BASE_URL
+    credentials = ("api_key", "account_id")
+    symbol_separator = "_"
+    supports_reversal = True
+
+    async def place_order(self, signal):
+        return await place_order_oanda(self.bot.api_key, self.bot.account_id,
+                                       self.venue_signal(signal))
+
+    def stream_key(self):
+        return ("oanda", self.bot.api_key, self.bot.account_id)
+
+    async def stream_fills(self, report, connected):
+        await stream_fills_oanda(self.bot.api_key, self.bot.account_id,
+                                 report, connected)
+
+    def instrument_key(self):
+        # Tradeable instruments and their limits are set per account
+        return ("oanda", self.bot.account_id)
+
+    async def load_instruments(self):
+        return await load_instruments_oanda(self.bot.api_key,
+                                            self.bot.account_id)
+
+    async def find_order(self, signal):
+        return await find_order_oanda(self.bot.api_key, self.bot.account_id,
+                                      self.venue_signal(signal))
+
+    async def reverse_position(self, signal):
+        # OANDA nets units: reduce the open trades first, then open the rest
+        signal = self.venue_signal(signal)
+        signal.quantity *= 2
+        return await place_order_oanda(self.bot.api_key, self.bot.account_id,
+                                       signal, position_fill="REDUCE_FIRST")
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+# Longest a request may be queued for budget before it is shed (seconds)
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 2))
+
+
+class TokenBucket:
+    """Client-side request budget for one (exchange, api_key).
+
+    Requests take tokens (their weight) from the bucket, which refills at a
+    steady rate up to its capacity. Whenever the venue reports the budget
+    it actually has left (response headers, rate-limit errors) the bucket is
+    pulled down to match, so bursts are queued, or shed, before the venue
+    starts rejecting or banning the key.
+    """
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.shed = 0
+        # Requests wait for budget one at a time, in arrival order
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.refill_rate)
+        self.updated = now
+
+    def wait_time(self, cost: float = 1) -> float:
+        """Seconds until a request of this weight may be sent."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < cost:
+            wait = max(wait, (cost - self.tokens) / self.refill_rate)
+        return wait
+
+    async def acquire(self, cost: float = 1,
+                      max_wait: float = RATE_LIMIT_MAX_WAIT) -> bool:
+        """Take budget for a request, waiting for it if needed.
+
+        Returns:
+            bool: False if the request was shed because the budget would
+            not be available within max_wait
+        """
+        async with self.lock:
+            wait = self.wait_time(cost)
+            if wait > max_wait:
+                self.shed += 1
+                return False
+            if wait:
+                await asyncio.sleep(wait)
+                self._refill(time.monotonic())
+            self.tokens -= cost
+            return True
+
+    def observe(self, remaining: Optional[float] = None,
+                retry_after: Optional[float] = None):
+        """Align the bucket with the budget reported by the venue."""
+        now = time.monotonic()
+        self._refill(now)
+        if remaining is not None:
+            self.tokens = min(self.tokens, max(0.0, remaining))
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def state(self) -> dict:
+        return {
+            "available": round(max(0.0, self.tokens), 2),
+            "capacity": self.capacity,
+            "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            "shed": self.shed,
+        }
+
+
+# (exchange, api_key) -> bucket
+limiters: Dict[Tuple[str, str], TokenBucket] = {}
+
+
+def get_limiter(exchange: str, api_key: str, capacity: float,
+                refill_rate: float) -> TokenBucket:
+    """Return the bucket of an exchange key, creating it on first use."""
+    key = (exchange, api_key or "")
+    if key not in limiters:
+        limiters[key] = TokenBucket(capacity, refill_rate)
+    return limiters[key]
+
+
+def retry_after_seconds(value) -> Optional[float]:
+    """Parse a Retry-After header given in seconds."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
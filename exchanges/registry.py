@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import re
+from dataclasses import replace
+from typing import Dict, Optional, Tuple, Type
+
+import aiohttp
+
+from backend.types import Bot, TradeSignal
+from exchanges.streams import REJECTED
+
+# Quote currencies recognised when a symbol is written without a separator
+QUOTE_CURRENCIES = ["USDT", "USDC", "BUSD", "USD", "EUR", "GBP", "JPY", "BTC",
+                    "ETH"]
+
+
+def split_symbol(symbol: str) -> Optional[Tuple[str, str]]:
+    """Split a symbol such as "BTC/USDT", "GBP_USD" or "BTCUSDT" into its
+    base and quote currencies, or return None if it cannot be split."""
+    parts = [part for part in re.split(r'\W+|_', symbol.upper()) if part]
+    if len(parts) == 2:
+        return parts[0], parts[1]
+
+    compact = "".join(parts)
+    for quote in QUOTE_CURRENCIES:
+        if compact.endswith(quote) and len(compact) > len(quote):
+            return compact[:-len(quote)], quote
+    return None
+
+
+def client_order_id(*parts: str) -> str:
+    """Derive a deterministic client order ID from the parts of a signal.
+
+    The same alert, bot and action always yield the same ID, which fits the
+    length and character rules of every supported venue (<= 32 chars).
+    """
+    digest = hashlib.sha256("|".join(parts).encode()).hexdigest()
+    return f"tb{digest[:30]}"
+
+
+def error_result(message: str, transient: bool = False, sent: bool = True,
+                 body=None) -> dict:
+    """Order result for a failure.
+
+    Args:
+        transient: the failure may succeed on retry (network, 5xx, limits)
+        sent: the order may exist at the venue, so it must be looked up
+            before it is sent again
+        body: the venue's response, if there was one
+    """
+    return {
+        "status": "error",
+        "message": message,
+        "transient": transient,
+        "sent": sent,
+        "body": body
+    }
+
+
+def exception_result(error: Exception) -> dict:
+    """Order result for an exception raised while talking to a venue."""
+    if isinstance(error, aiohttp.ClientConnectorError):
+        # Never connected, so the order cannot have been received
+        return error_result(str(error), transient=True, sent=False)
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)):
+        return error_result(str(error) or "Request timed out", transient=True)
+    return error_result(str(error))
+
+
+async def read_response(response, rejected=None, clock=None,
+                        timestamp_rejected=None):
+    """Read a venue response as an order result.
+
+    Args:
+        rejected: callable telling from the JSON body whether the venue
+            refused the request despite a 2xx status
+        clock: the venue's ServerClock (see exchanges.signing)
+        timestamp_rejected: callable telling from the JSON body of a
+            refused request that its timestamp was out of the venue's
+            window. The clock is then resynced and, since the venue refused
+            the order before matching it, the result is safe to resend.
+
+    Returns:
+        dict: the venue's JSON body, or an error result
+    """
+    try:
+        body = await response.json(content_type=None)
+    except ValueError:
+        body = {"raw": await response.text()}
+
+    if response.status == 429 or response.status >= 500:
+        return error_result(f"HTTP {response.status}: {body}", transient=True,
+                            body=body)
+    if response.status >= 400 or (rejected and rejected(body)):
+        if timestamp_rejected and isinstance(body, dict) and \
+                timestamp_rejected(body):
+            clock.invalidate()
+            return error_result(f"Request timestamp rejected: {body}",
+                                transient=True, sent=False, body=body)
+        return error_result(f"Request rejected: {body}", body=body)
+    return body
+
+
+async def read_lookup(response, extract, missing, state=None):
+    """Read an order lookup response for ExchangeAdapter.find_order.
+
+    Args:
+        extract: callable returning the order from the JSON body, if any
+        missing: callable telling from (status, body) that the venue has
+            no order with the requested ID
+        state: callable mapping the order to FILLED or REJECTED (see
+            exchanges.streams), or None while it is still open
+
+    Returns:
+        dict: the order, an error result if the venue ended it without a
+        fill, {} if it does not exist, or None if unknown
+    """
+    try:
+        body = await response.json(content_type=None)
+    except ValueError:
+        return None
+
+    if response.status == 429 or response.status >= 500:
+        return None
+    if missing(response.status, body):
+        return {}
+    if response.status >= 400:
+        return None
+
+    order = extract(body)
+    if order and state is not None and state(order) == REJECTED:
+        return error_result(f"Order was not filled: {order}", body=order)
+    return order or None
+
+
+class ExchangeAdapter:
+    """Common async interface to a venue, bound to one bot's credentials.
+
+    Subclasses register themselves with @register and set:
+        display_name: venue name used in logs
+        base_url: API root (its host gets a shared HTTP session)
+        credentials: Bot attributes that must be set to trade
+        symbol_separator: separator between base and quote in venue symbols
+        supports_reversal: whether reverse_position can flip a position in
+            one order (venues that net positions)
+
+    Every order carries signal.client_order_id, which find_order uses to
+    tell whether an order whose outcome is unknown reached the venue.
+    """
+    display_name = ""
+    base_url = ""
+    credentials: Tuple[str, ...] = ("api_key", "api_secret")
+    symbol_separator = ""
+    supports_reversal = False
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.symbol = self.map_symbol(bot.symbol)
+
+    def missing_credentials(self) -> Tuple[str, ...]:
+        """Return the names of the required credentials that are not set."""
+        return tuple(name for name in self.credentials
+                     if not getattr(self.bot, name))
+
+    def map_symbol(self, symbol: str) -> str:
+        """Translate a symbol as entered by the user into the venue's form."""
+        pair = split_symbol(symbol)
+        if pair is None:
+            return re.sub(r'\W+', '', symbol.upper())
+        return self.symbol_separator.join(pair)
+
+    def venue_signal(self, signal: TradeSignal) -> TradeSignal:
+        """Return the signal with its symbol in the venue's form."""
+        symbol = self.symbol if signal.symbol == self.bot.symbol else \
+            self.map_symbol(signal.symbol)
+        return replace(signal, symbol=symbol)
+
+    async def load_instruments(self) -> Optional[dict]:
+        """Load the venue's instrument metadata for exchanges.instruments.
+
+        Returns:
+            dict: {venue symbol: Instrument}, or None if the venue's order
+            size rules are not known client-side
+        """
+        return None
+
+    def instrument_key(self) -> tuple:
+        """Identify whose instrument metadata load_instruments() returns.
+
+        Bots that share a key share one cache (see exchanges.instruments).
+        Most venues publish the same rules to everyone, so the default is
+        the exchange alone.
+        """
+        return (self.bot.exchange.lower(),)
+
+    def stream_key(self) -> Optional[tuple]:
+        """Identify the account whose fill stream this bot's orders use.
+
+        Bots that share a key share one connection (see exchanges.streams);
+        None means the venue has no fill stream.
+        """
+        return None
+
+    async def stream_fills(self, report, connected):
+        """Hold the account's order stream open (see exchanges.streams)."""
+        raise NotImplementedError
+
+    def rate_limit(self) -> Optional[dict]:
+        """State of the client-side rate limiter for this bot's key, if any."""
+        return None
+
+    async def place_order(self, signal: TradeSignal) -> dict:
+        raise NotImplementedError
+
+    async def find_order(self, signal: TradeSignal) -> Optional[dict]:
+        """Look an order up by its client order ID.
+
+        Returns:
+            dict: the venue's order if it exists, an error result if the
+            venue canceled or rejected it without a fill, {} if the venue
+            confirmed it does not exist, or None if that could not be
+            determined
+        """
+        return None
+
+    async def reverse_position(self, signal: TradeSignal) -> dict:
+        """Close the opposite position and open signal's in one order.
+
+        The default sends twice the signal's quantity, which nets out the
+        open position first; only used when supports_reversal is set.
+        """
+        return await self.place_order(
+            replace(signal, quantity=signal.quantity * 2))
+
+
+# exchange name (as stored on bots) -> adapter class
+adapters: Dict[str, Type[ExchangeAdapter]] = {}
+
+# bot name -> adapter, resolved once per Bot instance
+_bot_adapters: Dict[str, ExchangeAdapter] = {}
+
+
+def register(name: str):
+    """Class decorator that makes an adapter available under an exchange name."""
+
+    def decorator(cls: Type[ExchangeAdapter]):
+        adapters[name] = cls
+        return cls
+
+    return decorator
+
+
+def get_adapter(bot: Bot) -> Optional[ExchangeAdapter]:
+    """Return the cached adapter for a bot, or None if its exchange is unsupported."""
+    adapter = _bot_adapters.get(bot.name)
+    if adapter is not None and adapter.bot is bot:
+        return adapter
+
+    cls = adapters.get(bot.exchange.lower())
+    if cls is None:
+        return None
+
+    adapter = cls(bot)
+    _bot_adapters[bot.name] = adapter
+    return adapter
+
+
+def base_urls():
+    """Return the API roots of every registered venue."""
+    return [cls.base_url for cls in adapters.values()]
@@ -0,0 +1,56 @@
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# Connection pool per exchange host
+HTTP_POOL_SIZE = int(os.getenv("EXCHANGE_HTTP_POOL_SIZE", 20))
+
+# How long resolved exchange hostnames are cached (seconds)
+HTTP_DNS_TTL = int(os.getenv("EXCHANGE_HTTP_DNS_TTL", 300))
+
+# How long idle keep-alive connections are kept open (seconds)
+HTTP_KEEPALIVE = float(os.getenv("EXCHANGE_HTTP_KEEPALIVE", 60))
+
+HTTP_TIMEOUT = aiohttp.ClientTimeout(
+    total=float(os.getenv("EXCHANGE_HTTP_TIMEOUT", 15)),
+    connect=float(os.getenv("EXCHANGE_HTTP_CONNECT_TIMEOUT", 5)))
+
+# One long-lived session (and connector) per exchange host
+sessions: Dict[str, aiohttp.ClientSession] = {}
+
+
+def get_session(base_url: str) -> aiohttp.ClientSession:
+    """Return the shared HTTP session for an exchange's base URL.
+
+    Sessions are created on first use and reused for every later request,
+    so orders skip DNS, TCP and TLS setup on warm connections.
+    """
+    parts = urlsplit(base_url)
+    host = f"{parts.scheme}://{parts.netloc}"
+
+    session = sessions.get(host)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE,
+                                         limit_per_host=HTTP_POOL_SIZE,
+                                         ttl_dns_cache=HTTP_DNS_TTL,
+                                         keepalive_timeout=HTTP_KEEPALIVE)
+        session = aiohttp.ClientSession(connector=connector,
+                                        timeout=HTTP_TIMEOUT)
+        sessions[host] = session
+    return session
+
+
+async def open_sessions(*base_urls: str):
+    """Create the sessions for the given exchanges ahead of the first order."""
+    for base_url in base_urls:
+        get_session(base_url)
+
+
+async def close_sessions():
+    """Close every shared session; called on application shutdown."""
+    for session in list(sessions.values()):
+        if not session.closed:
+            await session.close()
+    sessions.clear()
@@ -0,0 +1,107 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+from exchanges.session import get_session
+
+# How often each venue's server-time offset is refreshed (seconds)
+CLOCK_SYNC_INTERVAL = float(os.getenv("EXCHANGE_CLOCK_SYNC_INTERVAL", 300))
+
+# How long signed requests stay valid at the venue (milliseconds)
+RECV_WINDOW = int(os.getenv("EXCHANGE_RECV_WINDOW", 5000))
+
+# Prepared HMAC keys kept in memory
+SIGNER_CACHE_SIZE = int(os.getenv("EXCHANGE_SIGNER_CACHE_SIZE", 256))
+
+
+@lru_cache(maxsize=SIGNER_CACHE_SIZE)
+def _prepared_hmac(secret: str):
+    # HMAC with the key already absorbed; copies skip the key schedule
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+
+def sign(secret: str, message: str) -> bytes:
+    """HMAC-SHA256 of message, reusing the prepared key state of secret."""
+    mac = _prepared_hmac(secret).copy()
+    mac.update(message.encode())
+    return mac.digest()
+
+
+def sign_hex(secret: str, message: str) -> str:
+    return sign(secret, message).hex()
+
+
+def sign_b64(secret: str, message: str) -> str:
+    return base64.b64encode(sign(secret, message)).decode()
+
+
+def encode_body(payload: dict) -> str:
+    """Serialize a JSON body once; the same string is signed and sent."""
+    return json.dumps(payload, separators=(",", ":"))
+
+
+class ServerClock:
+    """Offset between the local clock and one venue's server time.
+
+    Signed requests are stamped with timestamp_ms() without a time round
+    trip. The offset is refreshed in the background once it is older than
+    CLOCK_SYNC_INTERVAL, or right away after the venue rejected a
+    timestamp (invalidate).
+    """
+
+    def __init__(self, base_url: str, path: str,
+                 extract: Callable[[dict], float]):
+        self.base_url = base_url
+        self.path = path
+        # Server time in milliseconds from the time endpoint's JSON body
+        self.extract = extract
+        self.offset_ms = 0.0
+        self.synced_at = 0.0
+        self.sync_task: Optional[asyncio.Task] = None
+        clocks.append(self)
+
+    async def sync(self) -> bool:
+        """Measure the offset, assuming the server stamped mid-request."""
+        try:
+            session = get_session(self.base_url)
+            sent = time.time() * 1000
+            async with session.get(f"{self.base_url}{self.path}") as response:
+                body = await response.json(content_type=None)
+            received = time.time() * 1000
+            server_time = float(self.extract(body))
+        except Exception:
+            return False
+
+        self.offset_ms = server_time - (sent + received) / 2
+        self.synced_at = time.monotonic()
+        return True
+
+    def invalidate(self):
+        """Force a refresh, e.g. after a timestamp was rejected."""
+        self.synced_at = 0.0
+        self._schedule_sync()
+
+    def _schedule_sync(self):
+        if self.sync_task is None or self.sync_task.done():
+            self.sync_task = asyncio.get_running_loop().create_task(self.sync())
+
+    def timestamp_ms(self) -> int:
+        """Current server time in milliseconds, from the cached offset."""
+        if time.monotonic() - self.synced_at > CLOCK_SYNC_INTERVAL:
+            self._schedule_sync()
+        return int(time.time() * 1000 + self.offset_ms)
+
+
+# Every venue clock, synced together at startup
+clocks: List[ServerClock] = []
+
+
+async def sync_clocks():
+    """Measure every venue's offset ahead of the first signed order."""
+    await asyncio.gather(*(clock.sync() for clock in clocks))
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+
+# Confirm positions from the venues' order/fill streams
+FILL_STREAMS = os.getenv("FILL_STREAMS", "false").lower() in ("1", "true", "yes")
+
+# Longest delay between reconnect attempts of a dropped stream (seconds)
+FILL_STREAM_RECONNECT_MAX = float(os.getenv("FILL_STREAM_RECONNECT_MAX", 60))
+
+# How long an order is tracked waiting for its fill or rejection (seconds)
+PENDING_ORDER_TTL = float(os.getenv("PENDING_ORDER_TTL", 600))
+
+# Order states reported by the venue streams
+FILLED = "filled"
+REJECTED = "rejected"
+
+
+@dataclass
+class PendingOrder:
+    """Position change an order will make once the venue confirms it."""
+    bot: object
+    position_before: str
+    position_after: str
+    log: Callable[[str, str], None]
+    created: float = field(default_factory=time.monotonic)
+    state: Optional[str] = None
+
+
+class AccountStream:
+    """One streaming connection per exchange account, shared by its bots.
+
+    adapter.stream_fills(report, connected) holds the connection open,
+    calls connected() once it receives order updates and report(client
+    order ID, state) for every update. It returns or raises when the
+    connection drops, and is restarted with exponential backoff.
+    """
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.connected = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        delay = 1.0
+        while True:
+            try:
+                await self.adapter.stream_fills(report_fill,
+                                                self.connected.set)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"⚠️ {self.adapter.display_name} fill stream error: {str(e)}")
+
+            if self.connected.is_set():
+                delay = 1.0
+            self.connected.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, FILL_STREAM_RECONNECT_MAX)
+
+
+# stream key of an account -> its stream
+streams: Dict[Tuple, AccountStream] = {}
+
+# client order ID -> order awaiting confirmation
+pending_orders: Dict[str, PendingOrder] = {}
+
+
+def start_stream(adapter):
+    """Start the stream of an adapter's account in the background, if needed.
+
+    Called when a bot is loaded or created so the connection is up before
+    its first order; orders never wait for it (see watching).
+    """
+    if not FILL_STREAMS or adapter is None:
+        return
+    key = adapter.stream_key()
+    if key is None:
+        return
+
+    if key not in streams:
+        streams[key] = AccountStream(adapter)
+    streams[key].start()
+
+
+def watching(adapter) -> bool:
+    """Whether the adapter's account stream is connected right now."""
+    key = adapter.stream_key() if FILL_STREAMS else None
+    stream = streams.get(key) if key is not None else None
+    return stream is not None and stream.connected.is_set()
+
+
+def track_order(adapter, client_order_id: Optional[str], bot,
+                position_after: str, log: Callable[[str, str], None]):
+    """Remember the position an order should leave its bot in, if streamed."""
+    if not client_order_id or not watching(adapter):
+        return
+
+    now = time.monotonic()
+    for order_id, order in list(pending_orders.items()):
+        if now - order.created > PENDING_ORDER_TTL:
+            del pending_orders[order_id]
+
+    pending_orders[client_order_id] = PendingOrder(bot=bot,
+                                                   position_before=bot.position,
+                                                   position_after=position_after,
+                                                   log=log)
+
+
+def order_state(client_order_id: Optional[str]) -> Optional[str]:
+    """Return FILLED or REJECTED once the stream has reported the order."""
+    order = pending_orders.get(client_order_id)
+    return order.state if order else None
+
+
+def report_fill(client_order_id: Optional[str], state: Optional[str]):
+    """Apply an order update from a stream to the bot that sent the order."""
+    order = pending_orders.get(client_order_id)
+    # A partial fill that is then canceled still leaves a position
+    if order is None or state is None or order.state in (state, FILLED):
+        return
+
+    order.state = state
+    bot = order.bot
+    if state == FILLED:
+        bot.position = order.position_after
+        order.log(bot.name, f"📬 Fill confirmed by the exchange: position is now '{bot.position}'.")
+    elif state == REJECTED and bot.position == order.position_after:
+        bot.position = order.position_before
+        order.log(bot.name, f"↩️ Order {client_order_id} was not filled; position restored to '{bot.position}'.")
+
+
+async def close_streams():
+    """Stop every account stream; called on application shutdown."""
+    for stream in streams.values():
+        if stream.task is not None:
+            stream.task.cancel()
+    streams.clear()
@@ -0,0 +1,137 @@
+"""Binance user data stream, against a local stub of the REST and WS APIs."""
+import asyncio
+import time
+
+from aiohttp import web
+
+from backend.types import Bot
+from exchanges import binance, streams
+from exchanges.registry import get_adapter
+from exchanges.session import close_sessions
+
+
+class StubBinance:
+    """Hands out listenKeys and pushes the executionReports a test sends."""
+
+    def __init__(self):
+        self.listen_keys = []
+        self.keepalives = []
+        self.sockets = []
+
+        self.app = web.Application()
+        self.app.router.add_post("/api/v3/userDataStream", self.create_key)
+        self.app.router.add_put("/api/v3/userDataStream", self.keep_alive)
+        self.app.router.add_get("/ws/{listen_key}", self.websocket)
+
+    async def create_key(self, request):
+        assert request.headers["X-MBX-APIKEY"] == "key"
+        listen_key = f"listen-{len(self.listen_keys) + 1}"
+        self.listen_keys.append(listen_key)
+        return web.json_response({"listenKey": listen_key})
+
+    async def keep_alive(self, request):
+        self.keepalives.append(request.query["listenKey"])
+        return web.json_response({})
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.append(ws)
+        async for _ in ws:
+            pass
+        return ws
+
+    async def report(self, client_order_id, status):
+        await self.sockets[-1].send_json({"e": "executionReport",
+                                          "c": client_order_id, "X": status})
+
+
+async def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def run_with_stub(monkeypatch, test):
+    """Point the Binance adapter at the stub and run test(stub, bot, adapter)."""
+    stub = StubBinance()
+
+    async def main():
+        runner = web.AppRunner(stub.app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        monkeypatch.setattr(streams, "FILL_STREAMS", True)
+        monkeypatch.setattr(binance, "BASE_URL", f"http://127.0.0.1:{port}")
+        monkeypatch.setattr(binance, "STREAM_URL", f"ws://127.0.0.1:{port}/ws")
+        try:
+            bot = Bot(name="binance-bot", exchange="binance", symbol="BTC/USDT",
+                      quantity=0.001, api_key="key", api_secret="secret")
+            await test(stub, bot, get_adapter(bot))
+        finally:
+            await streams.close_streams()
+            streams.pending_orders.clear()
+            await close_sessions()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def test_fills_confirm_and_rejects_revert_positions(monkeypatch):
+    logs = []
+
+    async def test(stub, bot, adapter):
+        # Starting the stream returns at once; orders never wait for it
+        streams.start_stream(adapter)
+        assert not streams.watching(adapter)
+        await wait_for(lambda: streams.watching(adapter))
+
+        # An order the venue rejects after accepting it
+        streams.track_order(adapter, "order-1", bot, "buy",
+                            lambda name, message: logs.append(message))
+        bot.position = "buy"
+        await stub.report("order-1", "REJECTED")
+        await wait_for(lambda: bot.position == "neutral")
+
+        # An order that fills
+        streams.track_order(adapter, "order-2", bot, "sell",
+                            lambda name, message: logs.append(message))
+        await stub.report("order-2", "FILLED")
+        await wait_for(lambda: bot.position == "sell")
+        assert streams.order_state("order-2") == streams.FILLED
+
+        # Updates for orders this process didn't send are ignored
+        await stub.report("someone-else", "FILLED")
+        await asyncio.sleep(0.05)
+        assert bot.position == "sell"
+
+    run_with_stub(monkeypatch, test)
+    assert len(logs) == 2
+
+
+def test_keeps_the_listen_key_alive(monkeypatch):
+    monkeypatch.setattr(binance, "LISTEN_KEY_KEEPALIVE", 0.05)
+
+    async def test(stub, bot, adapter):
+        streams.start_stream(adapter)
+        await wait_for(lambda: len(stub.keepalives) >= 2)
+        assert set(stub.keepalives) == {"listen-1"}
+
+    run_with_stub(monkeypatch, test)
+
+
+def test_reconnects_with_a_new_listen_key(monkeypatch):
+
+    async def test(stub, bot, adapter):
+        streams.start_stream(adapter)
+        await wait_for(lambda: streams.watching(adapter))
+
+        await stub.sockets[-1].close()
+        await wait_for(lambda: len(stub.sockets) == 2)
+        await wait_for(lambda: streams.watching(adapter))
+        assert stub.listen_keys == ["listen-1", "listen-2"]
+
+    run_with_stub(monkeypatch, test)
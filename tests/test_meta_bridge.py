@@ -0,0 +1,187 @@
+"""MetaTrader5 bridge sessions, against a local stub bridge server."""
+import asyncio
+import itertools
+
+from aiohttp import web
+
+from backend.types import Bot, TradeSignal
+from exchanges import meta
+from exchanges.session import close_sessions
+
+
+class StubBridge:
+    """Serves the bridge endpoints the client relies on and counts logins."""
+
+    def __init__(self, expires_in=3600, login_delay=0.0, reject_tokens=False):
+        self.expires_in = expires_in
+        self.login_delay = login_delay
+        # Refuse every token, even fresh ones
+        self.reject_tokens = reject_tokens
+        self.logins = 0
+        self.tokens = set()
+        self.trades = {}
+        self.unauthorized = 0
+        self.counter = itertools.count(1)
+
+        self.app = web.Application()
+        self.app.router.add_post("/api/session", self.login)
+        self.app.router.add_delete("/api/session", self.logout)
+        self.app.router.add_post("/api/trade", self.trade)
+        self.app.router.add_get("/api/trade/{client_order_id}", self.lookup)
+
+    def authorized(self, request) -> bool:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if token in self.tokens and not self.reject_tokens:
+            return True
+        self.unauthorized += 1
+        return False
+
+    def revoke_all(self):
+        self.tokens.clear()
+
+    async def login(self, request):
+        body = await request.json()
+        await asyncio.sleep(self.login_delay)
+        if body.get("password") != "secret":
+            return web.json_response({"error": "invalid credentials"}, status=403)
+        self.logins += 1
+        token = f"token-{next(self.counter)}"
+        self.tokens.add(token)
+        return web.json_response({"token": token, "expires_in": self.expires_in})
+
+    async def logout(self, request):
+        if not self.authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        self.tokens.discard(request.headers["Authorization"].removeprefix("Bearer "))
+        return web.json_response({})
+
+    async def trade(self, request):
+        if not self.authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        body = await request.json()
+        self.trades[body["client_order_id"]] = body
+        return web.json_response({"retcode": 10009, "order": len(self.trades)})
+
+    async def lookup(self, request):
+        if not self.authorized(request):
+            return web.json_response({"error": "unauthorized"}, status=401)
+        trade = self.trades.get(request.match_info["client_order_id"])
+        if trade is None:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response(trade)
+
+
+def run_with_bridge(bridge, test):
+    """Serve the stub bridge on a free local port and run test(adapter)."""
+
+    async def main():
+        runner = web.AppRunner(bridge.app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        base_url = meta.METATRADER5_BASE_URL
+        meta.METATRADER5_BASE_URL = f"http://127.0.0.1:{port}/api"
+        meta.bridge_sessions.clear()
+        try:
+            bot = Bot(name="mt5-bot", exchange="metatrader5", symbol="EURUSD",
+                      quantity=0.1, login="1001", password="secret",
+                      server="Broker-Demo")
+            return await test(meta.MetaTrader5Adapter(bot))
+        finally:
+            await meta.close_bridge_sessions()
+            await close_sessions()
+            meta.METATRADER5_BASE_URL = base_url
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def signal(n):
+    return TradeSignal(action="buy", symbol="EURUSD", quantity=0.1,
+                       client_order_id=f"order-{n}")
+
+
+def test_logs_in_once_and_reuses_the_token():
+    bridge = StubBridge()
+
+    async def test(adapter):
+        first = await adapter.place_order(signal(1))
+        second = await adapter.place_order(signal(2))
+        found = await adapter.find_order(signal(1))
+        missing = await adapter.find_order(signal(3))
+        return first, second, found, missing
+
+    first, second, found, missing = run_with_bridge(bridge, test)
+
+    assert first["retcode"] == 10009 and second["retcode"] == 10009
+    assert found["client_order_id"] == "order-1"
+    assert missing == {}
+    assert bridge.logins == 1
+    assert bridge.unauthorized == 0
+
+
+def test_renews_the_token_before_it_expires(monkeypatch):
+    monkeypatch.setattr(meta, "METATRADER5_SESSION_RENEW_MARGIN", 0.1)
+    bridge = StubBridge(expires_in=0.3)
+
+    async def test(adapter):
+        await adapter.place_order(signal(1))
+        await adapter.place_order(signal(2))
+        # Inside the renew margin of the first token
+        await asyncio.sleep(0.25)
+        return await adapter.place_order(signal(3))
+
+    result = run_with_bridge(bridge, test)
+
+    assert result["retcode"] == 10009
+    assert bridge.logins == 2
+    assert bridge.unauthorized == 0
+
+
+def test_logs_in_again_once_after_a_401():
+    bridge = StubBridge()
+
+    async def test(adapter):
+        await adapter.place_order(signal(1))
+        # The bridge restarted and forgot its sessions
+        bridge.revoke_all()
+        return await adapter.place_order(signal(2))
+
+    result = run_with_bridge(bridge, test)
+
+    assert result["retcode"] == 10009
+    assert bridge.logins == 2
+    assert bridge.unauthorized == 1
+    assert "order-2" in bridge.trades
+
+
+def test_gives_up_when_the_fresh_token_is_rejected_too():
+    bridge = StubBridge(reject_tokens=True)
+
+    async def test(adapter):
+        result = await adapter.place_order(signal(1))
+        # Counted before shutdown tries to log out
+        return result, bridge.unauthorized
+
+    result, unauthorized = run_with_bridge(bridge, test)
+
+    assert result["status"] == "error"
+    assert bridge.logins == 2
+    assert unauthorized == 2
+    assert not bridge.trades
+
+
+def test_concurrent_orders_share_one_login():
+    bridge = StubBridge(login_delay=0.05)
+
+    async def test(adapter):
+        return await asyncio.gather(*(adapter.place_order(signal(n))
+                                      for n in range(5)))
+
+    results = run_with_bridge(bridge, test)
+
+    assert all(result["retcode"] == 10009 for result in results)
+    assert len(bridge.trades) == 5
+    assert bridge.logins == 1
@@ -0,0 +1,101 @@
+"""Plan quota cache, loaded through a stub of the connection pool."""
+import asyncio
+import re
+
+import pytest
+
+from backend import quota
+
+
+class StubPool:
+    """Answers the quota query from in-memory users and bots.
+
+    Like Postgres, it refuses a query that selects users columns next to
+    an aggregate unless it groups by the primary key or by every one of
+    those columns.
+    """
+
+    def __init__(self, users, bots):
+        self.users = users
+        self.bots = bots
+        self.queries = []
+
+    def check_grouping(self, sql):
+        select = sql.split("FROM", 1)[0]
+        selected = set(re.findall(r"users\.(\w+)", select))
+        grouped = re.search(r"GROUP BY (.*)$", sql.strip())
+        grouped = set(re.findall(r"users\.(\w+)", grouped.group(1))) if grouped else set()
+        if "id" not in grouped and not selected <= grouped:
+            missing = sorted(selected - grouped)[0]
+            raise Exception(f'column "users.{missing}" must appear in the GROUP BY clause')
+
+    def rows(self, sql, email=None):
+        self.queries.append(sql)
+        self.check_grouping(sql)
+        return [{"email": user["email"],
+                 "subscription_plan": user["subscription_plan"],
+                 "trade_count": user["trade_count"],
+                 "bot_count": sum(bot["user_email"] == user["email"]
+                                  for bot in self.bots)}
+                for user in self.users if email is None or user["email"] == email]
+
+    async def fetch(self, sql, *args):
+        return self.rows(sql)
+
+    async def fetchrow(self, sql, email):
+        rows = self.rows(sql, email)
+        return rows[0] if rows else None
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = StubPool(
+        users=[{"id": 1, "email": "free@example.com", "subscription_plan": None,
+                "trade_count": 2},
+               {"id": 2, "email": "pro@example.com", "subscription_plan": "Pro",
+                "trade_count": 40}],
+        bots=[{"user_email": "free@example.com"},
+              {"user_email": "pro@example.com"},
+              {"user_email": "pro@example.com"}])
+    monkeypatch.setattr(quota, "get_pool", lambda: pool)
+    monkeypatch.setattr(quota, "quotas", {})
+    return pool
+
+
+def test_warm_quotas_loads_every_user(pool):
+    asyncio.run(quota.warm_quotas())
+
+    assert quota.quotas["free@example.com"] == quota.UserQuota("free", 1, 2)
+    assert quota.quotas["pro@example.com"] == quota.UserQuota("pro", 2, 40)
+
+
+def test_load_quota_loads_one_user(pool):
+    loaded = asyncio.run(quota.load_quota("pro@example.com"))
+
+    assert loaded == quota.UserQuota("pro", 2, 40)
+    assert list(quota.quotas) == ["pro@example.com"]
+    assert asyncio.run(quota.load_quota("nobody@example.com")) is None
+
+
+def test_limits_are_enforced_after_warming(pool):
+    asyncio.run(quota.warm_quotas())
+
+    # The free plan allows one bot, which the user already has
+    assert quota.reserve_bot("free@example.com")
+    assert quota.reserve_bot("pro@example.com") is None
+
+    free_trades = quota.PLANS["free"]["trade_limit"]
+    for _ in range(free_trades - 2):
+        assert quota.reserve_trade("free@example.com") is None
+    assert quota.reserve_trade("free@example.com")
+    quota.release_trade("free@example.com")
+    assert quota.reserve_trade("free@example.com") is None
+
+
+def test_change_plan_keeps_usage_counts(pool):
+    asyncio.run(quota.warm_quotas())
+    quota.reserve_trade("free@example.com")
+
+    asyncio.run(quota.change_plan("free@example.com", "Pro"))
+
+    assert quota.quotas["free@example.com"] == quota.UserQuota("pro", 1, 3)